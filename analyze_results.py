@@ -0,0 +1,352 @@
+import argparse
+import concurrent.futures
+import glob
+import json
+import mmap
+import os
+import re
+from collections import Counter
+from typing import List, Dict, Any, Iterable, Optional
+from urllib.parse import urlparse
+
+from latency_stats import LatencyHistogram
+from live_metrics import error_class
+
+DEFAULT_SOURCES = ["benchmark_results.jsonl", "benchmark_output_*.txt"]
+CACHE_FILE = ".benchmark_analysis_cache.json"
+# 缓存格式变化时递增，旧缓存自动失效
+CACHE_VERSION = 1
+
+# 详细结果文件头部的字段：(汇总字段名, 类型)
+HEADER_FIELDS = {
+    "Model": ("model", str),
+    "Total Requests": ("num_requests", int),
+    "Successful Requests": ("successful_requests", int),
+    "Total Latency": ("latency", float),
+    "Average Latency per Request": ("avg_latency_per_request", float),
+    "Requests per Second": ("requests_per_second", float),
+    "Total Tokens": ("total_tokens", int),
+    "Parallel Threads": ("parallel", int),
+    "Engine": ("engine", str),
+}
+
+# 每个请求段中需要的行。以换行符开头，正则引擎可以直接查找换行而不必在每个位置尝试匹配；
+# 一次findall扫描整个文件，再用Counter在C代码中合并相同的行，Python只需处理不同取值
+SECTION_LINE = re.compile(rb"\n(?:(-)-- Request|Tokens: (\d+)|Latency: ([\d.]+)s|Error: (?:HTTP (\d{3}))?)")
+
+# 需要解析的文件多于此数时用多个进程并行解析
+PARALLEL_PARSE_FILES = 8
+
+BAR_WIDTH = 40
+
+
+def new_run(source: str, kind: str) -> Dict[str, Any]:
+    return {"source": source, "kind": kind, "model": None, "endpoint": None, "parallel": None, "engine": None}
+
+
+def parse_output_file(path: str) -> Dict[str, Any]:
+    """解析benchmark_output_*.txt：头部的汇总字段，以及从各请求段重新统计的请求数、错误类别和token分布"""
+    run = new_run(path, "output")
+    tokens = LatencyHistogram()
+    latency = LatencyHistogram()
+    sections = 0
+    errors: Dict[str, int] = {}
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return run
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            body = data.find(b"\n--- Request ")
+            header = data[:body if body >= 0 else len(data)].decode("utf-8", "replace")
+            for line in header.splitlines():
+                name, _, value = line.partition(": ")
+                if name in HEADER_FIELDS:
+                    field, cast = HEADER_FIELDS[name]
+                    try:
+                        run[field] = cast(value.strip().rstrip("s")) if cast is not str else value.strip()
+                    except ValueError:
+                        pass
+            lines = Counter(SECTION_LINE.findall(data, max(body, 0)))
+            for (section, token_count, seconds, status), count in lines.items():
+                if section:
+                    sections += count
+                elif token_count:
+                    tokens.record(int(token_count), count)
+                elif seconds:
+                    latency.record(float(seconds), count)
+                else:
+                    name = error_class({"success": False, "status_code": int(status) if status else None})
+                    errors[name] = errors.get(name, 0) + count
+    run["parsed"] = {"requests": sections, "successes": tokens.count, "errors": errors,
+                     "histograms": {"tokens": tokens.to_dict(), "latency": latency.to_dict()}}
+    return run
+
+
+def parse_summary_file(path: str) -> List[Dict[str, Any]]:
+    """解析benchmark_results.jsonl中的汇总记录（跳过扫描模式的总表）"""
+    runs = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                summary = json.loads(line)
+            except ValueError:
+                continue
+            if summary.get("task") != "azure_ai_benchmark":
+                continue
+            other = summary.get("other") or {}
+            run = new_run(path, "summary")
+            run.update({name: summary.get(name) for name in ("model", "num_requests", "successful_requests", "latency",
+                                                             "avg_latency_per_request", "requests_per_second",
+                                                             "total_tokens", "completion_tokens")})
+            run.update({name: other.get(name) for name in ("endpoint", "parallel", "engine", "rps", "run_id")})
+            runs.append(run)
+    return runs
+
+
+def parse_records_file(path: str) -> Dict[str, Any]:
+    """解析逐请求记录文件（benchmark_records_*.jsonl），统计方式与详细结果文件的请求段相同"""
+    run = new_run(path, "records")
+    tokens = LatencyHistogram()
+    latency = LatencyHistogram()
+    sections = 0
+    errors: Dict[str, int] = {}
+    first = last = None
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            sections += 1
+            first = record["timestamp"] if first is None else first
+            last = record["timestamp"]
+            if record.get("success"):
+                if record.get("usage") is not None:
+                    tokens.record(record["usage"])
+                latency.record(record["latency"])
+            else:
+                name = error_class(record)
+                errors[name] = errors.get(name, 0) + 1
+    run["num_requests"] = sections
+    run["successful_requests"] = sections - sum(errors.values())
+    run["total_tokens"] = round(tokens.total)
+    if first is not None and last > first:
+        run["latency"] = last - first
+        run["requests_per_second"] = sections / run["latency"]
+    run["parsed"] = {"requests": sections, "successes": tokens.count, "errors": errors,
+                     "histograms": {"tokens": tokens.to_dict(), "latency": latency.to_dict()}}
+    return run
+
+
+def parse_file(path: str) -> List[Dict[str, Any]]:
+    if path.endswith(".txt"):
+        return [parse_output_file(path)]
+    with open(path, "r", encoding="utf-8") as f:
+        first_line = f.readline()
+    try:
+        first = json.loads(first_line)
+    except ValueError:
+        return []
+    if "task" in first:
+        return parse_summary_file(path)
+    if "index" in first:
+        return [parse_records_file(path)]
+    return []
+
+
+def expand_sources(sources: Iterable[str]) -> List[str]:
+    """展开通配符和目录；目录下读取所有benchmark_*文件"""
+    paths = []
+    for source in sources:
+        if os.path.isdir(source):
+            matches = sorted(glob.glob(os.path.join(source, "benchmark_*.txt")) +
+                             glob.glob(os.path.join(source, "benchmark_*.jsonl")))
+        else:
+            matches = sorted(glob.glob(source)) or ([source] if os.path.exists(source) else [])
+        paths.extend(path for path in matches if path not in paths)
+    return paths
+
+
+def load_runs(paths: List[str], cache_file: Optional[str] = CACHE_FILE) -> List[Dict[str, Any]]:
+    """解析所有文件；按路径、大小和修改时间缓存每个文件的解析结果，之后只解析新增或变化的文件"""
+    cache: Dict[str, Any] = {}
+    if cache_file and os.path.exists(cache_file):
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                cache = json.load(f)
+        except ValueError:
+            cache = {}
+        if cache.get("version") != CACHE_VERSION:
+            cache = {}
+    files = cache.get("files", {})
+    stale = []
+    for path in paths:
+        stat = os.stat(path)
+        entry = files.get(os.path.abspath(path))
+        if not entry or entry["size"] != stat.st_size or entry["mtime"] != stat.st_mtime:
+            stale.append((path, stat))
+    if len(stale) > PARALLEL_PARSE_FILES and (os.cpu_count() or 1) > 1:
+        with concurrent.futures.ProcessPoolExecutor() as executor:
+            parsed = list(executor.map(parse_file, [path for path, _ in stale], chunksize=4))
+    else:
+        parsed = [parse_file(path) for path, _ in stale]
+    for (path, stat), file_runs in zip(stale, parsed):
+        files[os.path.abspath(path)] = {"size": stat.st_size, "mtime": stat.st_mtime, "runs": file_runs}
+
+    runs = []
+    for path in paths:
+        runs.extend(files[os.path.abspath(path)]["runs"])
+    if cache_file and stale:
+        with open(cache_file, "w", encoding="utf-8") as f:
+            json.dump({"version": CACHE_VERSION, "files": files}, f)
+    return runs
+
+
+def run_key(run: Dict[str, Any]) -> Optional[tuple]:
+    if run.get("num_requests") is None or run.get("latency") is None:
+        return None
+    return run.get("model"), run["num_requests"], run.get("total_tokens"), round(run["latency"], 1)
+
+
+def merge_duplicates(runs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """同一次运行同时出现在汇总记录和详细结果文件中时合并为一条：汇总记录提供端点等字段，详细结果提供请求段统计"""
+    merged: Dict[tuple, Dict[str, Any]] = {}
+    result = []
+    for run in runs:
+        key = run_key(run)
+        existing = merged.get(key) if key is not None else None
+        if existing is None:
+            existing = dict(run)
+            result.append(existing)
+            if key is not None:
+                merged[key] = existing
+            continue
+        for name, value in run.items():
+            if existing.get(name) is None and value is not None:
+                existing[name] = value
+        if run["source"] not in existing["source"]:
+            existing["source"] = f"{existing['source']} + {run['source']}"
+    return result
+
+
+def endpoint_host(run: Dict[str, Any]) -> str:
+    endpoint = run.get("endpoint")
+    return urlparse(endpoint).netloc or endpoint if endpoint else "-"
+
+
+def group_runs(runs: List[Dict[str, Any]], fields: List[str]) -> List[Dict[str, Any]]:
+    """按字段分组：吞吐量和延迟取各次运行的平均值，请求段统计合并直方图"""
+    groups: Dict[tuple, Dict[str, Any]] = {}
+    for run in runs:
+        key = tuple(endpoint_host(run) if field == "endpoint" else run.get(field) for field in fields)
+        group = groups.setdefault(key, {"key": key, "runs": [], "tokens": LatencyHistogram(),
+                                        "latency": LatencyHistogram(), "errors": {}})
+        group["runs"].append(run)
+        parsed = run.get("parsed")
+        if parsed:
+            group["tokens"].merge(LatencyHistogram.from_dict(parsed["histograms"]["tokens"]))
+            group["latency"].merge(LatencyHistogram.from_dict(parsed["histograms"]["latency"]))
+            for name, count in parsed["errors"].items():
+                group["errors"][name] = group["errors"].get(name, 0) + count
+    rows = []
+    for key, group in groups.items():
+        members = group["runs"]
+        requests = sum(run.get("num_requests") or 0 for run in members)
+        successes = sum(run.get("successful_requests") or 0 for run in members)
+        durations = [run["latency"] for run in members if run.get("latency")]
+        rates = [run["requests_per_second"] for run in members if run.get("requests_per_second") is not None]
+        tokens_total = sum(run.get("total_tokens") or 0 for run in members if run.get("latency"))
+        rows.append({
+            "key": dict(zip(fields, key)),
+            "runs": len(members),
+            "num_requests": requests,
+            "success_rate": successes / requests * 100 if requests else 0.0,
+            "requests_per_second": sum(rates) / len(rates) if rates else None,
+            "best_requests_per_second": max(rates) if rates else None,
+            "tokens_per_second": tokens_total / sum(durations) if durations else None,
+            "tokens_per_request": group["tokens"].summary() if group["tokens"].count else None,
+            "latency": group["latency"].summary() if group["latency"].count else None,
+            "errors": group["errors"],
+        })
+    # 数值字段（并发数）按大小排序，其余按字符串排序
+    return sorted(rows, key=lambda row: [(0, value) if isinstance(value, (int, float)) else (1, str(value))
+                                         for value in row["key"].values()])
+
+
+def format_value(value, spec: str, width: int) -> str:
+    return f"{value:{spec}}".rjust(width) if value is not None else "-".rjust(width)
+
+
+def comparison_lines(rows: List[Dict[str, Any]], fields: List[str]) -> List[str]:
+    widths = {field: max([len(field)] + [len(str(row["key"][field])) for row in rows]) for field in fields}
+    header = " | ".join(field.rjust(widths[field]) for field in fields)
+    lines = [header + f" | {'runs':>4} | {'requests':>8} | {'success':>7} | {'req/s':>7} | {'best':>7} | "
+                      f"{'tok/s':>8} | {'tok p50':>7} | {'tok p95':>7} | {'errors'}"]
+    for row in rows:
+        tokens = row["tokens_per_request"] or {}
+        errors = ", ".join(f"{name} {count}" for name, count in sorted(row["errors"].items())) or "-"
+        lines.append(" | ".join(str(row["key"][field]).rjust(widths[field]) for field in fields) +
+                     f" | {row['runs']:>4} | {row['num_requests']:>8} | {row['success_rate']:>6.1f}% | "
+                     f"{format_value(row['requests_per_second'], '.3f', 7)} | "
+                     f"{format_value(row['best_requests_per_second'], '.3f', 7)} | "
+                     f"{format_value(row['tokens_per_second'], '.0f', 8)} | "
+                     f"{format_value(tokens.get('p50'), '.0f', 7)} | {format_value(tokens.get('p95'), '.0f', 7)} | "
+                     f"{errors}")
+    return lines
+
+
+def curve_lines(runs: List[Dict[str, Any]]) -> List[str]:
+    """每个模型和端点一条吞吐量-并发数曲线（同一并发数的多次运行取平均）"""
+    lines = []
+    rows = group_runs([run for run in runs if run.get("parallel")], ["model", "endpoint", "parallel"])
+    curves: Dict[tuple, List[Dict[str, Any]]] = {}
+    for row in rows:
+        curves.setdefault((row["key"]["model"], row["key"]["endpoint"]), []).append(row)
+    for (model, host), points in curves.items():
+        points = [point for point in points if point["requests_per_second"] is not None]
+        if not points:
+            continue
+        peak = max(point["requests_per_second"] for point in points)
+        lines.append("")
+        lines.append(f"Throughput vs Concurrency: {model} @ {host}")
+        lines.append(f"{'parallel':>8} | {'req/s':>7} | {'success':>7} |")
+        for point in sorted(points, key=lambda point: point["key"]["parallel"]):
+            bar = "█" * max(1, round(point["requests_per_second"] / peak * BAR_WIDTH)) if peak else ""
+            lines.append(f"{point['key']['parallel']:>8} | {point['requests_per_second']:>7.3f} | "
+                         f"{point['success_rate']:>6.1f}% | {bar}")
+    return lines
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(prog="main.py analyze",
+                                     description="Compare benchmark runs from summary, output and record files")
+    parser.add_argument("sources", nargs="*", default=DEFAULT_SOURCES,
+                        help="Files, globs or directories (default: benchmark_results.jsonl benchmark_output_*.txt)")
+    parser.add_argument("--group-by", type=str, default="model,endpoint,parallel",
+                        help="Comma-separated fields to group runs by (model, endpoint, parallel, engine, kind, source)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help=f"Re-parse every file instead of reusing {CACHE_FILE}")
+    parser.add_argument("--json", action="store_true",
+                        help="Print the grouped rows as JSON lines instead of tables")
+    args = parser.parse_args(argv)
+
+    paths = expand_sources(args.sources)
+    if not paths:
+        parser.error("no benchmark files found")
+    runs = merge_duplicates(load_runs(paths, None if args.no_cache else CACHE_FILE))
+    fields = [field.strip() for field in args.group_by.split(",") if field.strip()]
+    rows = group_runs(runs, fields)
+
+    if args.json:
+        for row in rows:
+            print(json.dumps(row, ensure_ascii=False))
+        return
+    print(f"Analyzed {len(paths)} files, {len(runs)} runs")
+    print("")
+    for line in comparison_lines(rows, fields):
+        print(line)
+    for line in curve_lines(runs):
+        print(line)
+
+
+if __name__ == "__main__":
+    main()
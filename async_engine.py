@@ -0,0 +1,317 @@
+import asyncio
+import itertools
+import time
+from typing import List, Dict, Any, Iterable, Optional
+
+import aiohttp
+
+from latency_stats import BenchmarkStats
+from open_loop import arrival_offsets, apply_schedule_lag
+from sse_stream import SSEStreamParser
+import json_codec
+from response_headers import header_fields
+from throttling import parse_retry_after
+
+
+def create_trace_config() -> aiohttp.TraceConfig:
+    """通过aiohttp的trace钩子记录连接阶段耗时
+
+    aiohttp在一次连接创建中同时完成TCP连接和TLS握手，因此connect_time包含TLS时间，tls_time不单独记录。
+    """
+    trace_config = aiohttp.TraceConfig()
+
+    async def on_connection_create_start(session, context, params):
+        context.trace_request_ctx["_connection_start"] = time.perf_counter()
+
+    async def on_connection_create_end(session, context, params):
+        phases = context.trace_request_ctx
+        elapsed = time.perf_counter() - phases.pop("_connection_start")
+        phases["connect_time"] = elapsed - phases.get("dns_time", 0.0)
+        phases["new_connection"] = True
+
+    async def on_dns_resolvehost_start(session, context, params):
+        context.trace_request_ctx["_dns_start"] = time.perf_counter()
+
+    async def on_dns_resolvehost_end(session, context, params):
+        phases = context.trace_request_ctx
+        phases["dns_time"] = time.perf_counter() - phases.pop("_dns_start")
+
+    trace_config.on_connection_create_start.append(on_connection_create_start)
+    trace_config.on_connection_create_end.append(on_connection_create_end)
+    trace_config.on_dns_resolvehost_start.append(on_dns_resolvehost_start)
+    trace_config.on_dns_resolvehost_end.append(on_dns_resolvehost_end)
+    return trace_config
+
+
+async def single_request_async(benchmark, session: aiohttp.ClientSession, question, target,
+                               body: bytes = None) -> Dict[str, Any]:
+    """使用aiohttp发送单个请求，返回与single_request_http相同结构的结果；body为预先编码的请求体"""
+    if body is None:
+        body, _ = benchmark.encode_request(question)
+
+    phases = {}
+    start_time = time.perf_counter()
+    # 总时限取请求时限和运行被停止的时间中较早的一个；连接和读取超时与线程引擎相同
+    deadline, deadline_kind = benchmark.control.request_deadline(start_time, benchmark.timeouts.total)
+    timeout = aiohttp.ClientTimeout(total=max(0.001, deadline - start_time) if deadline is not None else None,
+                                    sock_connect=benchmark.timeouts.connect, sock_read=benchmark.timeouts.read)
+    try:
+        async with session.post(target.url, headers=target.headers, data=body, timeout=timeout,
+                                trace_request_ctx=phases) as response:
+            headers_at = time.perf_counter()
+            if response.status != 200:
+                text = await response.text()
+                result = benchmark.error_result(f"HTTP {response.status}: {text[:200]}", start_time,
+                                                response.status, parse_retry_after(response.headers))
+            elif benchmark.stream:
+                # 读完整个流（包括[DONE]之后的数据），连接才能归还连接池
+                parser = SSEStreamParser()
+                async for line in response.content:
+                    parser.feed(line)
+                result = parser.result(start_time, time.perf_counter())
+            else:
+                result = benchmark.completion_result(json_codec.loads(await response.read()), start_time)
+            result.update(benchmark.connection_timing(phases, headers_at - start_time, time.perf_counter() - headers_at))
+            result.update(header_fields(response.headers, benchmark.capture_headers, headers_at - start_time))
+            return result
+
+    except asyncio.CancelledError:
+        # 运行被取消时由AsyncBenchmarkRunner取消在途的任务
+        if benchmark.control.cancelled:
+            return benchmark.timeout_result("cancelled", "", start_time)
+        raise
+    except aiohttp.ServerTimeoutError as e:
+        # 连接超时和读取超时都是ServerTimeoutError，按消息区分（aiohttp 3.10起另有子类）
+        kind = "connect" if str(e).startswith("Connection timeout") else "read"
+        return benchmark.timeout_result(benchmark.expired(deadline, deadline_kind, kind), str(e), start_time)
+    except asyncio.TimeoutError as e:
+        return benchmark.timeout_result(benchmark.expired(deadline, deadline_kind, "read"), str(e), start_time)
+    except (aiohttp.ClientError, ValueError) as e:
+        if benchmark.control.cancelled:
+            return benchmark.timeout_result("cancelled", str(e), start_time)
+        return benchmark.error_result(str(e) or type(e).__name__, start_time)
+
+
+async def run_single_request_async(benchmark, session: aiohttp.ClientSession, question) -> Dict[str, Any]:
+    """异步版本的run_single_request：客户端限速、端点路由、重试与退避的处理方式与线程引擎相同"""
+    if benchmark.metrics:
+        benchmark.metrics.started()
+    start_time = time.perf_counter()
+    rate_limit_wait = 0.0
+    attempts = []
+    spillover_time = None
+    spills = 0
+    target = None
+    body, tokens = benchmark.encode_request(question)
+
+    def cancelled():
+        # 运行停止时还在限速或重试等待中的请求：不再发送，按被取消处理
+        return benchmark.finish_attempts(benchmark.timeout_result("cancelled", "", start_time), start_time,
+                                         attempts, rate_limit_wait, question, target, spillover_time)
+
+    while True:
+        if target is None:
+            if benchmark.rate_limiter:
+                wait = benchmark.rate_limiter.reserve(tokens)
+                if wait > 0:
+                    try:
+                        if await benchmark.control.wait_async(wait):
+                            return cancelled()
+                    except asyncio.CancelledError:
+                        if benchmark.control.cancelled:
+                            return cancelled()
+                        raise
+                    rate_limit_wait += wait
+            target = benchmark.router.choose()
+
+        result = await single_request_async(benchmark, session, question, target, body)
+        benchmark.router.release(target, result)
+        attempts.append(result)
+        stopping = benchmark.control.stopping.is_set()
+        spill = None if result["success"] or stopping else benchmark.router.spillover(target, result.get("status_code"))
+        if spill:
+            spillover_time = (spillover_time or 0.0) + result["latency"]
+            spills += 1
+            target = spill
+            continue
+        retries = len(attempts) - spills
+        if result["success"] or stopping or not benchmark.retry_policy.should_retry(result.get("status_code"), retries):
+            return benchmark.finish_attempts(result, start_time, attempts, rate_limit_wait, question,
+                                             target, spillover_time)
+        try:
+            stopped = await benchmark.control.wait_async(benchmark.retry_policy.delay(
+                retries, result.get("status_code"), result.get("retry_after")))
+        except asyncio.CancelledError:
+            if benchmark.control.cancelled:
+                return cancelled()
+            raise
+        if stopped:
+            return benchmark.finish_attempts(result, start_time, attempts, rate_limit_wait, question,
+                                             target, spillover_time)
+        target = None
+
+
+class AsyncBenchmarkRunner:
+    """在同一个事件循环和aiohttp会话中执行一轮或多轮测试，轮次之间复用已建立的连接"""
+
+    def __init__(self, benchmark, pool_size: int):
+        self.benchmark = benchmark
+        self.loop = asyncio.new_event_loop()
+        self.session = self.loop.run_until_complete(self._create_session(pool_size))
+        # 当前一轮测试的主任务；取消运行时取消除它之外的所有任务（即在途的请求）
+        self.main_task: Optional[asyncio.Task] = None
+        benchmark.control.on_cancel(self.cancel_inflight)
+
+    async def _create_session(self, pool_size: int) -> aiohttp.ClientSession:
+        # 连接池上限与并发数一致，不设置总超时（与线程引擎保持一致）
+        connector = aiohttp.TCPConnector(limit=pool_size, limit_per_host=pool_size)
+        timeout = aiohttp.ClientTimeout(total=None)
+        return aiohttp.ClientSession(connector=connector, timeout=timeout,
+                                     trace_configs=[create_trace_config()])
+
+    def run(self, questions: List[str], concurrency: int, rps: Optional[float] = None,
+            arrival: str = "constant", seed: Optional[int] = None, writer=None, ramp=None) -> tuple:
+        """执行一轮测试；指定rps时按开环方式以目标速率发送请求，concurrency限制同时在途的请求数"""
+        if rps:
+            offsets = arrival_offsets(rps, arrival, seed)
+            if ramp:
+                offsets = ramp.warp(offsets)
+        else:
+            offsets = itertools.repeat(None)
+        schedule = ((i, question, offset) for i, (question, offset) in enumerate(zip(questions, offsets)))
+        return self.run_schedule(schedule, len(questions), concurrency, writer, ramp)
+
+    def run_schedule(self, schedule: Iterable[tuple], total: Optional[int], concurrency: int, writer=None,
+                     ramp=None, max_lag: Optional[float] = None) -> tuple:
+        """按计划发送请求：schedule产生(序号, 问题或请求, 计划发送时间)，计划时间为None表示闭环发送
+
+        ramp和max_lag的含义与线程引擎的open_loop.run_schedule相同。
+        """
+        return self.loop.run_until_complete(self._run(schedule, total, concurrency, writer, ramp, max_lag))
+
+    def run_conversations(self, conversations: List, num_users: int, turns: int, writer=None, ramp=None) -> tuple:
+        """多轮会话：num_users个虚拟用户并发进行对话，对话内的各轮依次发送"""
+        return self.loop.run_until_complete(self._run_conversations(conversations, num_users, turns, writer, ramp))
+
+    def cancel_inflight(self):
+        """RunControl的取消回调，可能在信号处理函数或计时器线程中调用"""
+        if not self.loop.is_closed():
+            self.loop.call_soon_threadsafe(self._cancel_tasks)
+
+    def _cancel_tasks(self):
+        for task in asyncio.all_tasks(self.loop):
+            if task is not self.main_task:
+                task.cancel()
+
+    def close(self):
+        self.loop.run_until_complete(self.session.close())
+        self.loop.close()
+
+    async def _run(self, schedule: Iterable[tuple], total: Optional[int], concurrency: int, writer, ramp,
+                   max_lag: Optional[float] = None) -> tuple:
+        self.main_task = asyncio.current_task()
+        stopping = self.benchmark.control.stopping
+        stats = BenchmarkStats()
+        semaphore = asyncio.Semaphore(concurrency)
+        completed = 0
+
+        async def process_question(index: int, question, intended_time: Optional[float] = None):
+            nonlocal completed
+            if intended_time is not None:
+                # 开环模式下任务按计划时间创建，在这里等待空闲的并发名额
+                await semaphore.acquire()
+            try:
+                started = time.perf_counter()
+                lag = started - intended_time if intended_time is not None else None
+                if max_lag is not None and lag is not None and lag > max_lag:
+                    # 积压过多：放弃这个请求，等待名额的任务很快被跳过，存活的任务数保持有界
+                    stats.record_missed()
+                    return
+                result = await run_single_request_async(self.benchmark, self.session, question)
+                if lag is not None:
+                    apply_schedule_lag(result, lag)
+                if ramp is None or ramp.measured(started if intended_time is None else intended_time):
+                    stats.record(result)
+                    if writer:
+                        writer.write(index, result)
+                completed += 1
+                self.benchmark.progress(f"Completed {completed}/{total} requests" if total
+                                        else f"Completed {completed} requests")
+            finally:
+                semaphore.release()
+
+        tasks = set()
+
+        def spawn(coroutine):
+            task = asyncio.create_task(coroutine)
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+
+        start_time = time.perf_counter()
+        releaser = None
+        if ramp:
+            ramp.begin(start_time)
+            releaser = await ramp.hold_async(semaphore)
+
+        for index, question, offset in schedule:
+            if stopping.is_set():
+                break
+            if offset is None:
+                # 闭环：先获取信号量再创建任务，同时存活的任务数不超过并发数
+                await semaphore.acquire()
+                if stopping.is_set():
+                    semaphore.release()
+                    break
+                spawn(process_question(index, question))
+                continue
+            # 开环：按计划时间创建任务，不等待之前的请求完成
+            if await self.benchmark.control.wait_async(start_time + offset - time.perf_counter()):
+                break
+            spawn(process_question(index, question, start_time + offset))
+        if tasks:
+            # 运行被取消时还在等待并发名额的任务以CancelledError结束（请求尚未发送），不影响其他结果
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if releaser:
+            releaser.cancel()
+
+        end_time = time.perf_counter()
+
+        return end_time - (ramp.steady_start if ramp else start_time), stats
+
+    async def _run_conversations(self, conversations: List, num_users: int, turns: int, writer, ramp) -> tuple:
+        self.main_task = asyncio.current_task()
+        stats = BenchmarkStats()
+        semaphore = asyncio.Semaphore(num_users)
+        total = sum(len(conversation.questions) for conversation in conversations)
+        completed = 0
+
+        async def process_conversation(conversation):
+            nonlocal completed
+            async with semaphore:
+                for turn in range(len(conversation.questions)):
+                    if self.benchmark.control.stopping.is_set():
+                        return
+                    request = conversation.request(turn)
+                    started = time.perf_counter()
+                    result = await run_single_request_async(self.benchmark, self.session, request)
+                    conversation.finish_turn(turn, request, result)
+                    if ramp is None or ramp.measured(started):
+                        stats.record(result)
+                        if writer:
+                            writer.write(conversation.index * turns + turn, result)
+                    completed += 1
+                    self.benchmark.progress(f"Completed {completed}/{total} requests "
+                                            f"(conversation {conversation.index + 1}, turn {turn + 1})")
+
+        start_time = time.perf_counter()
+        releaser = None
+        if ramp:
+            ramp.begin(start_time)
+            releaser = await ramp.hold_async(semaphore)
+        await asyncio.gather(*(process_conversation(conversation) for conversation in conversations),
+                             return_exceptions=True)
+        if releaser:
+            releaser.cancel()
+        end_time = time.perf_counter()
+
+        return end_time - (ramp.steady_start if ramp else start_time), stats
@@ -0,0 +1,108 @@
+import json
+import os
+import time
+from typing import List, Dict, Any, Set
+
+from latency_stats import BenchmarkStats
+from result_writer import read_records
+
+
+def checkpoint_path(run_id: str) -> str:
+    return f"benchmark_checkpoint_{run_id}.json"
+
+
+def save_checkpoint(checkpoint: Dict[str, Any]):
+    """先写临时文件再替换，进程在写入过程中被中断也不会留下损坏的检查点"""
+    path = checkpoint_path(checkpoint["run_id"])
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(path + ".tmp", path)
+
+
+def create_checkpoint(args) -> Dict[str, Any]:
+    """记录一次运行的参数和各运行段；每个请求的结果由逐请求记录文件保存"""
+    checkpoint = {
+        "run_id": args.run_id,
+        "args": {name: value for name, value in vars(args).items() if name != "resume"},
+        "segments": [],
+    }
+    save_checkpoint(checkpoint)
+    return checkpoint
+
+
+def load_checkpoint(run_id: str) -> Dict[str, Any]:
+    with open(checkpoint_path(run_id), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def start_segment(checkpoint: Dict[str, Any]) -> int:
+    """开始一个新的运行段，返回段号（从1开始）"""
+    checkpoint["segments"].append({
+        "segment": len(checkpoint["segments"]) + 1,
+        "started_at": time.time(),
+        "ended_at": None,
+        "latency": None,
+        "completed": 0,
+    })
+    save_checkpoint(checkpoint)
+    return len(checkpoint["segments"])
+
+
+def finish_segment(checkpoint: Dict[str, Any], latency: float, completed: int, interrupted: bool = False):
+    """结束当前运行段；interrupted表示运行被中断或到达时限，剩余的问题可以续跑"""
+    segment = checkpoint["segments"][-1]
+    segment["ended_at"] = time.time()
+    segment["latency"] = latency
+    segment["completed"] = completed
+    if interrupted:
+        segment["interrupted"] = True
+    save_checkpoint(checkpoint)
+
+
+def restore_progress(checkpoint: Dict[str, Any], records_file: str) -> tuple:
+    """从记录文件恢复已完成的问题序号和统计
+
+    中断的运行段没有结束时间，按该段最后一条记录的时间补全，耗时从段开始时间算到最后一条记录。
+    返回(已完成的问题序号集合, 统计)。
+    """
+    done: Set[int] = set()
+    stats = BenchmarkStats()
+    last_record_at: Dict[int, float] = {}
+    completed: Dict[int, int] = {}
+    if os.path.exists(records_file):
+        for record in read_records(records_file):
+            if record["index"] in done:
+                continue
+            done.add(record["index"])
+            stats.record(record)
+            segment = record.get("segment", 1)
+            last_record_at[segment] = max(last_record_at.get(segment, 0.0), record["timestamp"])
+            completed[segment] = completed.get(segment, 0) + 1
+
+    for segment in checkpoint["segments"]:
+        if segment["ended_at"] is None:
+            segment["ended_at"] = last_record_at.get(segment["segment"], segment["started_at"])
+            segment["latency"] = segment["ended_at"] - segment["started_at"]
+            segment["completed"] = completed.get(segment["segment"], 0)
+            segment["interrupted"] = True
+    save_checkpoint(checkpoint)
+    return done, stats
+
+
+def segment_gaps(segments: List[Dict[str, Any]]) -> List[float]:
+    """相邻运行段之间的间隔（秒）：上一段结束到下一段开始"""
+    return [later["started_at"] - earlier["ended_at"] for earlier, later in zip(segments, segments[1:])]
+
+
+def segment_lines(segments: List[Dict[str, Any]]) -> List[str]:
+    """格式化各运行段和段间间隔，用于控制台和详细结果文件"""
+    lines = []
+    gaps = segment_gaps(segments)
+    for i, segment in enumerate(segments):
+        status = " (interrupted)" if segment.get("interrupted") else ""
+        started = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(segment["started_at"]))
+        lines.append(f"Segment {segment['segment']}: started {started}, {segment['completed']} requests "
+                     f"in {segment['latency']:.3f}s{status}")
+        if i < len(gaps):
+            lines.append(f"  -- gap {gaps[i]:.1f}s --")
+    return lines
@@ -0,0 +1,231 @@
+import argparse
+import math
+import random
+import sys
+from typing import List, Dict, Any, Optional
+
+from result_writer import read_records
+from live_metrics import error_class
+
+# 吞吐量按等长的时间窗口做块自助法：同一窗口内的完成数相互关联，不能逐请求重采样
+THROUGHPUT_WINDOWS = 20
+
+# (名称, 显示名, 变大是否为退化)
+METRICS = (
+    ("latency_p50", "Latency p50 (s)", True),
+    ("latency_p95", "Latency p95 (s)", True),
+    ("latency_p99", "Latency p99 (s)", True),
+    ("requests_per_second", "Requests/s", False),
+    ("tokens_per_second", "Output tokens/s", False),
+)
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """最近秩法的分位数，与直方图的口径一致"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(q / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def load_run(path: str, tag: Optional[str] = None) -> Dict[str, Any]:
+    """读取逐请求记录文件：成功请求的延迟，以及按时间窗口统计的完成数和输出token数"""
+    latencies = []
+    finished = []
+    errors: Dict[str, int] = {}
+    requests = 0
+    for record in read_records(path):
+        if "index" not in record or (tag is not None and record.get("tag") != tag):
+            continue
+        requests += 1
+        if record.get("success"):
+            tokens = record.get("completion_tokens", record.get("usage")) or 0
+            latencies.append(record["latency"])
+            finished.append((record["timestamp"] - record["latency"], record["timestamp"], tokens))
+        else:
+            name = error_class(record)
+            errors[name] = errors.get(name, 0) + 1
+    if len(latencies) < 2:
+        raise ValueError(f"{path}: need at least 2 successful requests, found {len(latencies)}")
+
+    start = min(begin for begin, _, _ in finished)
+    duration = max(end for _, end, _ in finished) - start
+    width = duration / THROUGHPUT_WINDOWS if duration > 0 else 1.0
+    completions = [0] * THROUGHPUT_WINDOWS
+    tokens = [0] * THROUGHPUT_WINDOWS
+    for _, end, count in finished:
+        window = min(int((end - start) / width), THROUGHPUT_WINDOWS - 1)
+        completions[window] += 1
+        tokens[window] += count
+    return {"path": path, "requests": requests, "errors": errors, "latencies": sorted(latencies),
+            "duration": duration, "window": width, "completions": completions, "tokens": tokens}
+
+
+def point_estimates(run: Dict[str, Any]) -> Dict[str, float]:
+    latencies = run["latencies"]
+    seconds = run["window"] * THROUGHPUT_WINDOWS
+    return {
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "requests_per_second": sum(run["completions"]) / seconds,
+        "tokens_per_second": sum(run["tokens"]) / seconds,
+    }
+
+
+def bootstrap(run: Dict[str, Any], iterations: int, rng: random.Random) -> Dict[str, List[float]]:
+    """自助法重采样：延迟分位数逐请求重采样，吞吐量按时间窗口重采样"""
+    latencies = run["latencies"]
+    n = len(latencies)
+    seconds = run["window"] * THROUGHPUT_WINDOWS
+    windows = list(zip(run["completions"], run["tokens"]))
+    samples: Dict[str, List[float]] = {name: [] for name, _, _ in METRICS}
+    for _ in range(iterations):
+        resample = sorted(rng.choices(latencies, k=n))
+        for q in (50, 95, 99):
+            samples[f"latency_p{q}"].append(percentile(resample, q))
+        chosen = rng.choices(windows, k=THROUGHPUT_WINDOWS)
+        samples["requests_per_second"].append(sum(count for count, _ in chosen) / seconds)
+        samples["tokens_per_second"].append(sum(tokens for _, tokens in chosen) / seconds)
+    return samples
+
+
+def interval(values: List[float], confidence: float) -> tuple:
+    ordered = sorted(values)
+    tail = (1 - confidence) / 2 * 100
+    return percentile(ordered, tail), percentile(ordered, 100 - tail)
+
+
+def mann_whitney(a: List[float], b: List[float]) -> Dict[str, float]:
+    """Mann-Whitney U检验（双侧，正态近似并校正并列值）
+
+    prob_b_greater为从B中任取一个请求比从A中任取一个更慢的概率（并列算一半），0.5表示没有差别。
+    """
+    n1, n2 = len(a), len(b)
+    values = sorted([(value, 0) for value in a] + [(value, 1) for value in b])
+    rank_sum_b = 0.0
+    tie_term = 0.0
+    i = 0
+    while i < len(values):
+        j = i
+        while j + 1 < len(values) and values[j + 1][0] == values[i][0]:
+            j += 1
+        # 并列的值取平均秩
+        rank = (i + j) / 2 + 1
+        rank_sum_b += rank * sum(group for _, group in values[i:j + 1])
+        ties = j - i + 1
+        tie_term += ties ** 3 - ties
+        i = j + 1
+    u_b = rank_sum_b - n2 * (n2 + 1) / 2
+    n = n1 + n2
+    variance = n1 * n2 / 12 * ((n + 1) - tie_term / (n * (n - 1)))
+    z = (u_b - n1 * n2 / 2) / math.sqrt(variance) if variance > 0 else 0.0
+    return {"u": u_b, "z": z, "p_value": math.erfc(abs(z) / math.sqrt(2)), "prob_b_greater": u_b / (n1 * n2)}
+
+
+def compare(baseline: Dict[str, Any], candidate: Dict[str, Any], iterations: int = 2000, confidence: float = 0.95,
+            threshold: float = 5.0, seed: int = 0) -> Dict[str, Any]:
+    """比较两次运行：各指标的点估计和自助法置信区间、相对变化的置信区间，以及是否超过退化阈值
+
+    相对变化的置信区间由两次运行各自独立的重采样配对得到；区间不含0时变化才算显著，
+    显著且点估计在变差方向上超过threshold（百分比）时判为退化。
+    confidence应已按指标数做过多重比较校正，否则同时检验多个指标时误报的概率会成倍增加。
+    """
+    rng = random.Random(seed)
+    estimates = (point_estimates(baseline), point_estimates(candidate))
+    samples = (bootstrap(baseline, iterations, rng), bootstrap(candidate, iterations, rng))
+    rows = []
+    for name, label, higher_is_worse in METRICS:
+        base, cand = estimates[0][name], estimates[1][name]
+        changes = [(b - a) / a * 100 for a, b in zip(samples[0][name], samples[1][name]) if a]
+        change = (cand - base) / base * 100 if base else 0.0
+        low, high = interval(changes, confidence) if changes else (0.0, 0.0)
+        # 把变化统一换算到"变差为正"的方向
+        worse, worse_low = (change, low) if higher_is_worse else (-change, -high)
+        if worse_low > 0 and worse >= threshold:
+            verdict = "regression"
+        elif worse_low > 0:
+            verdict = "worse"
+        elif (high < 0 if higher_is_worse else low > 0):
+            verdict = "improved"
+        else:
+            verdict = "no change"
+        rows.append({"metric": name, "label": label, "baseline": base, "candidate": cand,
+                     "baseline_ci": interval(samples[0][name], confidence),
+                     "candidate_ci": interval(samples[1][name], confidence),
+                     "change_percent": change, "change_ci": (low, high), "verdict": verdict})
+    test = mann_whitney(baseline["latencies"], candidate["latencies"])
+    return {"rows": rows, "mann_whitney": test,
+            "regression": any(row["verdict"] == "regression" for row in rows)}
+
+
+def comparison_lines(baseline: Dict[str, Any], candidate: Dict[str, Any], result: Dict[str, Any],
+                     confidence: float, alpha: float) -> List[str]:
+    level = f"{confidence * 100:g}%"
+    lines = []
+    for name, run in (("A (baseline)", baseline), ("B (candidate)", candidate)):
+        errors = ", ".join(f"{error} {count}" for error, count in sorted(run["errors"].items())) or "none"
+        lines.append(f"{name}: {run['path']} - {run['requests']} requests, {len(run['latencies'])} successful, "
+                     f"{run['duration']:.1f}s, errors: {errors}")
+    lines.append("")
+    lines.append(f"{'metric':>16} | {'A':>9} | {'A ' + level + ' CI':>21} | {'B':>9} | {'B ' + level + ' CI':>21} | "
+                 f"{'change':>8} | {'change ' + level + ' CI':>20} | verdict")
+    for row in result["rows"]:
+        digits = 3 if row["metric"].startswith("latency") else 2
+        a_low, a_high = row["baseline_ci"]
+        b_low, b_high = row["candidate_ci"]
+        c_low, c_high = row["change_ci"]
+        lines.append(f"{row['label']:>16} | {row['baseline']:>9.{digits}f} | "
+                     f"{f'[{a_low:.{digits}f}, {a_high:.{digits}f}]':>21} | {row['candidate']:>9.{digits}f} | "
+                     f"{f'[{b_low:.{digits}f}, {b_high:.{digits}f}]':>21} | {row['change_percent']:>+7.1f}% | "
+                     f"{f'[{c_low:+.1f}%, {c_high:+.1f}%]':>20} | {row['verdict']}")
+    test = result["mann_whitney"]
+    significant = "significant" if test["p_value"] < alpha else "not significant"
+    lines.append("")
+    lines.append(f"Mann-Whitney U (latency): U={test['u']:.0f}, z={test['z']:+.2f}, p={test['p_value']:.4g} "
+                 f"({significant} at alpha={alpha:g}); P(B slower than A)={test['prob_b_greater']:.3f}")
+    return lines
+
+
+def main(argv: List[str] = None):
+    parser = argparse.ArgumentParser(prog="main.py compare",
+                                     description="Compare two runs' per-request records and gate on regressions")
+    parser.add_argument("baseline", help="Per-request records file of the baseline run (benchmark_records_*.jsonl)")
+    parser.add_argument("candidate", help="Per-request records file of the candidate run")
+    parser.add_argument("--threshold", type=float, default=5.0,
+                        help="Regression threshold in percent: fail when a metric is significantly worse by at least this much")
+    parser.add_argument("--alpha", type=float, default=0.05,
+                        help="Overall significance level; confidence intervals are Bonferroni-corrected across metrics")
+    parser.add_argument("--iterations", type=int, default=2000,
+                        help="Number of bootstrap resamples")
+    parser.add_argument("--tag", type=str, default=None,
+                        help="Only compare requests with this tag (e.g. from --replay)")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed for the bootstrap")
+    args = parser.parse_args(argv)
+    if not 0 < args.alpha < 1:
+        parser.error("--alpha must be between 0 and 1")
+    if args.iterations < 100:
+        parser.error("--iterations must be at least 100")
+
+    try:
+        baseline = load_run(args.baseline, args.tag)
+        candidate = load_run(args.candidate, args.tag)
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}")
+        sys.exit(2)
+    # Bonferroni校正：任一指标误报退化的总概率不超过alpha
+    confidence = 1 - args.alpha / len(METRICS)
+    result = compare(baseline, candidate, args.iterations, confidence, args.threshold, args.seed)
+    for line in comparison_lines(baseline, candidate, result, confidence, args.alpha):
+        print(line)
+    print("")
+    if result["regression"]:
+        failed = ", ".join(row["label"] for row in result["rows"] if row["verdict"] == "regression")
+        print(f"FAIL: regression beyond {args.threshold:g}% in {failed}")
+        sys.exit(1)
+    print(f"PASS: no metric regressed by {args.threshold:g}% or more")
+
+
+if __name__ == "__main__":
+    main()
@@ -76,6 +76,8 @@ default_questions = [
 ]
 
 questions.extend(default_questions)
+# 用集合判断是否重复，避免在列表中线性查找
+seen = set(questions)
 
 # Then generate additional unique questions
 while len(questions) < 1000:
@@ -105,7 +107,8 @@ while len(questions) < 1000:
         question = template
     
     # Add if unique
-    if question not in questions:
+    if question not in seen:
+        seen.add(question)
         questions.append(question)
 
 # Generate some specific technical and non-technical questions
@@ -134,7 +137,8 @@ specific_questions = [
 
 # Add specific questions, ensuring we don't exceed 1000 total
 for question in specific_questions:
-    if question not in questions and len(questions) < 1000:
+    if question not in seen and len(questions) < 1000:
+        seen.add(question)
         questions.append(question)
 
 # Ensure we have exactly 1000 questions
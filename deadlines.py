@@ -0,0 +1,138 @@
+import asyncio
+import os
+import signal
+import threading
+import time
+import weakref
+from typing import Callable, List, Optional
+
+# RunControl.reason在输出中的说明
+STOP_REASONS = {"deadline": "reached --run-deadline", "interrupted": "interrupted"}
+
+
+class RequestTimeouts:
+    """单个请求的时限：connect为建立连接，read为两次收到数据之间的最长间隔，total为整个请求（含读完响应体或SSE流）
+
+    total为None时不限制整个请求的时长。
+    """
+
+    def __init__(self, connect: float = 10.0, read: float = 300.0, total: Optional[float] = None):
+        self.connect = connect
+        self.read = read
+        self.total = total
+
+
+class DeadlineExceeded(Exception):
+    """读取响应的过程中超过了请求的时限"""
+
+
+class RunControl:
+    """整次运行的停止与取消
+
+    到达运行时限，或收到SIGINT/SIGTERM时停止发送新请求：运行时限和第二次信号立即取消在途请求，
+    第一次信号给在途请求drain_timeout秒的宽限期，之后再取消。取消时调用on_cancel注册的回调
+    （线程引擎关闭正在使用的连接，异步引擎取消在途的任务），被取消的请求不计入统计也不写入记录。
+    """
+
+    def __init__(self, deadline: Optional[float] = None, drain_timeout: float = 30.0):
+        self.deadline = deadline
+        self.drain_timeout = drain_timeout
+        self.stopping = threading.Event()
+        self.reason: Optional[str] = None
+        self.cancelled = False
+        # 在途请求被取消的时间（perf_counter），在此之后仍未完成的请求会被取消
+        self.cancel_at: Optional[float] = None
+        self.callbacks: List[Callable[[], None]] = []
+        self.lock = threading.Lock()
+        self.signals = 0
+        self.previous_handlers = {}
+        # 各事件循环中与stopping同步的asyncio.Event，供异步引擎在等待时及时响应停止
+        self.async_events = weakref.WeakKeyDictionary()
+
+    def on_cancel(self, callback: Callable[[], None]):
+        self.callbacks.append(callback)
+
+    def start(self):
+        """开始计算运行时限"""
+        if self.deadline:
+            self.cancel_at = time.perf_counter() + self.deadline
+            self._timer(self.deadline, self.stop, "deadline", 0.0)
+
+    def stop(self, reason: str, grace: float):
+        """停止发送新请求，grace秒后取消仍在途的请求；多次调用时保留最早的取消时间"""
+        with self.lock:
+            if not self.stopping.is_set():
+                self.reason = reason
+                self.stopping.set()
+                # 可能在信号处理函数或计时器线程中调用，通过call_soon_threadsafe通知各事件循环
+                for loop, event in list(self.async_events.items()):
+                    if not loop.is_closed():
+                        loop.call_soon_threadsafe(event.set)
+            cancel_at = time.perf_counter() + grace
+            earlier = self.cancel_at is None or cancel_at < self.cancel_at
+            if earlier:
+                self.cancel_at = cancel_at
+        if grace <= 0:
+            self.cancel()
+        elif earlier:
+            self._timer(grace, self.cancel)
+
+    async def wait_async(self, delay: float) -> bool:
+        """异步版本的stopping.wait(delay)：运行停止时立即返回True，否则等待delay秒后返回False"""
+        if delay <= 0:
+            return self.stopping.is_set()
+        loop = asyncio.get_running_loop()
+        with self.lock:
+            event = self.async_events.get(loop)
+            if event is None:
+                event = self.async_events[loop] = asyncio.Event()
+                if self.stopping.is_set():
+                    event.set()
+        try:
+            await asyncio.wait_for(event.wait(), delay)
+        except asyncio.TimeoutError:
+            pass
+        return self.stopping.is_set()
+
+    def cancel(self):
+        with self.lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+        for callback in self.callbacks:
+            callback()
+
+    def request_deadline(self, start_time: float, total: Optional[float]) -> tuple:
+        """返回请求的截止时间（perf_counter，None表示不限）和到期时的归类：total为请求时限，cancelled为运行被停止"""
+        deadline, kind = (start_time + total, "total") if total else (None, None)
+        if self.cancel_at is not None and (deadline is None or self.cancel_at < deadline):
+            return self.cancel_at, "cancelled"
+        return deadline, kind
+
+    def install_signal_handlers(self):
+        for signum in (signal.SIGINT, signal.SIGTERM):
+            self.previous_handlers[signum] = signal.signal(signum, self._handle_signal)
+
+    def restore_signal_handlers(self):
+        for signum, handler in self.previous_handlers.items():
+            signal.signal(signum, handler)
+        self.previous_handlers = {}
+
+    def _handle_signal(self, signum, frame):
+        self.signals += 1
+        name = signal.Signals(signum).name
+        # 信号处理函数可能打断主线程中正在进行的print，这里直接写标准错误
+        if self.signals == 1:
+            os.write(2, f"\nReceived {name}: sending no new requests, waiting up to {self.drain_timeout:g}s for "
+                        f"in-flight requests (send again to cancel them)\n".encode())
+            self.stop("interrupted", self.drain_timeout)
+        elif self.signals == 2:
+            os.write(2, f"\nReceived {name} again: cancelling in-flight requests\n".encode())
+            self.stop("interrupted", 0.0)
+        else:
+            raise KeyboardInterrupt
+
+    def _timer(self, seconds: float, function: Callable, *args):
+        timer = threading.Timer(seconds, function, args)
+        timer.daemon = True
+        timer.start()
@@ -0,0 +1,184 @@
+import hmac
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from typing import List, Dict, Any, Callable, Tuple
+
+from latency_stats import BenchmarkStats
+
+# 本地worker进程启动后输出的监听地址前缀
+LISTENING_PREFIX = "Worker listening on "
+
+# coordinator与worker共享的令牌：worker只执行握手时出示了相同令牌的coordinator下发的任务
+WORKER_TOKEN_ENV = "BENCHMARK_WORKER_TOKEN"
+
+
+def parse_address(address: str) -> Tuple[str, int]:
+    """解析[host:]port；省略host时只监听本机，接受其他主机的连接需要显式指定（例如0.0.0.0）"""
+    host, _, port = address.rpartition(":")
+    return host or "127.0.0.1", int(port)
+
+
+def send_message(stream, message: Dict[str, Any]):
+    """控制通道使用一行一个JSON对象的格式"""
+    stream.write(json.dumps(message, ensure_ascii=False) + "\n")
+    stream.flush()
+
+
+def receive_message(stream) -> Dict[str, Any]:
+    line = stream.readline()
+    return json.loads(line) if line else None
+
+
+def authenticate(stream, token: str) -> bool:
+    """worker端的握手：第一条消息须为携带相同令牌的hello，回复ready；否则回复error"""
+    try:
+        message = receive_message(stream)
+    except ValueError:
+        message = None
+    if (isinstance(message, dict) and message.get("type") == "hello"
+            and hmac.compare_digest(str(message.get("token", "")).encode(), token.encode())):
+        send_message(stream, {"type": "ready"})
+        return True
+    send_message(stream, {"type": "error", "message": "invalid worker token"})
+    return False
+
+
+def serve_worker(address: str, run_job: Callable[[Dict[str, Any]], tuple], token: str):
+    """worker模式：监听控制连接，按coordinator指定的时间开始执行任务，返回可合并的统计结果
+
+    连接建立后先校验令牌，不匹配的连接直接关闭；一个连接结束后继续等待下一个coordinator，收到shutdown消息时退出。
+    """
+    server = socket.create_server(parse_address(address))
+    host, port = server.getsockname()[:2]
+    print(f"{LISTENING_PREFIX}{host}:{port}", flush=True)
+
+    with server:
+        while True:
+            connection, peer = server.accept()
+            with connection, connection.makefile("rw", encoding="utf-8") as stream:
+                if not authenticate(stream, token):
+                    print(f"Rejected a connection from {peer[0]}: invalid worker token", flush=True)
+                    continue
+                while True:
+                    message = receive_message(stream)
+                    if message is None:
+                        break
+                    if message["type"] == "shutdown":
+                        return
+                    if message["type"] == "job":
+                        print(f"Received job with {len(message['questions'])} questions from {peer[0]}", flush=True)
+                        # 所有worker在同一时刻开始；跨主机时依赖各主机时钟同步（NTP）
+                        delay = message["start_at"] - time.time()
+                        if delay > 0:
+                            time.sleep(delay)
+                        latency, stats = run_job(message)
+                        send_message(stream, {
+                            "type": "result",
+                            "worker": socket.gethostname(),
+                            "latency": latency,
+                            "stats": stats.to_dict(),
+                        })
+
+
+def start_local_workers(count: int, script: str, token: str) -> Tuple[List[subprocess.Popen], List[str]]:
+    """在本机启动count个worker进程，返回进程列表和它们的监听地址；令牌通过环境变量传给worker，不出现在命令行中"""
+    processes = []
+    addresses = []
+    env = dict(os.environ, **{WORKER_TOKEN_ENV: token})
+    for _ in range(count):
+        process = subprocess.Popen([sys.executable, script, "--worker-listen", "127.0.0.1:0"],
+                                   stdout=subprocess.PIPE, text=True, env=env)
+        processes.append(process)
+    for process in processes:
+        for line in process.stdout:
+            if line.startswith(LISTENING_PREFIX):
+                addresses.append(line[len(LISTENING_PREFIX):].strip())
+                break
+        else:
+            stop_local_workers(processes, 0)
+            raise RuntimeError("Local worker exited before it started listening")
+        # 继续读取worker的进度输出并丢弃，避免管道写满后worker阻塞
+        threading.Thread(target=drain, args=(process.stdout,), daemon=True).start()
+    return processes, addresses
+
+
+def stop_local_workers(processes: List[subprocess.Popen], timeout: float = 10.0):
+    """等待本机worker进程退出；超过timeout秒仍在运行的先terminate，再不退出则kill
+
+    协调出错时以timeout=0调用，直接结束仍在运行的worker；不抛出TimeoutExpired，以免掩盖原来的异常。
+    """
+    deadline = time.monotonic() + timeout
+    for process in processes:
+        try:
+            process.wait(timeout=max(0.0, deadline - time.monotonic()))
+        except subprocess.TimeoutExpired:
+            process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def drain(stream):
+    for _ in stream:
+        pass
+
+
+def split_evenly(total, parts: int, index: int):
+    """把并发数、速率等总量尽量平均地分给各个worker"""
+    if total is None:
+        return None
+    if isinstance(total, int):
+        return total // parts + (1 if index < total % parts else 0)
+    return total / parts
+
+
+def run_coordinator(addresses: List[str], jobs: List[Dict[str, Any]], token: str, start_delay: float = 2.0,
+                    shutdown: bool = False) -> Tuple[float, BenchmarkStats, List[Dict[str, Any]]]:
+    """向每个worker下发任务并统一开始时间，收集并合并各worker的统计结果
+
+    返回(总耗时, 合并后的统计, 各worker的原始结果)；总耗时取最慢的worker。
+    """
+    connections = []
+    try:
+        for address in addresses:
+            connection = socket.create_connection(parse_address(address))
+            stream = connection.makefile("rw", encoding="utf-8")
+            connections.append((connection, stream))
+            send_message(stream, {"type": "hello", "token": token})
+            reply = receive_message(stream)
+            if not reply or reply.get("type") != "ready":
+                reason = reply.get("message") if reply else "connection closed"
+                raise RuntimeError(f"Worker {address} rejected the coordinator: {reason}")
+
+        start_at = time.time() + start_delay
+        for (_, stream), job in zip(connections, jobs):
+            send_message(stream, dict(job, type="job", start_at=start_at))
+
+        worker_results = []
+        for address, (_, stream) in zip(addresses, connections):
+            message = receive_message(stream)
+            if message is None:
+                raise RuntimeError(f"Worker {address} disconnected before returning results")
+            message["address"] = address
+            worker_results.append(message)
+            print(f"Worker {address} finished in {message['latency']:.3f}s")
+            if shutdown:
+                send_message(stream, {"type": "shutdown"})
+    finally:
+        for connection, stream in connections:
+            stream.close()
+            connection.close()
+
+    stats = BenchmarkStats()
+    for message in worker_results:
+        stats.merge(BenchmarkStats.from_dict(message["stats"]))
+    latency = max(message["latency"] for message in worker_results)
+    return latency, stats, worker_results
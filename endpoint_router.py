@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+from typing import List, Dict, Any, Optional
+from urllib.parse import urlparse
+
+ROUTING_POLICIES = ("round-robin", "least-outstanding", "latency", "spillover")
+
+# 延迟估计的指数加权移动平均系数
+LATENCY_EWMA_ALPHA = 0.2
+
+
+class Endpoint:
+    """一个部署的地址、认证和权重，以及路由使用的在途请求数和延迟估计"""
+
+    def __init__(self, name: str, endpoint: str, model: str, api_version: str, api_key: str, weight: float = 1.0):
+        self.name = name
+        self.model = model
+        self.weight = weight
+        self.url = f"{endpoint}/openai/deployments/{model}/chat/completions?api-version={api_version}"
+        self.headers = {"Content-Type": "application/json", "api-key": api_key}
+        self.outstanding = 0
+        self.latency: Optional[float] = None
+        # 平滑加权轮询的当前权重
+        self.current_weight = 0.0
+
+
+def load_endpoints(path: str, defaults: Dict[str, Any]) -> List[Endpoint]:
+    """读取端点列表JSON文件
+
+    每项包含name、endpoint、model、api_version、api_key（或api_key_env指定的环境变量）和weight，
+    省略的字段使用defaults（.env中的AZURE_*配置）。spillover策略按文件中的顺序溢出。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    if not isinstance(items, list) or not items:
+        raise ValueError(f"{path}: expected a non-empty JSON list of endpoints")
+    endpoints = []
+    for item in items:
+        config = dict(defaults)
+        config.update(item)
+        if item.get("api_key_env"):
+            config["api_key"] = os.getenv(item["api_key_env"])
+        if not config.get("endpoint") or not config.get("model"):
+            raise ValueError(f"{path}: every endpoint needs 'endpoint' and 'model'")
+        if float(config.get("weight", 1.0)) <= 0:
+            raise ValueError(f"{path}: endpoint weights must be positive")
+        name = config.get("name") or f"{config['model']}@{urlparse(config['endpoint']).netloc}"
+        endpoints.append(Endpoint(name, config["endpoint"], config["model"], config.get("api_version"),
+                                  config.get("api_key"), float(config.get("weight", 1.0))))
+    names = [endpoint.name for endpoint in endpoints]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{path}: endpoint names must be unique")
+    return endpoints
+
+
+class EndpointRouter:
+    """按路由策略为每次请求选择端点；线程引擎和异步引擎共用
+
+    - round-robin: 平滑加权轮询
+    - least-outstanding: 在途请求数除以权重最小的端点
+    - latency: 延迟估计（EWMA）乘以在途请求数加一、再除以权重最小的端点；尚无样本的端点按已知端点的平均延迟计
+    - spillover: 总是先发往第一个端点，返回429时立即改发下一个端点（例如PTU溢出到按量付费部署）
+    """
+
+    def __init__(self, endpoints: List[Endpoint], policy: str = "round-robin"):
+        self.endpoints = endpoints
+        self.policy = policy
+        self.lock = threading.Lock()
+        self.next = 0
+
+    def choose(self) -> Endpoint:
+        with self.lock:
+            if self.policy == "spillover" or len(self.endpoints) == 1:
+                endpoint = self.endpoints[0]
+            elif self.policy == "least-outstanding":
+                endpoint = self._least(lambda e: (e.outstanding + 1) / e.weight)
+            elif self.policy == "latency":
+                known = [e.latency for e in self.endpoints if e.latency is not None]
+                default = sum(known) / len(known) if known else 0.0
+                endpoint = self._least(lambda e: (e.latency if e.latency is not None else default)
+                                       * (e.outstanding + 1) / e.weight)
+            else:
+                endpoint = self._weighted_round_robin()
+            endpoint.outstanding += 1
+            return endpoint
+
+    def spillover(self, endpoint: Endpoint, status_code: Optional[int]) -> Optional[Endpoint]:
+        """spillover策略下端点返回429时，返回溢出的下一个端点；没有可溢出的端点时返回None"""
+        if self.policy != "spillover" or status_code != 429:
+            return None
+        position = self.endpoints.index(endpoint)
+        if position + 1 >= len(self.endpoints):
+            return None
+        with self.lock:
+            target = self.endpoints[position + 1]
+            target.outstanding += 1
+            return target
+
+    def release(self, endpoint: Endpoint, result: Dict[str, Any]):
+        """一次尝试结束：减少在途请求数，用成功请求的延迟更新延迟估计"""
+        with self.lock:
+            endpoint.outstanding -= 1
+            if result["success"]:
+                if endpoint.latency is None:
+                    endpoint.latency = result["latency"]
+                else:
+                    endpoint.latency += LATENCY_EWMA_ALPHA * (result["latency"] - endpoint.latency)
+
+    def _least(self, score) -> Endpoint:
+        # 从轮转的起点开始比较，得分相同时各端点轮流被选中
+        count = len(self.endpoints)
+        candidates = [self.endpoints[(self.next + i) % count] for i in range(count)]
+        self.next = (self.next + 1) % count
+        return min(candidates, key=score)
+
+    def _weighted_round_robin(self) -> Endpoint:
+        total = 0.0
+        best = None
+        for endpoint in self.endpoints:
+            endpoint.current_weight += endpoint.weight
+            total += endpoint.weight
+            if best is None or endpoint.current_weight > best.current_weight:
+                best = endpoint
+        best.current_weight -= total
+        return best
@@ -260,6 +260,8 @@ def generate_unique_questions(count=1000):
     
     # Add specific technical questions first
     questions.extend(specific_questions)
+    # 用集合判断是否重复，避免在列表中线性查找
+    seen = set(questions)
     
     # Generate questions using templates
     remaining = count - len(questions)
@@ -291,7 +293,8 @@ def generate_unique_questions(count=1000):
             question = template
         
         # Add the question if it's unique
-        if question not in questions:
+        if question not in seen:
+            seen.add(question)
             questions.append(question)
     
     # Shuffle the questions to mix the specifically crafted ones with the generated ones
@@ -0,0 +1,205 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import bisect
+import json
+import math
+import random
+import sys
+import time
+from array import array
+from itertools import accumulate
+from typing import List, Dict, Iterator
+
+# 与mock_server.py的提示词token估算口径一致：约4个字符一个token
+CHARS_PER_TOKEN = 4
+
+# 上下文的最少token数
+MIN_CONTEXT_TOKENS = 8
+
+# 上下文语料的词表，都是常见的单token英文单词
+WORDS = (
+    "the", "system", "model", "request", "latency", "throughput", "cloud", "region", "data", "user",
+    "service", "cache", "queue", "token", "network", "storage", "cluster", "node", "memory", "disk",
+    "report", "customer", "order", "price", "market", "energy", "policy", "design", "team", "project",
+    "and", "with", "from", "after", "before", "because", "while", "during", "across", "within",
+    "increase", "reduce", "measure", "deploy", "scale", "monitor", "update", "review", "build", "test",
+    "fast", "slow", "large", "small", "stable", "recent", "daily", "average", "total", "peak",
+)
+
+TOPICS = (
+    "capacity planning", "error handling", "cost control", "data quality", "release process",
+    "incident response", "customer feedback", "resource usage", "traffic patterns", "team workflow",
+    "security review", "performance tuning", "storage growth", "network latency", "service reliability",
+)
+
+QUESTIONS = (
+    "Summarize the context above in three sentences.",
+    "List the key facts in the context above about {}.",
+    "What does the context above suggest about {}?",
+    "Identify any risks related to {} mentioned above.",
+    "Write a short report on {} based on the context above.",
+    "Explain the main trend in the context above and its impact on {}.",
+    "Extract every number-like statement about {} from the context above.",
+    "Propose two improvements to {} using the context above.",
+)
+
+
+def parse_size(text: str) -> int:
+    """解析128、1k、8k这样的token数"""
+    text = text.strip().lower()
+    if text.endswith("k"):
+        return int(float(text[:-1]) * 1024)
+    return int(text)
+
+
+def parse_mix(spec: str) -> List[tuple]:
+    """解析"128:5,1k:3,8k:2"这样的加权列表，返回[(标签, 数值, 权重)]；省略权重时为1"""
+    mix = []
+    for part in spec.split(","):
+        label, _, weight = part.strip().partition(":")
+        mix.append((label.strip().lower(), parse_size(label), float(weight) if weight else 1.0))
+    if any(size <= 0 or weight <= 0 for _, size, weight in mix):
+        raise ValueError(f"sizes and weights must be positive: {spec}")
+    return mix
+
+
+class WorkloadGenerator:
+    """按输入长度分布和输出长度上限生成不重复的提示词
+
+    上下文从一段预先生成的随机语料中按词边界截取，每条提示词只需一次字符串切片，百万条规模也只需数秒。
+    """
+
+    def __init__(self, input_mix: List[tuple], output_mix: List[tuple], distribution: str = "fixed",
+                 sigma: float = 1.0, max_input_tokens: int = 32768, seed: int = 0):
+        self.input_mix = input_mix
+        self.output_mix = output_mix
+        self.distribution = distribution
+        self.sigma = sigma
+        self.max_input_tokens = max_input_tokens
+        self.rng = random.Random(seed)
+        self.duplicates = 0
+        self.questions = [question.format(topic) for question in QUESTIONS for topic in TOPICS]
+
+        # 语料至少是最长上下文的两倍，保证截取位置足够分散
+        longest = max_input_tokens if distribution == "lognormal" else max(size for _, size, _ in input_mix)
+        word_count = max(1 << 20, 2 * longest * CHARS_PER_TOKEN // 5)
+        words = self.rng.choices(WORDS, k=word_count)
+        self.corpus = " ".join(words)
+        # 每个单词在语料中的起始字符位置
+        self.starts = array("q", accumulate((len(word) + 1 for word in words[:-1]), initial=0))
+
+    def pick(self, cum_weights: List[float]) -> int:
+        """按累计权重抽取一个档位的序号；比random.choices少一次列表分配"""
+        if len(cum_weights) == 1:
+            return 0
+        return bisect.bisect(cum_weights, self.rng.random() * cum_weights[-1])
+
+    def input_tokens(self, size: int) -> int:
+        if self.distribution == "lognormal":
+            # mu使均值等于size
+            value = self.rng.lognormvariate(math.log(size) - self.sigma ** 2 / 2, self.sigma)
+            return max(1, min(int(value), self.max_input_tokens))
+        return size
+
+    def context(self, tokens: int) -> str:
+        chars = tokens * CHARS_PER_TOKEN
+        begin = self.starts[int(self.rng.random() * len(self.starts))]
+        if begin + chars > len(self.corpus):
+            begin = self.starts[bisect.bisect_left(self.starts, max(0, len(self.corpus) - chars))]
+        end = bisect.bisect_left(self.starts, begin + chars)
+        return self.corpus[begin:self.starts[end] - 1 if end < len(self.starts) else len(self.corpus)]
+
+    def prompt(self, tokens: int) -> str:
+        question = self.questions[int(self.rng.random() * len(self.questions))]
+        # 问题本身也占token；上下文至少保留几个词，避免很短的提示词大量重复
+        context_tokens = max(MIN_CONTEXT_TOKENS, tokens - (len(question) + 20) // CHARS_PER_TOKEN)
+        return f"Context:\n{self.context(context_tokens)}\n\nQuestion: {question}"
+
+    def records(self, count: int) -> Iterator[tuple]:
+        """逐条生成(提示词, max_tokens, tag)，tag为输入/输出长度档位"""
+        input_weights = list(accumulate(weight for _, _, weight in self.input_mix))
+        output_weights = list(accumulate(weight for _, _, weight in self.output_mix))
+        # 只保存提示词的哈希值，避免在内存中保留百万条长文本
+        seen = set()
+        produced = 0
+        attempts = 0
+        while produced < count:
+            attempts += 1
+            if attempts > 10 * count + 1000:
+                raise RuntimeError(f"could not generate {count} unique prompts; try a larger size or another seed")
+            input_label, input_size, _ = self.input_mix[self.pick(input_weights)]
+            output_label, max_tokens, _ = self.output_mix[self.pick(output_weights)]
+            prompt = self.prompt(self.input_tokens(input_size))
+            key = hash(prompt)
+            if key in seen:
+                self.duplicates += 1
+                continue
+            seen.add(key)
+            produced += 1
+            yield prompt, max_tokens, f"in{input_label}_out{output_label}"
+
+
+def trace_line(prompt: str, max_tokens: int, tag: str) -> str:
+    """输出一行trace记录（与main.py --replay的格式一致）
+
+    提示词只由WORDS、QUESTIONS和换行组成，转义换行即是合法的JSON字符串，比json.dumps快数倍。
+    """
+    content = prompt.replace("\n", "\\n")
+    return (f'{{"messages": [{{"role": "user", "content": "{content}"}}], '
+            f'"max_tokens": {max_tokens}, "tag": {json.dumps(tag)}}}\n')
+
+
+def main(args):
+    try:
+        input_mix = parse_mix(args.input_tokens)
+        output_mix = parse_mix(args.max_tokens)
+    except ValueError as e:
+        print(f"Error: {e}")
+        sys.exit(1)
+
+    start = time.perf_counter()
+    generator = WorkloadGenerator(input_mix, output_mix, args.input_distribution, args.input_sigma,
+                                  parse_size(args.max_input_tokens), args.seed)
+    tags: Dict[str, int] = {}
+    total_chars = 0
+    with open(args.output, "w", encoding="utf-8") as f:
+        for prompt, max_tokens, tag in generator.records(args.count):
+            f.write(trace_line(prompt, max_tokens, tag))
+            tags[tag] = tags.get(tag, 0) + 1
+            total_chars += len(prompt)
+    elapsed = time.perf_counter() - start
+
+    print(f"Generated {args.count} unique prompts in {elapsed:.2f}s ({args.count / elapsed:.0f}/s) "
+          f"and saved to {args.output}")
+    print(f"Average input length: ~{total_chars / max(1, args.count) / CHARS_PER_TOKEN:.0f} tokens; "
+          f"duplicates skipped: {generator.duplicates}")
+    for tag, count in sorted(tags.items()):
+        print(f"  {tag}: {count}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic JSONL workload for main.py --replay")
+    parser.add_argument("--count", type=int, default=1000,
+                        help="Number of unique prompts to generate")
+    parser.add_argument("--output", type=str, default="workload.jsonl",
+                        help="Output JSONL file (one trace record per line)")
+    parser.add_argument("--input-tokens", type=str, default="1k",
+                        help="Input length in tokens, or a weighted mix such as '128:5,1k:3,8k:2'")
+    parser.add_argument("--input-distribution", choices=["fixed", "lognormal"], default="fixed",
+                        help="Use each input length exactly, or as the mean of a lognormal distribution")
+    parser.add_argument("--input-sigma", type=float, default=1.0,
+                        help="Sigma of the lognormal input length distribution")
+    parser.add_argument("--max-input-tokens", type=str, default="32k",
+                        help="Upper bound on lognormal input lengths")
+    parser.add_argument("--max-tokens", type=str, default="1000",
+                        help="max_tokens for each request, or a weighted mix such as '256:1,2k:1'")
+    parser.add_argument("--seed", type=int, default=0,
+                        help="Random seed; the same seed and options produce the same workload")
+
+    args = parser.parse_args()
+    if args.count <= 0:
+        print("Error: --count must be positive")
+        sys.exit(1)
+    main(args)
@@ -0,0 +1,126 @@
+import os
+import socket
+import threading
+import time
+import urllib.request
+import weakref
+from typing import Dict, Any
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+from urllib3.exceptions import ConnectTimeoutError
+
+# 当前线程正在进行的请求的连接阶段耗时
+_timing = threading.local()
+
+# 所有已建立的连接，取消运行时用于中断阻塞在读取上的请求
+_connections: "weakref.WeakSet" = weakref.WeakSet()
+
+
+def start_timing() -> Dict[str, Any]:
+    """在发送请求前调用，返回本次请求的连接阶段耗时记录"""
+    _timing.phases = {}
+    return _timing.phases
+
+
+def _phases() -> Dict[str, Any]:
+    phases = getattr(_timing, "phases", None)
+    return phases if phases is not None else {}
+
+
+class _TimedConnectionMixin:
+    """记录新建连接时DNS解析、TCP连接和TLS握手的耗时；复用的连接不会调用connect()"""
+
+    def _new_conn(self) -> socket.socket:
+        phases = _phases()
+        dns_host = self._dns_host
+
+        # 先单独解析DNS，再用解析出的地址建立TCP连接，这样两段时间可以分开统计
+        dns_start = time.perf_counter()
+        try:
+            addresses = socket.getaddrinfo(dns_host, self.port, type=socket.SOCK_STREAM)
+        except socket.gaierror:
+            return super()._new_conn()
+        phases["dns_time"] = time.perf_counter() - dns_start
+
+        # 与urllib3的create_connection一样依次尝试解析出的各个地址（例如IPv6不可达时改用IPv4），
+        # connect_time为最终连接成功的那次尝试的耗时
+        error = None
+        for _, _, _, _, sockaddr in addresses:
+            connect_start = time.perf_counter()
+            self._dns_host = sockaddr[0]
+            try:
+                sock = super()._new_conn()
+            except ConnectTimeoutError as e:
+                # NewConnectionError也是ConnectTimeoutError的子类
+                error = e
+                continue
+            finally:
+                self._dns_host = dns_host
+            phases["connect_time"] = time.perf_counter() - connect_start
+            return sock
+        raise error
+
+    def connect(self):
+        phases = _phases()
+        start = time.perf_counter()
+        super().connect()
+        # 对HTTPS连接，connect()的剩余时间即TLS握手时间
+        if isinstance(self, HTTPSConnection):
+            phases["tls_time"] = time.perf_counter() - start - phases.get("dns_time", 0.0) - phases.get("connect_time", 0.0)
+        phases["new_connection"] = True
+        _connections.add(self)
+
+
+class TimedHTTPConnection(_TimedConnectionMixin, HTTPConnection):
+    pass
+
+
+class TimedHTTPSConnection(_TimedConnectionMixin, HTTPSConnection):
+    pass
+
+
+class TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = TimedHTTPConnection
+
+
+class TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """使用带计时连接类的HTTPAdapter"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            "http": TimedHTTPConnectionPool,
+            "https": TimedHTTPSConnectionPool,
+        }
+
+
+def abort_connections():
+    """关闭所有连接的套接字，阻塞在等待响应上的线程立即收到连接错误；用于取消整次运行的在途请求"""
+    for connection in list(_connections):
+        sock = getattr(connection, "sock", None)
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def create_session(pool_size: int) -> requests.Session:
+    """创建保持长连接的共享Session，连接池大小与并发数一致"""
+    session = requests.Session()
+    adapter = TimedHTTPAdapter(pool_connections=4, pool_maxsize=max(1, pool_size))
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # requests默认在每次请求时重新扫描环境变量查找代理、CA证书和netrc（trust_env），每个请求要多花约0.1毫秒CPU；
+    # 没有配置代理时在这里读取一次CA证书设置即可。配置了代理时保留默认行为，以便按no_proxy决定是否绕过代理
+    if not urllib.request.getproxies():
+        session.trust_env = False
+        session.verify = os.environ.get("REQUESTS_CA_BUNDLE") or os.environ.get("CURL_CA_BUNDLE") or True
+    return session
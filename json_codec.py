@@ -0,0 +1,23 @@
+import json
+
+# orjson是可选依赖（pip install orjson），编码和解码都比标准库快数倍；未安装时使用标准库json
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+JSON_BACKEND = "orjson" if orjson else "json"
+
+
+def dumps(obj) -> bytes:
+    """编码为紧凑的UTF-8 JSON字节串，可直接作为请求体发送"""
+    if orjson:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def loads(data):
+    """解码JSON；接受bytes或str"""
+    if orjson:
+        return orjson.loads(data)
+    return json.loads(data)
@@ -0,0 +1,282 @@
+import math
+import threading
+from typing import Dict, Any, Optional
+
+# HDR风格的对数-线性分桶：每个2的幂区间再等分为64个子桶，相对误差约0.8%
+SUB_BUCKET_BITS = 7
+SUB_BUCKET_COUNT = 1 << SUB_BUCKET_BITS
+SUB_BUCKET_HALF = SUB_BUCKET_COUNT // 2
+# 以微秒记录，最大可区分约2^48微秒，更大的值计入最后一个桶；
+# 用于token数、限流余量等计数时可表示到约2.8亿
+MAX_VALUE_BITS = 48
+BUCKET_COUNT = SUB_BUCKET_COUNT + (MAX_VALUE_BITS - SUB_BUCKET_BITS) * SUB_BUCKET_HALF
+
+PERCENTILES = [("p50", 50.0), ("p90", 90.0), ("p95", 95.0), ("p99", 99.0), ("p99.9", 99.9)]
+
+
+def _bucket_index(value: int) -> int:
+    """把微秒值映射到桶下标"""
+    if value < SUB_BUCKET_COUNT:
+        return value
+    shift = value.bit_length() - SUB_BUCKET_BITS
+    index = SUB_BUCKET_COUNT + (shift - 1) * SUB_BUCKET_HALF + ((value >> shift) - SUB_BUCKET_HALF)
+    return min(index, BUCKET_COUNT - 1)
+
+
+def _bucket_midpoint(index: int) -> float:
+    """返回桶所代表的微秒值（取区间中点）"""
+    if index < SUB_BUCKET_COUNT:
+        return float(index)
+    shift = (index - SUB_BUCKET_COUNT) // SUB_BUCKET_HALF + 1
+    mantissa = (index - SUB_BUCKET_COUNT) % SUB_BUCKET_HALF + SUB_BUCKET_HALF
+    low = mantissa << shift
+    high = ((mantissa + 1) << shift) - 1
+    return (low + high) / 2
+
+
+def shift_start(result: Dict[str, Any], seconds: float) -> Dict[str, Any]:
+    """把结果中各时间指标的起点提前seconds秒（例如改为从计划发送时间或首次尝试开始计时）"""
+    for name in ("latency", "ttft", "ttlt", "time_to_answer"):
+        if result.get(name) is not None:
+            result[name] += seconds
+    return result
+
+
+class LatencyHistogram:
+    """固定内存、可合并的延迟直方图（单位：秒，也可用于其他正数指标）"""
+
+    def __init__(self):
+        self.counts = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+        self.min: Optional[float] = None
+        self.max: Optional[float] = None
+
+    def record(self, seconds: float, count: int = 1):
+        """记录一个延迟值；count大于1时表示同一个值出现了count次"""
+        micros = max(0, int(seconds * 1_000_000))
+        self.counts[_bucket_index(micros)] += count
+        self.count += count
+        self.total += seconds * count
+        if self.min is None or seconds < self.min:
+            self.min = seconds
+        if self.max is None or seconds > self.max:
+            self.max = seconds
+
+    def merge(self, other: "LatencyHistogram"):
+        """合并另一个直方图（例如来自其他线程、进程或运行片段）"""
+        for index, value in enumerate(other.counts):
+            if value:
+                self.counts[index] += value
+        self.count += other.count
+        self.total += other.total
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        if other.max is not None and (self.max is None or other.max > self.max):
+            self.max = other.max
+
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, percentile: float) -> float:
+        """返回给定百分位的延迟（秒），结果限制在[min, max]内"""
+        if not self.count:
+            return 0.0
+        # 最近秩法：第ceil(p% * N)个样本
+        target = min(max(1, math.ceil(percentile / 100.0 * self.count)), self.count)
+        seen = 0
+        for index, value in enumerate(self.counts):
+            seen += value
+            if seen >= target:
+                seconds = _bucket_midpoint(index) / 1_000_000
+                return min(max(seconds, self.min), self.max)
+        return self.max
+
+    def count_at_or_below(self, seconds: float) -> int:
+        """返回不超过给定值的记录数（按桶精度近似）"""
+        limit = _bucket_index(max(0, int(seconds * 1_000_000)))
+        return sum(self.counts[:limit + 1])
+
+    def summary(self) -> Dict[str, float]:
+        """返回min/mean/p50/p90/p95/p99/p99.9/max"""
+        result = {
+            "count": self.count,
+            "min": self.min or 0.0,
+            "mean": self.mean(),
+        }
+        for name, percentile in PERCENTILES:
+            result[name] = self.percentile(percentile)
+        result["max"] = self.max or 0.0
+        return result
+
+    def to_dict(self) -> Dict[str, Any]:
+        """序列化为稀疏的JSON友好格式"""
+        return {
+            "counts": {str(i): c for i, c in enumerate(self.counts) if c},
+            "count": self.count,
+            "total": self.total,
+            "min": self.min,
+            "max": self.max,
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "LatencyHistogram":
+        histogram = cls()
+        for index, value in data["counts"].items():
+            histogram.counts[int(index)] = value
+        histogram.count = data["count"]
+        histogram.total = data["total"]
+        histogram.min = data["min"]
+        histogram.max = data["max"]
+        return histogram
+
+
+class BenchmarkStats:
+    """线程安全的请求计数与延迟分布汇总"""
+
+    # 结果字典中需要进入直方图的字段（输出速度单位为token/s，*_tokens为token数，其余为秒）
+    DISTRIBUTION_FIELDS = (
+        "latency", "ttft", "itl", "ttlt", "output_tokens_per_second",
+        "dns_time", "connect_time", "tls_time", "headers_time", "download_time",
+        "schedule_lag", "service_time", "first_attempt_latency", "rate_limit_wait",
+        "prompt_tokens", "completion_tokens", "reasoning_tokens", "time_to_answer", "reasoning_time",
+        "spillover_time", "cached_tokens",
+        "server_time", "network_overhead", "ratelimit_remaining_requests", "ratelimit_remaining_tokens",
+    )
+    # 按这些字段的取值分组统计（例如trace回放中的tag、多端点路由的端点、响应头中的区域、多轮会话的轮次和上下文区间），
+    # 每组是一个独立的BenchmarkStats
+    GROUP_FIELDS = ("tag", "endpoint", "region", "turn", "context_bucket")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.num_requests = 0
+        self.successful_requests = 0
+        self.total_tokens = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.reasoning_tokens = 0
+        self.new_connections = 0
+        # 没有收到响应（连接失败、超时）的请求不知道是否复用了连接，不计入这两项
+        self.reused_connections = 0
+        self.retries = 0
+        self.throttled = 0
+        # 超过请求时限的请求按类型（connect/read/total）计数，同时计为失败的请求
+        self.timeouts: Dict[str, int] = {}
+        # 运行停止时被取消的在途请求，不计入请求数
+        self.cancelled = 0
+        # 开环长时间运行中，等待发送的时间超过上限而放弃发送的请求，不计入请求数
+        self.missed = 0
+        self.histograms = {name: LatencyHistogram() for name in self.DISTRIBUTION_FIELDS}
+        self.groups: Dict[str, Dict[str, "BenchmarkStats"]] = {}
+
+    def group(self, field: str, value: str) -> "BenchmarkStats":
+        with self.lock:
+            groups = self.groups.setdefault(field, {})
+            if value not in groups:
+                groups[value] = BenchmarkStats()
+            return groups[value]
+
+    def record(self, result: Dict[str, Any]):
+        """记录单个请求的结果；延迟分布只统计成功的请求，被取消的请求只计数"""
+        if result.get("cancelled"):
+            with self.lock:
+                self.cancelled += 1
+            return
+        for field in self.GROUP_FIELDS:
+            if result.get(field) is not None:
+                self.group(field, str(result[field]))._record(result)
+        self._record(result)
+
+    def record_missed(self):
+        with self.lock:
+            self.missed += 1
+
+    def _record(self, result: Dict[str, Any]):
+        with self.lock:
+            self.num_requests += 1
+            if result.get("connection_reused") is False:
+                self.new_connections += 1
+            elif result.get("connection_reused") is True:
+                self.reused_connections += 1
+            self.retries += max(0, result.get("attempts", 1) - 1)
+            self.throttled += result.get("throttled_attempts", 0)
+            if result.get("timeout"):
+                self.timeouts[result["timeout"]] = self.timeouts.get(result["timeout"], 0) + 1
+            if not result["success"]:
+                return
+            self.successful_requests += 1
+            if result.get("usage"):
+                self.total_tokens += result["usage"]
+            self.prompt_tokens += result.get("prompt_tokens") or 0
+            self.completion_tokens += result.get("completion_tokens") or 0
+            self.reasoning_tokens += result.get("reasoning_tokens") or 0
+            for name in self.DISTRIBUTION_FIELDS:
+                if result.get(name) is not None:
+                    self.histograms[name].record(result[name])
+
+    def merge(self, other: "BenchmarkStats"):
+        with self.lock:
+            self.num_requests += other.num_requests
+            self.successful_requests += other.successful_requests
+            self.total_tokens += other.total_tokens
+            self.prompt_tokens += other.prompt_tokens
+            self.completion_tokens += other.completion_tokens
+            self.reasoning_tokens += other.reasoning_tokens
+            self.new_connections += other.new_connections
+            self.reused_connections += other.reused_connections
+            self.retries += other.retries
+            self.throttled += other.throttled
+            for kind, count in other.timeouts.items():
+                self.timeouts[kind] = self.timeouts.get(kind, 0) + count
+            self.cancelled += other.cancelled
+            self.missed += other.missed
+            for name, histogram in other.histograms.items():
+                self.histograms.setdefault(name, LatencyHistogram()).merge(histogram)
+        for field, groups in other.groups.items():
+            for value, stats in groups.items():
+                self.group(field, value).merge(stats)
+
+    def summary(self, name: str = "latency") -> Dict[str, float]:
+        return self.histograms[name].summary()
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "num_requests": self.num_requests,
+            "successful_requests": self.successful_requests,
+            "total_tokens": self.total_tokens,
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "reasoning_tokens": self.reasoning_tokens,
+            "new_connections": self.new_connections,
+            "reused_connections": self.reused_connections,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "timeouts": dict(self.timeouts),
+            "cancelled": self.cancelled,
+            "missed": self.missed,
+            "histograms": {name: h.to_dict() for name, h in self.histograms.items()},
+            "groups": {field: {value: stats.to_dict() for value, stats in groups.items()}
+                       for field, groups in self.groups.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "BenchmarkStats":
+        stats = cls()
+        stats.num_requests = data["num_requests"]
+        stats.successful_requests = data["successful_requests"]
+        stats.total_tokens = data["total_tokens"]
+        stats.prompt_tokens = data.get("prompt_tokens", 0)
+        stats.completion_tokens = data.get("completion_tokens", 0)
+        stats.reasoning_tokens = data.get("reasoning_tokens", 0)
+        stats.new_connections = data.get("new_connections", 0)
+        stats.reused_connections = data.get("reused_connections", 0)
+        stats.retries = data.get("retries", 0)
+        stats.throttled = data.get("throttled", 0)
+        stats.timeouts = dict(data.get("timeouts", {}))
+        stats.cancelled = data.get("cancelled", 0)
+        stats.missed = data.get("missed", 0)
+        for name, histogram in data["histograms"].items():
+            stats.histograms[name] = LatencyHistogram.from_dict(histogram)
+        for field, groups in data.get("groups", {}).items():
+            stats.groups[field] = {value: cls.from_dict(group) for value, group in groups.items()}
+        return stats
@@ -0,0 +1,251 @@
+import json
+import threading
+import time
+from collections import deque
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from typing import Dict, Any, Optional
+
+from latency_stats import LatencyHistogram
+
+# 仪表盘显示最近多少个1秒窗口
+DASHBOARD_WINDOWS = 10
+
+# 响应头中的限流余量：结果字段 -> 时间序列和Prometheus中的名称
+REMAINING_FIELDS = {"ratelimit_remaining_requests": "requests", "ratelimit_remaining_tokens": "tokens"}
+
+
+def error_class(result: Dict[str, Any]) -> Optional[str]:
+    """把失败的请求归类：timeout（超过请求时限）、cancelled（运行停止时被取消）、throttled（429）、
+    server_error（5xx）、client_error（其他4xx）、connection（无响应）"""
+    if result["success"]:
+        return None
+    if result.get("timeout"):
+        return "timeout"
+    if result.get("cancelled"):
+        return "cancelled"
+    status_code = result.get("status_code")
+    if status_code is None:
+        return "connection"
+    if status_code == 429:
+        return "throttled"
+    if status_code >= 500:
+        return "server_error"
+    return "client_error"
+
+
+class Window:
+    """一个1秒窗口内的计数和延迟分布"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.started = 0
+        self.completed = 0
+        self.errors: Dict[str, int] = {}
+        self.completion_tokens = 0
+        self.total_tokens = 0
+        self.latency = LatencyHistogram()
+        # 窗口内响应头报告的最小限流余量，即这一秒内离PTU限额最近的时刻
+        self.remaining: Dict[str, float] = {}
+
+    def snapshot(self, in_flight: int, start_timestamp: float) -> Dict[str, Any]:
+        latency = self.latency.summary()
+        return {
+            "timestamp": round(start_timestamp + self.index, 3),
+            "second": self.index,
+            "started": self.started,
+            "completed": self.completed,
+            "in_flight": in_flight,
+            "errors": dict(self.errors),
+            "output_tokens_per_second": self.completion_tokens,
+            "tokens_per_second": self.total_tokens,
+            "latency": {name: round(latency[name], 4) for name in ("p50", "p90", "p99", "max")} if self.latency.count else None,
+            "ratelimit_remaining": dict(self.remaining) if self.remaining else None,
+        }
+
+
+class LiveMetrics:
+    """运行期间按1秒窗口统计请求速率、在途请求数、各类错误、token速度和延迟分位数
+
+    每个窗口结束时写入时间序列文件；可选地通过/metrics以Prometheus文本格式暴露，或在终端刷新显示。
+    """
+
+    def __init__(self, timeseries_file: Optional[str] = None, metrics_port: Optional[int] = None,
+                 dashboard: bool = False, metrics_host: str = "127.0.0.1"):
+        self.timeseries_file = timeseries_file
+        self.dashboard = dashboard
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.start_timestamp = time.time()
+        self.current = Window(0)
+        self.recent: deque = deque(maxlen=DASHBOARD_WINDOWS)
+        self.in_flight = 0
+        # 累计值，用于Prometheus计数器
+        self.started_total = 0
+        self.completed_total = 0
+        self.errors_total: Dict[str, int] = {}
+        self.tokens_total = {"prompt": 0, "completion": 0}
+        self.latency_sum = 0.0
+        self.stopped = threading.Event()
+
+        self.series = open(timeseries_file, "a", encoding="utf-8") if timeseries_file else None
+        self.server = None
+        if metrics_port:
+            # 默认只监听本机；需要从其他主机抓取时由--metrics-host显式指定
+            self.server = ThreadingHTTPServer((metrics_host, metrics_port), self._handler())
+            threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.thread = threading.Thread(target=self._tick, daemon=True)
+        self.thread.start()
+
+    def started(self):
+        with self.lock:
+            self.in_flight += 1
+            self.started_total += 1
+            self.current.started += 1
+
+    def completed(self, result: Dict[str, Any]):
+        """记录一个完成的请求（包括重试和限速等待在内的总耗时）"""
+        error = error_class(result)
+        with self.lock:
+            self.in_flight -= 1
+            self.completed_total += 1
+            window = self.current
+            window.completed += 1
+            # 被限流的响应同样带有余量响应头
+            for field, name in REMAINING_FIELDS.items():
+                value = result.get(field)
+                if value is not None and (name not in window.remaining or value < window.remaining[name]):
+                    window.remaining[name] = value
+            if error:
+                window.errors[error] = window.errors.get(error, 0) + 1
+                self.errors_total[error] = self.errors_total.get(error, 0) + 1
+                return
+            window.latency.record(result["latency"])
+            self.latency_sum += result["latency"]
+            window.completion_tokens += result.get("completion_tokens") or 0
+            window.total_tokens += result.get("usage") or 0
+            self.tokens_total["prompt"] += result.get("prompt_tokens") or 0
+            self.tokens_total["completion"] += result.get("completion_tokens") or 0
+
+    def close(self):
+        """停止统计线程，写出最后一个不完整的窗口"""
+        self.stopped.set()
+        self.thread.join()
+        self._rotate()
+        if self.series:
+            self.series.close()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+
+    def _tick(self):
+        # 窗口边界对齐到开始时间后的整秒，避免sleep误差累积
+        while not self.stopped.wait(max(0.0, self.start + self.current.index + 1 - time.perf_counter())):
+            self._rotate()
+            if self.dashboard:
+                self._render()
+
+    def _rotate(self):
+        with self.lock:
+            window = self.current
+            self.current = Window(window.index + 1)
+            snapshot = window.snapshot(self.in_flight, self.start_timestamp)
+            self.recent.append(snapshot)
+        if self.series:
+            self.series.write(json.dumps(snapshot, ensure_ascii=False) + "\n")
+            self.series.flush()
+
+    def _render(self):
+        with self.lock:
+            windows = list(self.recent)
+            totals = (self.started_total, self.completed_total, dict(self.errors_total), self.in_flight)
+        started_total, completed_total, errors_total, in_flight = totals
+        last = windows[-1]
+        lines = [
+            f"=== Live Benchmark Metrics (t={last['second'] + 1}s) ===",
+            f"Started: {started_total} | Completed: {completed_total} | In flight: {in_flight}",
+            f"Errors: {', '.join(f'{name} {count}' for name, count in sorted(errors_total.items())) or 'none'}",
+            "",
+            f"{'second':>6} | {'started':>7} | {'done':>5} | {'errors':>6} | {'out tok/s':>9} | "
+            f"{'p50':>7} | {'p90':>7} | {'p99':>7}",
+        ]
+        for window in windows:
+            latency = window["latency"] or {"p50": 0.0, "p90": 0.0, "p99": 0.0}
+            lines.append(f"{window['second']:>6} | {window['started']:>7} | {window['completed']:>5} | "
+                         f"{sum(window['errors'].values()):>6} | {window['output_tokens_per_second']:>9} | "
+                         f"{latency['p50']:>6.3f}s | {latency['p90']:>6.3f}s | {latency['p99']:>6.3f}s")
+        # 清屏后从左上角重新绘制
+        print("\033[H\033[J" + "\n".join(lines), flush=True)
+
+    def prometheus(self) -> str:
+        """Prometheus文本格式；延迟分位数取最近一个完整的1秒窗口"""
+        with self.lock:
+            last = self.recent[-1] if self.recent else None
+            lines = [
+                "# HELP benchmark_requests_started_total Requests started by the benchmark client.",
+                "# TYPE benchmark_requests_started_total counter",
+                f"benchmark_requests_started_total {self.started_total}",
+                "# HELP benchmark_requests_completed_total Requests completed, successful or not.",
+                "# TYPE benchmark_requests_completed_total counter",
+                f"benchmark_requests_completed_total {self.completed_total}",
+                "# HELP benchmark_requests_failed_total Failed requests by error class.",
+                "# TYPE benchmark_requests_failed_total counter",
+            ]
+            lines.extend(f'benchmark_requests_failed_total{{class="{name}"}} {count}'
+                         for name, count in sorted(self.errors_total.items()))
+            lines.extend([
+                "# HELP benchmark_requests_in_flight Requests currently in flight.",
+                "# TYPE benchmark_requests_in_flight gauge",
+                f"benchmark_requests_in_flight {self.in_flight}",
+                "# HELP benchmark_tokens_total Tokens of successful requests by type.",
+                "# TYPE benchmark_tokens_total counter",
+            ])
+            lines.extend(f'benchmark_tokens_total{{type="{name}"}} {count}'
+                         for name, count in self.tokens_total.items())
+            lines.extend([
+                "# HELP benchmark_request_latency_seconds Latency of successful requests (quantiles over the last second).",
+                "# TYPE benchmark_request_latency_seconds summary",
+            ])
+            if last and last["latency"]:
+                for name, quantile in (("p50", "0.5"), ("p90", "0.9"), ("p99", "0.99")):
+                    lines.append(f'benchmark_request_latency_seconds{{quantile="{quantile}"}} {last["latency"][name]}')
+            successful = self.completed_total - sum(self.errors_total.values())
+            lines.append(f"benchmark_request_latency_seconds_sum {self.latency_sum:.6f}")
+            lines.append(f"benchmark_request_latency_seconds_count {successful}")
+            if last:
+                lines.extend([
+                    "# HELP benchmark_window_completed_per_second Requests completed in the last second.",
+                    "# TYPE benchmark_window_completed_per_second gauge",
+                    f"benchmark_window_completed_per_second {last['completed']}",
+                    "# HELP benchmark_window_output_tokens_per_second Output tokens completed in the last second.",
+                    "# TYPE benchmark_window_output_tokens_per_second gauge",
+                    f"benchmark_window_output_tokens_per_second {last['output_tokens_per_second']}",
+                ])
+                if last["ratelimit_remaining"]:
+                    lines.extend([
+                        "# HELP benchmark_ratelimit_remaining Lowest rate-limit remaining value reported by response headers in the last second.",
+                        "# TYPE benchmark_ratelimit_remaining gauge",
+                    ])
+                    lines.extend(f'benchmark_ratelimit_remaining{{type="{name}"}} {value:g}'
+                                 for name, value in sorted(last["ratelimit_remaining"].items()))
+        return "\n".join(lines) + "\n"
+
+    def _handler(self):
+        metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        return MetricsHandler
+
@@ -1,13 +1,39 @@
 import argparse
+import copy
 import json
+import secrets
+import sys
 import time
 import concurrent.futures
-import threading
 from typing import List, Dict, Any
 import os
 import dotenv
 
 import requests
+import urllib3
+
+from latency_stats import BenchmarkStats, shift_start
+from open_loop import run_benchmark_open_loop, run_schedule
+from trace_replay import trace_schedule, count_trace
+from sweep import parse_sweep, max_level, step_metrics, run_sweep, format_step, format_header
+from http_pool import create_session, start_timing, abort_connections
+from deadlines import RequestTimeouts, DeadlineExceeded, RunControl, STOP_REASONS
+import json_codec
+from sse_stream import SSEStreamParser
+from token_usage import split_reasoning, token_breakdown
+from throttling import RetryPolicy, ClientRateLimiter, parse_retry_after
+from result_writer import ResultWriter, read_records
+from live_metrics import LiveMetrics
+from checkpoint import create_checkpoint, load_checkpoint, start_segment, finish_segment, restore_progress, segment_lines
+from distributed import (serve_worker, start_local_workers, stop_local_workers, split_evenly, run_coordinator,
+                         WORKER_TOKEN_ENV)
+from endpoint_router import Endpoint, EndpointRouter, ROUTING_POLICIES, load_endpoints
+from response_headers import DEFAULT_CAPTURE_HEADERS, parse_capture_headers, header_fields
+from soak import parse_duration, soak_schedule, SoakMonitor, soak_lines
+from sessions import build_conversations, run_conversations, session_rows, session_lines
+from warmup import parse_warmup, warmup_schedule, RampUp, phase_lines
+from prefix_cache import (parse_prefix_sizes, prefix_cache_items, priming_items, prefix_messages, prefix_cache_rows,
+                          prefix_cache_lines)
 
 # Load environment variables from .env file
 dotenv.load_dotenv()
@@ -18,8 +44,18 @@ model_name = os.getenv("AZURE_MODEL_NAME")
 api_version = os.getenv("AZURE_API_VERSION")
 key = os.getenv("AZURE_API_KEY")
 
+def configured_endpoints(path: str = None) -> List[Endpoint]:
+    """--endpoints指定的端点列表；未指定时为.env中配置的单个端点，列表文件中省略的字段也使用.env中的配置"""
+    if not path:
+        return [Endpoint(model_name, endpoint, model_name, api_version, key)]
+    defaults = {"endpoint": endpoint, "model": model_name, "api_version": api_version, "api_key": key}
+    return load_endpoints(path, defaults)
+
 system_prompt = "You are a helpful assistant. Please provide clear and concise answers."
 
+# 流式请求需要显式要求返回usage，Azure OpenAI才会在最后一个数据块中附带token用量
+STREAM_OPTIONS = {"stream": True, "stream_options": {"include_usage": True}}
+
 # 测试问题列表 - 从文件加载
 def load_test_questions():
     """从JSON文件加载测试问题"""
@@ -51,45 +87,77 @@ def load_test_questions():
             "How does version control help in software development?"
         ]
 
+# 分析已有结果的子命令不发送请求，也不需要加载测试问题：
+# python main.py analyze [文件...]汇总和对比历史运行，python main.py compare A B对两次运行做统计检验
+if __name__ == "__main__" and sys.argv[1:2] == ["analyze"]:
+    import analyze_results
+    analyze_results.main(sys.argv[2:])
+    sys.exit(0)
+if __name__ == "__main__" and sys.argv[1:2] == ["compare"]:
+    import compare_runs
+    compare_runs.main(sys.argv[2:])
+    sys.exit(0)
+
 # 加载测试问题
 test_questions = load_test_questions()
 print(f"Loaded {len(test_questions)} test questions.")
 
 class AzureAIBenchmark:
-    def __init__(self):
+    def __init__(self, stream: bool = False, pool_size: int = 1, retry_policy: RetryPolicy = None,
+                 rate_limiter: ClientRateLimiter = None, metrics: LiveMetrics = None, router: EndpointRouter = None,
+                 capture_headers: List[str] = None, timeouts: RequestTimeouts = None, control: RunControl = None):
         """Initialize benchmark for HTTP-only requests (SDK doesn't support PTU endpoints)"""
-        pass
+        self.stream = stream
+        self.pool_size = pool_size
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics
+        self.router = router or EndpointRouter(configured_endpoints())
+        # 每个请求记录的响应头（限流余量、区域、请求ID、服务端处理时间）
+        self.capture_headers = list(DEFAULT_CAPTURE_HEADERS) if capture_headers is None else capture_headers
+        # 为True时不输出逐请求的进度（例如长时间运行时改为按窗口输出）
+        self.quiet = False
+        # 单个请求的连接、读取和总时限；整次运行的时限和中断由control控制，取消时关闭正在使用的连接
+        self.timeouts = timeouts or RequestTimeouts()
+        self.control = control or RunControl()
+        self.control.on_cancel(abort_connections)
+        # 所有请求共享一个保持长连接的连接池，避免每次都重新进行DNS/TCP/TLS握手
+        self.session = create_session(pool_size)
+        # 问题文本 -> (编码后的请求体, 估算token数)；每个问题只构造和编码一次
+        self.encoded: Dict[str, tuple] = {}
     
     def test_connection(self) -> bool:
-        """测试连接和认证"""
-        try:
-            url = f"{endpoint}/openai/deployments/{model_name}/chat/completions?api-version={api_version}"
-            headers = {
-                "Content-Type": "application/json",
-                "api-key": key
-            }
+        """测试每个端点的连接和认证"""
+        payload = {
+            "messages": [{"role": "user", "content": "Hello"}],
+            "max_tokens": 10
+        }
+        passed = True
+        for target in self.router.endpoints:
+            try:
+                response = self.session.post(target.url, headers=target.headers, json=payload,
+                                             timeout=(self.timeouts.connect, self.timeouts.read))
+                if response.status_code != 200:
+                    print(f"Connection test failed for {target.name}: HTTP {response.status_code}")
+                    passed = False
+            except Exception as e:
+                print(f"Connection test failed for {target.name}: {e}")
+                passed = False
+        return passed
+    
+    def build_payload(self, question) -> Dict[str, Any]:
+        """构造chat completions请求体；question为trace中的请求时使用其中的messages和采样参数"""
+        if isinstance(question, dict):
+            # 前缀缓存实验的请求只保存问题和前缀长度，消息在这里才拼接
+            messages = question["messages"] if "messages" in question else prefix_messages(question, system_prompt)
             payload = {
-                "messages": [{"role": "user", "content": "Hello"}],
-                "max_tokens": 10
+                "messages": messages,
+                "max_tokens": question.get("max_tokens", 2048),
+                "temperature": question.get("temperature", 0.7)
             }
-            response = requests.post(url, headers=headers, json=payload)
-            return response.status_code == 200
-        except Exception as e:
-            print(f"Connection test failed: {e}")
-            return False
-    
-
-
-    
-    def single_request_http(self, question: str) -> Dict[str, Any]:
-        """使用HTTP直接请求进行单个请求"""
-        deployment_endpoint = f"{endpoint}/openai/deployments/{model_name}/chat/completions?api-version={api_version}"
-        
-        headers = {
-            "Content-Type": "application/json",
-            "api-key": key
-        }
-        
+            if self.stream:
+                payload.update(STREAM_OPTIONS)
+            return payload
         payload = {
             "messages": [
                 {
@@ -104,77 +172,266 @@ class AzureAIBenchmark:
             "max_tokens": 2048,
             "temperature": 0.7
         }
+        if self.stream:
+            payload.update(STREAM_OPTIONS)
+        return payload
+    
+    def encode_request(self, question) -> tuple:
+        """返回(请求体字节串, 估算token数)
+
+        问题列表中的问题按文本缓存，重复发送（扫描的各级别、重试、溢出）时不再重新构造和编码；
+        trace中的请求只出现一次，不缓存。
+        """
+        if isinstance(question, str):
+            encoded = self.encoded.get(question)
+            if encoded is not None:
+                return encoded
+        payload = self.build_payload(question)
+        encoded = (json_codec.dumps(payload), self.estimate_tokens(payload))
+        if isinstance(question, str):
+            self.encoded[question] = encoded
+        return encoded
+    
+    def prepare(self, questions: List[Any]):
+        """在计时开始前编码问题列表中的所有请求体，请求路径上只剩字典查找"""
+        for question in questions:
+            if isinstance(question, str):
+                self.encode_request(question)
+    
+    def completion_result(self, result: Dict[str, Any], start_time: float) -> Dict[str, Any]:
+        """解析非流式响应体，拆分提示词、输出和推理token数"""
+        message = result['choices'][0]['message']
+        content = message['content'] or ""
+        reasoning, answer = split_reasoning(content)
+        # 部分部署把推理过程放在单独的reasoning_content字段中
+        reasoning += message.get('reasoning_content') or ""
+        parsed = {
+            "success": True,
+            "content": content,
+            "usage": result.get('usage', {}).get('total_tokens', None),
+            "latency": time.perf_counter() - start_time
+        }
+        parsed.update(token_breakdown(result.get('usage'), len(reasoning), len(answer)))
+        return parsed
+    
+    def error_result(self, error: str, start_time: float, status_code: int = None,
+                     retry_after: float = None) -> Dict[str, Any]:
+        return {
+            "success": False,
+            "error": error,
+            "content": None,
+            "usage": None,
+            "latency": time.perf_counter() - start_time,
+            "status_code": status_code,
+            "retry_after": retry_after
+        }
+    
+    def timeout_result(self, kind: str, error: str, start_time: float) -> Dict[str, Any]:
+        """超时的请求：kind为connect、read或total，单独计数；cancelled表示运行被停止时仍在途，不计入统计"""
+        if kind == "cancelled":
+            result = self.error_result(f"Cancelled: run {self.control.reason or 'stopped'}", start_time)
+            result["cancelled"] = True
+            return result
+        result = self.error_result(f"Timeout ({kind}): {error}", start_time)
+        result["timeout"] = kind
+        return result
+    
+    def estimate_tokens(self, payload: Dict[str, Any]) -> int:
+        """按服务端限流的口径估算请求消耗的token数：提示词（约4字符/token）加max_tokens"""
+        prompt_chars = sum(len(message["content"]) for message in payload["messages"])
+        return prompt_chars // 4 + payload.get("max_tokens", 0)
+    
+    def progress(self, message: str):
+        """输出进度；开启终端仪表盘时由仪表盘显示进度，不再逐行输出"""
+        if not (self.quiet or (self.metrics and self.metrics.dashboard)):
+            print(message)
+    
+    def finish_attempts(self, result: Dict[str, Any], start_time: float, attempts: List[Dict[str, Any]],
+                        rate_limit_wait: float, question=None, target: Endpoint = None,
+                        spillover_time: float = None) -> Dict[str, Any]:
+        """合并多次尝试的结果：latency为包含限速等待和重试的总耗时，另记首次尝试的耗时
+
+        spillover_time为被限流后溢出到其他端点之前，在被拒绝的尝试上花费的时间。
+        """
+        first_attempt_latency = attempts[0]["latency"] if attempts else None
+        shift_start(result, time.perf_counter() - start_time - result["latency"])
+        result["attempts"] = len(attempts)
+        result["first_attempt_latency"] = first_attempt_latency
+        result["throttled_attempts"] = sum(1 for attempt in attempts if attempt.get("status_code") == 429)
+        result["rate_limit_wait"] = rate_limit_wait if self.rate_limiter else None
+        if isinstance(question, dict) and question.get("tag") is not None:
+            result["tag"] = question["tag"]
+        if target and len(self.router.endpoints) > 1:
+            result["endpoint"] = target.name
+            result["spillover_time"] = spillover_time
+        if self.metrics:
+            self.metrics.completed(result)
+        return result
+    
+    def connection_timing(self, phases: Dict[str, Any], headers_time: float, download_time: float) -> Dict[str, Any]:
+        """整理连接阶段耗时；复用连接时DNS/连接/TLS耗时为None"""
+        return {
+            "connection_reused": not phases.get("new_connection", False),
+            "dns_time": phases.get("dns_time"),
+            "connect_time": phases.get("connect_time"),
+            "tls_time": phases.get("tls_time"),
+            "headers_time": headers_time,
+            "download_time": download_time
+        }
+    
+    def read_sse_stream(self, response: requests.Response, start_time: float, deadline: float = None) -> Dict[str, Any]:
+        """逐块读取SSE流，记录每个token到达的时间；超过deadline时抛出DeadlineExceeded"""
+        parser = SSEStreamParser()
+        for line in response.iter_lines():
+            parser.feed(line)
+            if deadline is not None and time.perf_counter() > deadline:
+                raise DeadlineExceeded()
+        return parser.result(start_time, time.perf_counter())
+    
+    def read_body(self, response: requests.Response, deadline: float = None) -> bytes:
+        """读取非流式响应体；没有时限时一次读完，否则逐块读取并检查deadline"""
+        if deadline is None:
+            return response.content
+        chunks = []
+        for chunk in response.iter_content(65536):
+            chunks.append(chunk)
+            if time.perf_counter() > deadline:
+                raise DeadlineExceeded()
+        return b"".join(chunks)
+    
+    def single_request_http(self, question, target: Endpoint, body: bytes = None) -> Dict[str, Any]:
+        """使用HTTP直接请求进行单个请求；body为预先编码的请求体"""
+        if body is None:
+            body, _ = self.encode_request(question)
         
+        phases = start_timing()
+        start_time = time.perf_counter()
+        # 连接和读取的超时不超过距请求总时限（或运行被停止）的剩余时间；读取过程中再按deadline检查
+        deadline, deadline_kind = self.control.request_deadline(start_time, self.timeouts.total)
+        timeout = (self.timeouts.connect, self.timeouts.read)
+        if deadline is not None:
+            remaining = max(0.001, deadline - start_time)
+            timeout = (min(timeout[0], remaining), min(timeout[1], remaining))
         try:
-            response = requests.post(deployment_endpoint, headers=headers, json=payload)
-            
-            if response.status_code == 200:
-                result = response.json()
-                return {
-                    "success": True,
-                    "content": result['choices'][0]['message']['content'],
-                    "usage": result.get('usage', {}).get('total_tokens', None)
-                }
-            else:
-                return {
-                    "success": False,
-                    "error": f"HTTP {response.status_code}: {response.text[:200]}",
-                    "content": None,
-                    "usage": None
-                }
-                    
-        except requests.exceptions.RequestException as e:
-            return {
-                "success": False,
-                "error": str(e),
-                "content": None,
-                "usage": None
-            }
+            # stream=True时post()在收到响应头后返回，便于分开统计等待响应头和下载响应体的时间；
+            # 读取中途超时时退出with关闭响应，未读完的连接被丢弃而不是留在连接池中
+            with self.session.post(target.url, headers=target.headers, data=body, stream=True,
+                                   timeout=timeout) as response:
+                headers_at = time.perf_counter()
+                
+                if response.status_code == 200:
+                    if self.stream:
+                        result = self.read_sse_stream(response, start_time, deadline)
+                    else:
+                        result = self.completion_result(json_codec.loads(self.read_body(response, deadline)),
+                                                        start_time)
+                else:
+                    result = self.error_result(f"HTTP {response.status_code}: {response.text[:200]}", start_time,
+                                               response.status_code, parse_retry_after(response.headers))
+                result.update(self.connection_timing(phases, headers_at - start_time,
+                                                     time.perf_counter() - headers_at))
+                result.update(header_fields(response.headers, self.capture_headers, headers_at - start_time))
+                return result
+        
+        except requests.exceptions.ConnectTimeout as e:
+            return self.timeout_result(self.expired(deadline, deadline_kind, "connect"), str(e), start_time)
+        except (requests.exceptions.ReadTimeout, DeadlineExceeded) as e:
+            return self.timeout_result(self.expired(deadline, deadline_kind, "read"), str(e), start_time)
+        except (requests.exceptions.RequestException, ValueError) as e:
+            # 读取响应体时的读超时被requests包装为ConnectionError
+            if e.args and isinstance(e.args[0], urllib3.exceptions.ReadTimeoutError):
+                return self.timeout_result(self.expired(deadline, deadline_kind, "read"), str(e), start_time)
+            if self.control.cancelled:
+                return self.timeout_result("cancelled", str(e), start_time)
+            return self.error_result(str(e), start_time)
     
-    def run_single_request(self, question: str) -> Dict[str, Any]:
-        """运行单个请求（仅支持HTTP）"""
-        return self.single_request_http(question)
+    def expired(self, deadline: float, deadline_kind: str, kind: str) -> str:
+        """超时的归类：已到达请求总时限或运行停止的时间时按deadline_kind，否则为连接或读取超时"""
+        if deadline is not None and time.perf_counter() >= deadline - 0.01:
+            return deadline_kind
+        return "cancelled" if self.control.cancelled else kind
+    
+    def run_single_request(self, question) -> Dict[str, Any]:
+        """运行单个请求（仅支持HTTP），按重试策略处理限流和暂时性错误
+
+        spillover策略下被限流的请求立即改发下一个端点，不计入重试次数。
+        """
+        if self.metrics:
+            self.metrics.started()
+        start_time = time.perf_counter()
+        rate_limit_wait = 0.0
+        attempts = []
+        spillover_time = None
+        spills = 0
+        target = None
+        body, tokens = self.encode_request(question)
+        while True:
+            if target is None:
+                if self.rate_limiter:
+                    wait = self.rate_limiter.reserve(tokens)
+                    if wait > 0:
+                        if self.control.stopping.wait(wait):
+                            # 运行停止时还在限速等待中的请求不再发送，按被取消处理
+                            return self.finish_attempts(self.timeout_result("cancelled", "", start_time),
+                                                        start_time, attempts, rate_limit_wait, question)
+                        rate_limit_wait += wait
+                target = self.router.choose()
+            
+            result = self.single_request_http(question, target, body)
+            self.router.release(target, result)
+            attempts.append(result)
+            # 运行停止后不再重试或溢出到其他端点
+            stopping = self.control.stopping.is_set()
+            spill = None if result["success"] or stopping else self.router.spillover(target, result.get("status_code"))
+            if spill:
+                spillover_time = (spillover_time or 0.0) + result["latency"]
+                spills += 1
+                target = spill
+                continue
+            retries = len(attempts) - spills
+            if result["success"] or stopping or not self.retry_policy.should_retry(result.get("status_code"), retries):
+                return self.finish_attempts(result, start_time, attempts, rate_limit_wait, question,
+                                            target, spillover_time)
+            if self.control.stopping.wait(self.retry_policy.delay(retries, result.get("status_code"),
+                                                                  result.get("retry_after"))):
+                return self.finish_attempts(result, start_time, attempts, rate_limit_wait, question,
+                                            target, spillover_time)
+            target = None
 
-def run_benchmark_sequential(benchmark: AzureAIBenchmark, questions: List[str]) -> tuple:
+def run_benchmark_sequential(benchmark: AzureAIBenchmark, questions: List[str], writer: ResultWriter = None) -> tuple:
     """顺序执行benchmark测试"""
-    results = []
-    successful_requests = 0
-    total_tokens = 0
+    stats = BenchmarkStats()
     
     start_time = time.perf_counter()
     
     for i, question in enumerate(questions):
-        print(f"Processing question {i+1}/{len(questions)}: {question[:50]}...")
+        if benchmark.control.stopping.is_set():
+            break
+        text = question if isinstance(question, str) else question.get("question") or question["messages"][-1]["content"]
+        benchmark.progress(f"Processing question {i+1}/{len(questions)}: {text[:50]}...")
         result = benchmark.run_single_request(question)
-        results.append(result)
-        
-        if result["success"]:
-            successful_requests += 1
-            if result["usage"]:
-                total_tokens += result["usage"]
+        stats.record(result)
+        if writer:
+            writer.write(i, result)
     
     end_time = time.perf_counter()
     latency = end_time - start_time
     
-    return results, latency, successful_requests, total_tokens
+    return latency, stats
 
-def run_benchmark_parallel(benchmark: AzureAIBenchmark, questions: List[str], num_threads: int) -> tuple:
-    """并行执行benchmark测试"""
-    results = [None] * len(questions)
-    successful_requests = 0
-    total_tokens = 0
+def run_benchmark_parallel(benchmark: AzureAIBenchmark, questions: List[str], num_threads: int,
+                           writer: ResultWriter = None) -> tuple:
+    """并行执行benchmark测试；结果交给writer落盘，不在内存中保留响应内容"""
+    stats = BenchmarkStats()
     
     def process_question(index, question):
-        nonlocal successful_requests, total_tokens
+        # 运行停止后，还在队列中等待的问题不再发送
+        if benchmark.control.stopping.is_set():
+            return
         result = benchmark.run_single_request(question)
-        results[index] = result
-        
-        if result["success"]:
-            with threading.Lock():
-                nonlocal successful_requests, total_tokens
-                successful_requests += 1
-                if result["usage"]:
-                    total_tokens += result["usage"]
+        stats.record(result)
+        if writer:
+            writer.write(index, result)
     
     start_time = time.perf_counter()
     
@@ -186,15 +443,152 @@ def run_benchmark_parallel(benchmark: AzureAIBenchmark, questions: List[str], nu
         
         # 等待所有任务完成
         for i, future in enumerate(concurrent.futures.as_completed(futures)):
-            print(f"Completed {i+1}/{len(questions)} requests")
+            benchmark.progress(f"Completed {i+1}/{len(questions)} requests")
     
     end_time = time.perf_counter()
     latency = end_time - start_time
     
-    return results, latency, successful_requests, total_tokens
+    return latency, stats
+
+def format_distribution(summary: Dict[str, float], scale: float = 1.0, unit: str = "s", digits: int = 3) -> str:
+    """把分布摘要格式化为一行: min | mean | p50 | ... | max"""
+    return " | ".join(f"{name} {value * scale:.{digits}f}{unit}" for name, value in summary.items() if name != "count")
+
+# 连接阶段耗时字段及其显示名称
+CONNECTION_PHASES = [
+    ("dns_time", "DNS Lookup"),
+    ("connect_time", "TCP Connect"),
+    ("tls_time", "TLS Handshake"),
+    ("headers_time", "Time to Headers"),
+    ("download_time", "Body Download"),
+]
+
+# 响应头中的限流余量字段及其显示名称
+REMAINING_FIELDS = [
+    ("ratelimit_remaining_requests", "Rate-Limit Remaining Requests"),
+    ("ratelimit_remaining_tokens", "Rate-Limit Remaining Tokens"),
+]
+
+def distribution_lines(stats: BenchmarkStats, stream: bool) -> List[str]:
+    """生成控制台和文本报告中的分布统计行"""
+    lines = [f"Per-Request Latency: {format_distribution(stats.summary('latency'))}"]
+    if stats.histograms["schedule_lag"].count:
+        # 开环模式：延迟从计划发送时间算起，另外报告实际发送落后计划的时间
+        lines.append(f"Service Time: {format_distribution(stats.summary('service_time'))}")
+        lines.append(f"Schedule Lag: {format_distribution(stats.summary('schedule_lag'), 1000, 'ms', 1)}")
+    if stream:
+        lines.append(f"TTFT: {format_distribution(stats.summary('ttft'))}")
+        lines.append(f"Inter-Token Latency: {format_distribution(stats.summary('itl'), 1000, 'ms', 1)}")
+        lines.append(f"Time to Last Token: {format_distribution(stats.summary('ttlt'))}")
+        lines.append(f"Output Tokens per Second: {format_distribution(stats.summary('output_tokens_per_second'), unit='', digits=2)}")
+    
+    if stats.retries or stats.throttled:
+        lines.append(f"Retries: {stats.retries} (HTTP 429 responses: {stats.throttled})")
+        lines.append(f"First-Attempt Latency: {format_distribution(stats.summary('first_attempt_latency'))}")
+    if stats.histograms["rate_limit_wait"].count:
+        lines.append(f"Client Rate-Limit Wait: {format_distribution(stats.summary('rate_limit_wait'))}")
+    if stats.histograms["spillover_time"].count:
+        # spillover路由：在被限流的端点上花费的时间，即溢出给请求增加的延迟
+        spilled = stats.histograms["spillover_time"].count
+        share = spilled / max(stats.successful_requests, 1) * 100
+        lines.append(f"Spilled Requests: {spilled} ({share:.1f}% of successful)")
+        lines.append(f"Spillover Delay: {format_distribution(stats.summary('spillover_time'))}")
+    if stats.histograms["server_time"].count:
+        # 服务端报告的处理时间，以及收到响应头的耗时中剩余的网络/网关/排队时间：p99变大时据此区分原因
+        lines.append(f"Server Processing Time: {format_distribution(stats.summary('server_time'))}")
+        lines.append(f"Network/Gateway Overhead: {format_distribution(stats.summary('network_overhead'), 1000, 'ms', 1)}")
+    for name, label in REMAINING_FIELDS:
+        if stats.histograms[name].count:
+            lines.append(f"{label}: {format_distribution(stats.summary(name), unit='', digits=0)}")
+    
+    # 复用率只按知道连接状态（收到了响应）的请求计算
+    reused = stats.reused_connections
+    known = stats.new_connections + reused
+    unknown = stats.num_requests - known
+    lines.append(f"Connections: {stats.new_connections} new, {reused} reused ({reused / max(known, 1) * 100:.1f}% reuse)"
+                 + (f", {unknown} without a response" if unknown else ""))
+    for name, label in CONNECTION_PHASES:
+        if stats.histograms[name].count:
+            lines.append(f"{label}: {format_distribution(stats.summary(name), 1000, 'ms', 1)}")
+    return lines
+
+def token_lines(stats: BenchmarkStats, latency: float) -> List[str]:
+    """提示词/输出/推理token拆分和按token计的吞吐量（PTU容量按token计算）"""
+    reasoning_share = stats.reasoning_tokens / stats.completion_tokens * 100 if stats.completion_tokens else 0.0
+    lines = [f"Prompt Tokens: {stats.prompt_tokens} | Completion Tokens: {stats.completion_tokens} | "
+             f"Reasoning Tokens: {stats.reasoning_tokens} ({reasoning_share:.1f}% of completion)"]
+    if latency > 0:
+        lines.append(f"Output Tokens per Minute: {stats.completion_tokens / latency * 60:.0f} | "
+                     f"Total Tokens per Minute: {stats.total_tokens / latency * 60:.0f}")
+    cached = stats.histograms["cached_tokens"]
+    if cached.total:
+        # 服务端返回的usage.prompt_tokens_details.cached_tokens：命中前缀缓存的提示词token
+        lines.append(f"Cached Prompt Tokens: {cached.total:.0f} ({cached.total / max(stats.prompt_tokens, 1) * 100:.1f}% of prompt)")
+    for name, label in (("completion_tokens", "Completion Tokens per Request"),
+                        ("reasoning_tokens", "Reasoning Tokens per Request")):
+        if stats.histograms[name].count:
+            lines.append(f"{label}: {format_distribution(stats.summary(name), unit='', digits=0)}")
+    if stats.histograms["time_to_answer"].count:
+        # 流式模式：推理阶段结束、正式回答开始的时间
+        lines.append(f"Time to Answer: {format_distribution(stats.summary('time_to_answer'))}")
+        lines.append(f"Reasoning Time: {format_distribution(stats.summary('reasoning_time'))}")
+    return lines
+
+def stop_lines(stats: BenchmarkStats, stopped: str = None) -> List[str]:
+    """超时的请求数（按类型）以及运行被中断或到达时限时被取消的在途请求数"""
+    lines = []
+    if stats.timeouts:
+        kinds = " | ".join(f"{kind} {count}" for kind, count in sorted(stats.timeouts.items()))
+        lines.append(f"Timed-Out Requests: {sum(stats.timeouts.values())} ({kinds})")
+    if stopped or stats.cancelled:
+        lines.append(f"Run Stopped Early: {STOP_REASONS.get(stopped, 'stopped')}; {stats.cancelled} in-flight requests cancelled, "
+                     f"results cover the {stats.num_requests} requests that finished")
+    return lines
+
+def group_lines(stats: BenchmarkStats, field: str, label: str, stream: bool) -> List[str]:
+    """按分组（例如trace的tag）输出请求数、成功率和延迟分位数"""
+    groups = stats.groups.get(field)
+    if not groups:
+        return []
+    width = max(16, max(len(value) for value in groups))
+    lines = [f"Per-{label} Results:",
+             f"{label.lower():>{width}} | {'requests':>8} | {'success':>7} | {'mean':>7} | {'p50':>7} | {'p95':>7} | "
+             f"{'p99':>7}" + (f" | {'ttft p50':>8}" if stream else "")]
+    for value, group in sorted(groups.items()):
+        latency = group.summary("latency")
+        success_rate = group.successful_requests / group.num_requests * 100 if group.num_requests else 0.0
+        line = (f"{value:>{width}} | {group.num_requests:>8} | {success_rate:>6.1f}% | {latency['mean']:>6.3f}s | "
+                f"{latency['p50']:>6.3f}s | {latency['p95']:>6.3f}s | {latency['p99']:>6.3f}s")
+        if stream:
+            line += f" | {group.summary('ttft')['p50']:>7.3f}s"
+        lines.append(line)
+    return lines
 
-def save_results(args, latency: float, num_requests: int, successful_requests: int, total_tokens: int, results: List[Dict]):
-    """保存测试结果"""
+def group_summary(stats: BenchmarkStats, field: str, stream: bool) -> Dict[str, Any]:
+    """分组统计写入汇总记录的部分"""
+    summary = {}
+    for value, group in sorted(stats.groups.get(field, {}).items()):
+        summary[value] = {
+            "num_requests": group.num_requests,
+            "successful_requests": group.successful_requests,
+            "completion_tokens": group.completion_tokens,
+            "latency_percentiles": rounded_summary(group.summary("latency")),
+        }
+        if stream:
+            summary[value]["ttft_percentiles"] = rounded_summary(group.summary("ttft"))
+    return summary
+
+def rounded_summary(summary: Dict[str, float], digits: int = 4) -> Dict[str, float]:
+    return {name: round(value, digits) for name, value in summary.items()}
+
+def save_results(args, latency: float, stats: BenchmarkStats, segments: List[Dict[str, Any]] = None,
+                 soak_report: Dict[str, Any] = None, phases: Dict[str, Any] = None, stopped: str = None):
+    """保存测试结果；每个请求的详情从记录文件逐行读出，不需要在内存中保留全部结果"""
+    num_requests = stats.num_requests
+    successful_requests = stats.successful_requests
+    total_tokens = stats.total_tokens
+    request_latency = stats.summary("latency")
+    
     # 保存详细结果到文本文件
     output_file = f"benchmark_output_{time.strftime('%Y%m%d_%H%M%S')}.txt"
     with open(output_file, "w", encoding="utf-8") as f:
@@ -203,60 +597,522 @@ def save_results(args, latency: float, num_requests: int, successful_requests: i
         f.write(f"Total Requests: {num_requests}\n")
         f.write(f"Successful Requests: {successful_requests}\n")
         f.write(f"Total Latency: {latency:.3f}s\n")
-        f.write(f"Average Latency per Request: {latency/num_requests:.3f}s\n")
+        f.write(f"Average Latency per Request: {request_latency['mean']:.3f}s\n")
         f.write(f"Requests per Second: {num_requests/latency:.3f}\n")
         f.write(f"Total Tokens: {total_tokens}\n")
-        f.write(f"Parallel Threads: {args.parallel}\n\n")
+        for line in token_lines(stats, latency):
+            f.write(line + "\n")
+        f.write(f"Parallel Threads: {args.parallel}\n")
+        f.write(f"Engine: {args.engine}\n")
+        if args.rps:
+            f.write(f"Target Rate: {args.rps} req/s ({args.arrival})\n")
+        if args.replay:
+            f.write(f"Replayed Trace: {args.replay} ({args.replay_speed}x speed)\n")
+        if args.workers:
+            f.write(f"Workers: {len(args.workers)}\n")
+        for line in distribution_lines(stats, args.stream):
+            f.write(line + "\n")
+        for line in group_lines(stats, "tag", "Tag", args.stream):
+            f.write(line + "\n")
+        for line in group_lines(stats, "endpoint", "Endpoint", args.stream):
+            f.write(line + "\n")
+        for line in group_lines(stats, "region", "Region", args.stream):
+            f.write(line + "\n")
+        for line in session_lines(session_rows(stats, "turn", args.stream), "turn", "Turn", args.stream):
+            f.write(line + "\n")
+        for line in session_lines(session_rows(stats, "context_bucket", args.stream), "context_bucket", "Context",
+                                  args.stream):
+            f.write(line + "\n")
+        if args.prefix_cache:
+            rows = prefix_cache_rows(stats, parse_prefix_sizes(args.prefix_cache), args.stream)
+            for line in prefix_cache_lines(rows, args.stream):
+                f.write(line + "\n")
+        if soak_report:
+            for line in soak_lines(soak_report, args.drift_threshold):
+                f.write(line + "\n")
+        if phases:
+            for line in phase_lines(phases):
+                f.write(line + "\n")
+        for line in stop_lines(stats, stopped):
+            f.write(line + "\n")
+        if args.records_file:
+            f.write(f"Per-Request Records: {args.records_file}\n")
+        if args.timeseries_file and not args.workers:
+            f.write(f"Per-Second Time Series: {args.timeseries_file}\n")
+        if segments and len(segments) > 1:
+            f.write(f"Run ID: {args.run_id} (resumed, {len(segments)} segments)\n")
+            for line in segment_lines(segments):
+                f.write(line + "\n")
+        f.write("\n")
         
-        for i, result in enumerate(results):
-            f.write(f"--- Request {i+1} ---\n")
-            if result["success"]:
-                f.write(f"Content: {result['content'][:200]}...\n")
-                f.write(f"Tokens: {result['usage']}\n")
-            else:
-                f.write(f"Error: {result['error']}\n")
-            f.write("\n")
+        # 分布式模式下每个请求的记录保存在各worker本地，这里不输出详情
+        if args.records_file and not args.workers:
+            for record in read_records(args.records_file):
+                f.write(f"--- Request {record['index']+1} ---\n")
+                if record["success"]:
+                    if "content" in record:
+                        f.write(f"Content: {record['content'][:200]}...\n")
+                    elif "content_sha256" in record:
+                        f.write(f"Content SHA-256: {record['content_sha256']}\n")
+                    f.write(f"Tokens: {record.get('usage')}\n")
+                    f.write(f"Latency: {record['latency']:.3f}s\n")
+                    if args.stream and record.get("ttft") is not None:
+                        f.write(f"TTFT: {record['ttft']:.3f}s\n")
+                else:
+                    f.write(f"Error: {record['error']}\n")
+                f.write("\n")
     
     print(f"Detailed results saved to: {output_file}")
     
     # 保存汇总结果到JSON文件
     if args.result_file:
-        summary = {
-            "task": "azure_ai_benchmark",
+        append_summary(args.result_file, build_summary(args, latency, stats, segments, soak_report, phases, stopped))
+        print(f"Summary results appended to: {args.result_file}")
+
+def build_summary(args, latency: float, stats: BenchmarkStats, segments: List[Dict[str, Any]] = None,
+                  soak_report: Dict[str, Any] = None, phases: Dict[str, Any] = None,
+                  stopped: str = None) -> Dict[str, Any]:
+    """构造写入benchmark_results.jsonl的汇总记录；断点续跑时latency为各运行段耗时之和"""
+    num_requests = stats.num_requests
+    successful_requests = stats.successful_requests
+    total_tokens = stats.total_tokens
+    request_latency = stats.summary("latency")
+    
+    summary = {
+        "task": "azure_ai_benchmark",
+        "model": model_name,
+        "latency": round(latency, 3),
+        "num_requests": num_requests,
+        "successful_requests": successful_requests,
+        "success_rate": round(successful_requests / num_requests * 100, 2) if num_requests > 0 else 0,
+        "avg_latency_per_request": round(request_latency["mean"], 3),
+        "requests_per_second": round(num_requests / latency, 3) if latency > 0 else 0,
+        "total_tokens": total_tokens,
+        "avg_tokens_per_request": round(total_tokens / successful_requests, 2) if successful_requests > 0 else 0,
+        "prompt_tokens": stats.prompt_tokens,
+        "completion_tokens": stats.completion_tokens,
+        "reasoning_tokens": stats.reasoning_tokens,
+        "output_tokens_per_minute": round(stats.completion_tokens / latency * 60, 1) if latency > 0 else 0,
+        "tokens_per_minute": round(total_tokens / latency * 60, 1) if latency > 0 else 0,
+        "latency_percentiles": rounded_summary(request_latency),
+        "other": {
+            "parallel": args.parallel,
+            "endpoint": endpoint,
+            "endpoints_file": args.endpoints,
+            "route": args.route if args.endpoints else None,
+            "engine": args.engine,
+            "rps": args.rps,
+            "arrival": args.arrival if args.rps else None,
+            "max_retries": args.max_retries,
+            "limit_rps": args.limit_rps,
+            "limit_tpm": args.limit_tpm,
+            "workers": len(args.workers) if args.workers else None,
+            "replay": args.replay,
+            "replay_speed": args.replay_speed if args.replay else None,
+            "prefix_cache": args.prefix_cache,
+            "duration": args.duration,
+            "session_turns": args.session_turns,
+            "warmup": args.warmup,
+            "ramp_up": args.ramp_up,
+            "ramp_steps": args.ramp_steps if args.ramp_up else None,
+            "connect_timeout": args.connect_timeout,
+            "read_timeout": args.read_timeout,
+            "request_timeout": args.request_timeout,
+            "run_deadline": args.run_deadline,
+            "keep_reasoning": args.keep_reasoning if args.session_turns else None,
+            "run_id": args.run_id,
+            "stream": args.stream
+        }
+    }
+    if segments and len(segments) > 1:
+        # 断点续跑：记录各运行段，段与段之间的间隔不计入总耗时
+        summary["segments"] = [
+            {
+                "segment": segment["segment"],
+                "started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(segment["started_at"])),
+                "latency": round(segment["latency"], 3),
+                "completed": segment["completed"],
+                "interrupted": segment.get("interrupted", False),
+            }
+            for segment in segments
+        ]
+        summary["segment_gaps"] = [
+            round(later["started_at"] - earlier["ended_at"], 1) for earlier, later in zip(segments, segments[1:])
+        ]
+    for name in ("completion_tokens", "reasoning_tokens"):
+        summary[f"{name}_percentiles"] = rounded_summary(stats.summary(name), 1)
+    if args.stream:
+        for name in ("ttft", "itl", "ttlt", "output_tokens_per_second", "time_to_answer", "reasoning_time"):
+            summary[f"{name}_percentiles"] = rounded_summary(stats.summary(name))
+    if args.rps:
+        for name in ("service_time", "schedule_lag"):
+            summary[f"{name}_percentiles"] = rounded_summary(stats.summary(name))
+    summary["retries"] = stats.retries
+    summary["throttled_responses"] = stats.throttled
+    summary["timeouts"] = dict(stats.timeouts)
+    if stopped or stats.cancelled:
+        # 运行被中断或到达时限：统计只包含已完成的请求，被取消的在途请求单独计数
+        summary["stopped"] = {"reason": stopped, "cancelled_requests": stats.cancelled}
+    summary["first_attempt_latency_percentiles"] = rounded_summary(stats.summary("first_attempt_latency"))
+    if stats.histograms["rate_limit_wait"].count:
+        summary["rate_limit_wait_percentiles"] = rounded_summary(stats.summary("rate_limit_wait"))
+    if stats.groups.get("tag"):
+        summary["tags"] = group_summary(stats, "tag", args.stream)
+    if stats.groups.get("endpoint"):
+        summary["endpoints"] = group_summary(stats, "endpoint", args.stream)
+    if stats.groups.get("region"):
+        summary["regions"] = group_summary(stats, "region", args.stream)
+    if stats.groups.get("turn"):
+        # 多轮会话：延迟和TTFT随轮次和累计上下文长度的变化
+        summary["turns"] = session_rows(stats, "turn", args.stream)
+        summary["context_buckets"] = session_rows(stats, "context_bucket", args.stream)
+    for name in ("server_time", "network_overhead") + tuple(name for name, _ in REMAINING_FIELDS):
+        if stats.histograms[name].count:
+            summary[f"{name}_percentiles"] = rounded_summary(stats.summary(name))
+    if soak_report:
+        summary["soak"] = soak_report
+    if phases:
+        # 预热和加压阶段的请求不计入以上统计，latency为稳态阶段的耗时
+        summary["phases"] = phases
+    if args.prefix_cache:
+        summary["prefix_cache"] = prefix_cache_rows(stats, parse_prefix_sizes(args.prefix_cache), args.stream)
+    if stats.histograms["spillover_time"].count:
+        summary["spilled_requests"] = stats.histograms["spillover_time"].count
+        summary["spillover_time_percentiles"] = rounded_summary(stats.summary("spillover_time"))
+    summary["new_connections"] = stats.new_connections
+    summary["reused_connections"] = stats.reused_connections
+    summary["connection_phases"] = {
+        name: rounded_summary(stats.summary(name)) for name, _ in CONNECTION_PHASES if stats.histograms[name].count
+    }
+    return summary
+
+def append_summary(result_file: str, summary: Dict[str, Any]):
+    with open(result_file, "a", encoding="utf-8") as f:
+        f.write(json.dumps(summary, ensure_ascii=False) + "\n")
+
+def run_benchmark(args, benchmark: AzureAIBenchmark, questions: List[str], async_runner=None,
+                  writer: ResultWriter = None, ramp: RampUp = None) -> tuple:
+    """按参数选择引擎和调度方式执行一轮测试，返回(总耗时, 统计)；指定ramp时总耗时和统计只覆盖稳态阶段"""
+    benchmark.prepare(questions)
+    if args.session_turns:
+        # 多轮会话：--parallel个虚拟用户并发对话，每轮携带之前的全部问答
+        conversations = build_conversations(questions, args.session_turns, system_prompt, args.keep_reasoning)
+        print(f"Running {len(conversations)} conversations of up to {args.session_turns} turns "
+              f"with {args.parallel} concurrent users...")
+        if args.engine == "async":
+            return async_runner.run_conversations(conversations, args.parallel, args.session_turns, writer, ramp)
+        return run_conversations(benchmark, conversations, args.parallel, args.session_turns, writer, ramp)
+    if args.duration:
+        # 长时间运行：循环使用问题列表直到达到时长，闭环或按--rps开环发送
+        mode = f"at {args.rps} req/s" if args.rps else f"with concurrency {args.parallel}"
+        print(f"Running soak test for {args.duration} {mode}...")
+        schedule = soak_schedule(questions, parse_duration(args.duration), args.rps, args.arrival, args.seed)
+        if ramp and args.rps:
+            # 加压阶段按降低的速率发送，计划时间相应后移
+            schedule = ((index, question, ramp.ramped_offset(offset)) for index, question, offset in schedule)
+        # 开环时服务跟不上到达速率会产生积压，晚于计划时间太多的请求不再发送，客户端内存保持有界
+        max_lag = args.soak_max_lag if args.rps else None
+        if args.engine == "async":
+            return async_runner.run_schedule(schedule, None, args.parallel, writer, ramp, max_lag)
+        return run_schedule(benchmark, schedule, None, args.parallel, writer, ramp, max_lag)
+    if args.replay:
+        # trace回放：按记录的时间（除以回放速度）发送，--parallel限制同时在途的请求数
+        print(f"Replaying {args.replay} at {args.replay_speed}x speed with up to {args.parallel} requests in flight...")
+        schedule = trace_schedule(args.replay, args.replay_speed)
+        if args.engine == "async":
+            return async_runner.run_schedule(schedule, count_trace(args.replay), args.parallel, writer)
+        return run_schedule(benchmark, schedule, count_trace(args.replay), args.parallel, writer)
+    if args.engine == "async":
+        print(f"Running async benchmark with concurrency {args.parallel}...")
+        return async_runner.run(questions, args.parallel, args.rps, args.arrival, args.seed, writer, ramp)
+    elif args.rps:
+        print(f"Running open-loop benchmark at {args.rps} req/s with up to {args.parallel} threads...")
+        return run_benchmark_open_loop(benchmark, questions, args.rps, args.arrival, args.parallel, args.seed, writer,
+                                       ramp)
+    elif ramp:
+        # 加压需要按名额控制同时在途的请求数，使用闭环调度执行
+        print(f"Running parallel benchmark with {args.parallel} threads after a {ramp.seconds:g}s ramp-up...")
+        schedule = ((i, question, None) for i, question in enumerate(questions))
+        return run_schedule(benchmark, schedule, len(questions), args.parallel, writer, ramp)
+    elif args.parallel == 1:
+        print("Running sequential benchmark...")
+        return run_benchmark_sequential(benchmark, questions, writer)
+    else:
+        print(f"Running parallel benchmark with {args.parallel} threads...")
+        return run_benchmark_parallel(benchmark, questions, args.parallel, writer)
+
+def run_warmup(args, benchmark: AzureAIBenchmark, async_runner=None) -> Dict[str, Any]:
+    """正式测试前以目标并发数（开环时为目标速率）发送预热请求，建立连接并预热服务端；结果不计入统计也不写入记录"""
+    requests_count, seconds = parse_warmup(args.warmup)
+    load = f"{args.rps} req/s" if args.rps else f"concurrency {args.parallel}"
+    print(f"Warming up with {args.warmup}{' requests' if requests_count else ''} at {load}...")
+    schedule = warmup_schedule(test_questions[:args.num_questions], requests_count, seconds,
+                               args.rps, args.arrival, args.seed)
+    quiet, benchmark.quiet = benchmark.quiet, True
+    try:
+        if args.engine == "async":
+            latency, stats = async_runner.run_schedule(schedule, requests_count or None, args.parallel)
+        else:
+            latency, stats = run_schedule(benchmark, schedule, requests_count or None, args.parallel)
+    finally:
+        benchmark.quiet = quiet
+    warmup = {"requests": stats.num_requests, "successful_requests": stats.successful_requests,
+              "seconds": round(latency, 3)}
+    print(phase_lines({"warmup": warmup, "measured_seconds": 0})[0])
+    return warmup
+
+def run_sweep_mode(args, benchmark: AzureAIBenchmark, questions: List[str], async_runner=None,
+                   writer: ResultWriter = None):
+    """在一次调用中逐步提高并发数或RPS，找出满足SLO的最大负载"""
+    spec = parse_sweep(args.sweep, args.sweep_by)
+    slo = {
+        "latency": args.slo_latency,
+        "percentile": args.slo_percentile,
+        "max_error_rate": args.slo_max_error_rate
+    }
+    resolution = args.sweep_resolution or (5 if args.sweep_by == "parallel" else 0.5)
+    rows = []
+    print(format_header(args.sweep_by, slo["percentile"]))
+    
+    def run_level(level):
+        step_args = copy.copy(args)
+        setattr(step_args, args.sweep_by, level)
+        if writer:
+            writer.context.update(sweep_step=len(rows) + 1, sweep_level=level)
+        latency, stats = run_benchmark(step_args, benchmark, questions, async_runner, writer)
+        metrics = step_metrics(level, latency, stats, slo)
+        # 被中断的级别只完成了一部分请求，不作为满足SLO的依据
+        metrics["meets_slo"] = metrics["meets_slo"] and not benchmark.control.stopping.is_set()
+        rows.append(format_step(metrics, slo["percentile"]))
+        print(rows[-1])
+        
+        if args.result_file:
+            summary = build_summary(step_args, latency, stats, stopped=benchmark.control.reason)
+            summary["other"]["sweep_step"] = len(rows)
+            summary["other"]["meets_slo"] = metrics["meets_slo"]
+            summary["goodput"] = round(metrics["goodput"], 3)
+            append_summary(args.result_file, summary)
+        return metrics
+    
+    steps, knee = run_sweep(spec, run_level, resolution, benchmark.control.stopping.is_set)
+    
+    print("\n" + "=" * 50)
+    print("=== Sweep Results ===")
+    slo_text = f"{slo['percentile']} <= {slo['latency']}s, " if slo["latency"] is not None else ""
+    print(f"SLO: {slo_text}error rate <= {slo['max_error_rate'] * 100:.2f}%")
+    print(format_header(args.sweep_by, slo["percentile"]))
+    for metrics in sorted(steps, key=lambda m: m["level"]):
+        print(format_step(metrics, slo["percentile"]))
+    if knee is None:
+        print(f"No {args.sweep_by} level met the SLO")
+    else:
+        print(f"Highest {args.sweep_by} meeting the SLO: {knee}")
+    stopped = benchmark.control.reason
+    if stopped:
+        print(f"Sweep stopped early ({STOP_REASONS[stopped]}): the last level is incomplete and does not count as "
+              f"meeting the SLO")
+    headroom = [m for m in sorted(steps, key=lambda m: m["level"])
+                if m["remaining_requests_min"] is not None or m["remaining_tokens_min"] is not None]
+    if headroom:
+        print("Rate-limit headroom (lowest remaining reported by response headers):")
+        for m in headroom:
+            print(f"  {args.sweep_by} {m['level']}: requests {format_remaining(m['remaining_requests_min'])}, "
+                  f"tokens {format_remaining(m['remaining_tokens_min'])}")
+    
+    if args.result_file:
+        append_summary(args.result_file, {
+            "task": "azure_ai_benchmark_sweep",
             "model": model_name,
-            "latency": round(latency, 3),
-            "num_requests": num_requests,
-            "successful_requests": successful_requests,
-            "success_rate": round(successful_requests / num_requests * 100, 2),
-            "avg_latency_per_request": round(latency / num_requests, 3),
-            "requests_per_second": round(num_requests / latency, 3),
-            "total_tokens": total_tokens,
-            "avg_tokens_per_request": round(total_tokens / successful_requests, 2) if successful_requests > 0 else 0,
+            "sweep_by": args.sweep_by,
+            "slo": slo,
+            "knee": knee,
+            "stopped": stopped,
+            "steps": [
+                {
+                    "level": m["level"],
+                    "throughput": round(m["throughput"], 3),
+                    "goodput": round(m["goodput"], 3),
+                    "error_rate": round(m["error_rate"], 4),
+                    "latency_percentiles": rounded_summary(m["latency_percentiles"]),
+                    "meets_slo": m["meets_slo"],
+                    "remaining_requests_min": m["remaining_requests_min"],
+                    "remaining_tokens_min": m["remaining_tokens_min"]
+                }
+                for m in steps
+            ],
             "other": {
-                "parallel": args.parallel,
-                "endpoint": endpoint
+                "engine": args.engine,
+                "endpoint": endpoint,
+                "stream": args.stream
             }
-        }
-        
-        with open(args.result_file, "a", encoding="utf-8") as f:
-            f.write(json.dumps(summary, ensure_ascii=False) + "\n")
-        
-        print(f"Summary results appended to: {args.result_file}")
+        })
+        print(f"Sweep results appended to: {args.result_file}")
+
+def format_remaining(value) -> str:
+    return f"{value:.0f}" if value is not None else "-"
+
+def create_writer(args) -> ResultWriter:
+    """按参数创建逐请求记录的写入器；--records-file为none时不记录"""
+    if not args.records_file:
+        return None
+    return ResultWriter(args.records_file, args.record_body, args.record_body_chars)
+
+def worker_records_file(records_file: str, index: int) -> str:
+    if not records_file:
+        return None
+    base, extension = os.path.splitext(records_file)
+    return f"{base}_worker{index}{extension}"
+
+def create_metrics(args) -> LiveMetrics:
+    """按参数创建运行期间的逐秒统计（时间序列文件、/metrics端点、终端仪表盘）"""
+    if not (args.timeseries_file or args.metrics_port or args.dashboard):
+        return None
+    metrics = LiveMetrics(args.timeseries_file, args.metrics_port, args.dashboard, args.metrics_host)
+    if args.metrics_port:
+        print(f"Prometheus metrics: http://{args.metrics_host}:{args.metrics_port}/metrics")
+    return metrics
+
+def create_benchmark(args, pool_size: int) -> AzureAIBenchmark:
+    """按命令行参数创建benchmark实例（重试策略、客户端限速和端点路由）"""
+    retry_policy = RetryPolicy(args.max_retries, args.backoff_base, args.backoff_max)
+    rate_limiter = None
+    if args.limit_rps or args.limit_tpm:
+        rate_limiter = ClientRateLimiter(args.limit_rps, args.limit_tpm)
+    router = EndpointRouter(configured_endpoints(args.endpoints), args.route)
+    timeouts = RequestTimeouts(args.connect_timeout, args.read_timeout, args.request_timeout)
+    control = RunControl(parse_duration(args.run_deadline) if args.run_deadline else None, args.drain_timeout)
+    return AzureAIBenchmark(stream=args.stream, pool_size=pool_size, retry_policy=retry_policy,
+                            rate_limiter=rate_limiter, router=router,
+                            capture_headers=parse_capture_headers(args.capture_headers),
+                            timeouts=timeouts, control=control)
+
+def run_worker_job(job: Dict[str, Any]) -> tuple:
+    """worker进程执行coordinator下发的一份任务，返回(总耗时, 统计)"""
+    args = argparse.Namespace(**job["args"])
+    benchmark = create_benchmark(args, args.parallel)
+    writer = create_writer(args)
+    if writer:
+        writer.indices = job["indices"]
+    async_runner = None
+    if args.engine == "async":
+        from async_engine import AsyncBenchmarkRunner
+        async_runner = AsyncBenchmarkRunner(benchmark, args.parallel)
+    benchmark.control.start()
+    try:
+        return run_benchmark(args, benchmark, job["questions"], async_runner, writer)
+    finally:
+        if async_runner:
+            async_runner.close()
+        if writer:
+            writer.close()
+
+def run_distributed(args, questions: List[str]) -> tuple:
+    """把问题列表、并发数、目标速率和客户端限速平均分给各worker，合并它们的统计结果
+
+    --processes在本机启动worker进程；--workers连接其他主机上用--worker-listen启动的worker。
+    """
+    processes = []
+    # 远程worker使用.env或环境变量中配置的共享令牌；本机worker未配置时每次运行生成一个随机令牌
+    token = os.getenv(WORKER_TOKEN_ENV) or secrets.token_urlsafe(32)
+    if args.processes:
+        print(f"Starting {args.processes} local worker processes...")
+        processes, args.workers = start_local_workers(args.processes, os.path.abspath(__file__), token)
+    num_workers = len(args.workers)
+    
+    jobs = []
+    for i in range(num_workers):
+        job_args = dict(vars(args))
+        job_args.update({
+            "parallel": split_evenly(args.parallel, num_workers, i),
+            "rps": split_evenly(args.rps, num_workers, i),
+            "limit_rps": split_evenly(args.limit_rps, num_workers, i),
+            "limit_tpm": split_evenly(args.limit_tpm, num_workers, i),
+            # 各worker使用不同的随机种子，避免泊松到达时间完全相同
+            "seed": args.seed + i if args.seed is not None else None,
+            # 每个worker在本地写自己的记录文件
+            "records_file": worker_records_file(args.records_file, i),
+        })
+        jobs.append({
+            "args": job_args,
+            "questions": questions[i::num_workers],
+            "indices": list(range(i, len(questions), num_workers)),
+        })
+    
+    print(f"Running distributed benchmark on {num_workers} workers...")
+    try:
+        latency, stats, _ = run_coordinator(args.workers, jobs, token, shutdown=bool(processes))
+    except BaseException:
+        # 协调出错时worker可能仍在运行或已挂起：直接结束它们，让原来的异常继续抛出
+        stop_local_workers(processes, 0)
+        raise
+    stop_local_workers(processes)
+    return latency, stats
 
 def main(args):
     """主函数"""
     # 获取测试问题
     questions = test_questions[:args.num_questions]
+    if args.prefix_cache:
+        # 前缀缓存实验：每个问题展开为各前缀长度的cached/uncached请求
+        questions = prefix_cache_items(questions, parse_prefix_sizes(args.prefix_cache), args.seed)
+    
+    # 断点续跑时跳过记录文件中已有结果的问题，之前运行段的统计从记录中恢复
+    checkpoint = None
+    previous_stats = None
+    phases = None
+    indices = list(range(len(questions)))
+    if args.resume:
+        checkpoint = load_checkpoint(args.resume)
+        done, previous_stats = restore_progress(checkpoint, args.records_file)
+        indices = [i for i in indices if i not in done]
+    elif args.records_file and not (args.sweep or args.replay or args.duration or args.session_turns
+                                    or args.processes or args.workers):
+        checkpoint = create_checkpoint(args)
     
     print(f"=== Azure AI Benchmark Test ===")
     print(f"Model: {model_name}")
-    print(f"Number of questions: {len(questions)}")
+    if args.replay:
+        print(f"Trace: {args.replay} ({count_trace(args.replay)} requests, {args.replay_speed}x speed)")
+    elif args.session_turns:
+        print(f"Number of questions: {len(questions)} ({-(-len(questions) // args.session_turns)} conversations of "
+              f"{args.session_turns} turns, {'keeping' if args.keep_reasoning else 'dropping'} reasoning in history)")
+    elif args.duration:
+        print(f"Duration: {args.duration} (cycling {len(questions)} questions, {args.soak_window} windows)")
+    else:
+        print(f"Number of questions: {len(questions)}")
+    if args.prefix_cache:
+        print(f"Prefix cache experiment: prefixes {args.prefix_cache} tokens, cached and uncached variants interleaved")
     print(f"Parallel threads: {args.parallel}")
-    print(f"Endpoint: {endpoint}")
+    print(f"Engine: {args.engine}")
+    if args.processes:
+        print(f"Local worker processes: {args.processes}")
+    elif args.workers:
+        print(f"Remote workers: {', '.join(args.workers)}")
+    if args.rps:
+        print(f"Target rate: {args.rps} req/s ({args.arrival} arrivals, open loop)")
+    if args.warmup:
+        print(f"Warm-up: {args.warmup} (discarded)")
+    if args.ramp_up:
+        print(f"Ramp-up: {args.ramp_up} {f'in {args.ramp_steps} steps' if args.ramp_steps else 'linear'} "
+              f"(excluded from statistics)")
+    print(f"Streaming: {args.stream}")
+    if args.endpoints:
+        print(f"Endpoints ({args.route} routing):")
+        for target in configured_endpoints(args.endpoints):
+            print(f"  {target.name}: {target.url.split('?')[0]} (weight {target.weight:g})")
+    else:
+        print(f"Endpoint: {endpoint}")
+    if args.resume:
+        print(f"Resuming run {args.run_id}: {len(questions) - len(indices)} of {len(questions)} questions already done")
+    elif checkpoint:
+        print(f"Run ID: {args.run_id} (resume with --resume {args.run_id})")
     print("=" * 50)
     
-    # 初始化benchmark
-    benchmark = AzureAIBenchmark()
+    # 初始化benchmark；扫描并发数时连接池按最大级别分配，各级别之间复用已建立的连接
+    pool_size = args.parallel
+    if args.sweep and args.sweep_by == "parallel":
+        pool_size = max(pool_size, max_level(parse_sweep(args.sweep, args.sweep_by)))
+    benchmark = create_benchmark(args, pool_size)
     
     # 测试连接
     print("Testing connection...")
@@ -267,31 +1123,141 @@ def main(args):
         print("✗ Connection test failed!")
         return
     
+    if args.prefix_cache:
+        # 先把各长度的共享前缀写入每个端点的缓存，正式测试中cached变体从第一个请求起就可以命中
+        print("Priming shared prefixes...")
+        for item in priming_items(parse_prefix_sizes(args.prefix_cache)):
+            for target in benchmark.router.endpoints:
+                benchmark.single_request_http(item, target)
+    
     print("=" * 50)
     
-    # 运行测试
-    if args.parallel == 1:
-        print("Running sequential benchmark...")
-        results, latency, successful_requests, total_tokens = run_benchmark_sequential(benchmark, questions)
+    if args.processes or args.workers:
+        # 分布式模式下由各worker执行测试，coordinator只负责下发任务和合并结果
+        latency, stats = run_distributed(args, questions)
     else:
-        print(f"Running parallel benchmark with {args.parallel} threads...")
-        results, latency, successful_requests, total_tokens = run_benchmark_parallel(benchmark, questions, args.parallel)
+        async_runner = None
+        if args.engine == "async":
+            try:
+                from async_engine import AsyncBenchmarkRunner
+            except ImportError:
+                print("✗ The async engine requires aiohttp (uv sync --extra async)")
+                return
+            async_runner = AsyncBenchmarkRunner(benchmark, pool_size)
+        
+        # 运行时限从开始发送请求（包括预热）时算起；Ctrl-C/SIGTERM时停止发送，已完成的结果照常输出
+        benchmark.control.install_signal_handlers()
+        benchmark.control.start()
+        
+        # 预热在实时指标和记录文件创建之前进行，不出现在时间序列和记录中
+        if args.warmup:
+            phases = {"warmup": run_warmup(args, benchmark, async_runner)}
+        ramp = None
+        if args.ramp_up:
+            ramp = RampUp(parse_duration(args.ramp_up), args.ramp_steps, args.parallel, open_loop=bool(args.rps))
+        
+        writer = create_writer(args)
+        benchmark.metrics = create_metrics(args)
+        if args.duration:
+            # 按窗口汇总代替逐请求的进度输出，结果再转交给逐请求记录的写入器
+            soak = writer = SoakMonitor(parse_duration(args.soak_window), writer, echo=not args.dashboard,
+                                        delay=ramp.seconds if ramp else 0.0)
+            benchmark.quiet = True
+        try:
+            if args.sweep:
+                run_sweep_mode(args, benchmark, questions, async_runner, writer)
+                return
+            
+            if checkpoint:
+                writer.context["segment"] = start_segment(checkpoint)
+                writer.indices = indices
+            
+            # 运行测试
+            latency, stats = run_benchmark(args, benchmark, [questions[i] for i in indices], async_runner, writer,
+                                           ramp)
+        finally:
+            benchmark.control.restore_signal_handlers()
+            if async_runner:
+                async_runner.close()
+            if writer:
+                writer.close()
+            if benchmark.metrics:
+                benchmark.metrics.close()
+        
+        stopped = benchmark.control.reason
+        if checkpoint:
+            finish_segment(checkpoint, latency, stats.num_requests, interrupted=stopped is not None)
+            if stopped:
+                print(f"Run {STOP_REASONS[stopped]}: resume the remaining questions with --resume {args.run_id}")
+            if previous_stats:
+                stats.merge(previous_stats)
+                latency = sum(segment["latency"] for segment in checkpoint["segments"])
+        
+        if ramp:
+            phases = dict(phases or {}, ramp_up=ramp.summary())
+        if stats.num_requests == 0:
+            if stopped:
+                print(f"✗ Run {STOP_REASONS[stopped]} before any request completed "
+                      f"({stats.cancelled} in-flight requests cancelled)")
+            elif ramp:
+                print(f"✗ All requests started during the {ramp.seconds:g}s ramp-up; "
+                      f"use more questions or a shorter --ramp-up")
+            return
+        if phases:
+            phases["measured_seconds"] = round(latency, 3)
     
     # 打印结果
+    successful_requests = stats.successful_requests
+    total_tokens = stats.total_tokens
     print("\n" + "=" * 50)
     print("=== Benchmark Results ===")
     print(f"Total Latency: {latency:.3f}s")
-    print(f"Total Requests: {len(questions)}")
+    print(f"Total Requests: {stats.num_requests}")
     print(f"Successful Requests: {successful_requests}")
-    print(f"Success Rate: {successful_requests/len(questions)*100:.2f}%")
-    print(f"Average Latency per Request: {latency/len(questions):.3f}s")
-    print(f"Requests per Second: {len(questions)/latency:.3f}")
+    print(f"Success Rate: {successful_requests/stats.num_requests*100:.2f}%")
+    print(f"Average Latency per Request: {stats.summary('latency')['mean']:.3f}s")
+    print(f"Requests per Second: {stats.num_requests/latency:.3f}")
     print(f"Total Tokens: {total_tokens}")
     if successful_requests > 0:
         print(f"Average Tokens per Request: {total_tokens/successful_requests:.2f}")
+    for line in token_lines(stats, latency):
+        print(line)
+    for line in distribution_lines(stats, args.stream):
+        print(line)
+    for line in group_lines(stats, "tag", "Tag", args.stream):
+        print(line)
+    for line in group_lines(stats, "endpoint", "Endpoint", args.stream):
+        print(line)
+    for line in group_lines(stats, "region", "Region", args.stream):
+        print(line)
+    for line in session_lines(session_rows(stats, "turn", args.stream), "turn", "Turn", args.stream):
+        print(line)
+    for line in session_lines(session_rows(stats, "context_bucket", args.stream), "context_bucket", "Context",
+                              args.stream):
+        print(line)
+    if args.prefix_cache:
+        for line in prefix_cache_lines(prefix_cache_rows(stats, parse_prefix_sizes(args.prefix_cache), args.stream),
+                                       args.stream):
+            print(line)
+    segments = checkpoint["segments"] if checkpoint else None
+    if segments and len(segments) > 1:
+        for line in segment_lines(segments):
+            print(line)
+    
+    soak_report = None
+    if args.duration:
+        soak_report = soak.report(args.drift_threshold, stats.missed if args.rps else None, args.soak_max_lag)
+        for line in soak_lines(soak_report, args.drift_threshold):
+            print(line)
+    if phases:
+        for line in phase_lines(phases):
+            print(line)
+    stopped = None if args.processes or args.workers else benchmark.control.reason
+    for line in stop_lines(stats, stopped):
+        print(line)
     
     # 保存结果
-    save_results(args, latency, len(questions), successful_requests, total_tokens, results)
+    save_results(args, latency, stats, segments, soak_report, phases, stopped)
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description="Azure AI Benchmark Test")
@@ -301,12 +1267,230 @@ if __name__ == "__main__":
                        help="Number of parallel threads for requests")
     parser.add_argument("--result-file", type=str, default="benchmark_results.jsonl",
                        help="File to append benchmark results")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread",
+                       help="Load engine: one OS thread per in-flight request, or an asyncio event loop")
+    parser.add_argument("--rps", type=float, default=None,
+                       help="Open-loop mode: issue requests at this target rate instead of waiting for completions")
+    parser.add_argument("--arrival", choices=["constant", "poisson"], default="constant",
+                       help="Inter-arrival distribution for --rps")
+    parser.add_argument("--seed", type=int, default=None,
+                       help="Random seed for Poisson arrivals")
+    parser.add_argument("--sweep", type=str, default=None,
+                       help="Sweep mode: comma-separated levels (10,50,100) or a LOW:HIGH range to binary-search")
+    parser.add_argument("--sweep-by", choices=["parallel", "rps"], default="parallel",
+                       help="Load dimension to sweep")
+    parser.add_argument("--sweep-resolution", type=float, default=None,
+                       help="Stop binary search when the range is this narrow (default 5 for parallel, 0.5 for rps)")
+    parser.add_argument("--slo-latency", type=float, default=None,
+                       help="Latency SLO in seconds for the sweep knee and goodput")
+    parser.add_argument("--slo-percentile", choices=["p50", "p90", "p95", "p99", "p99.9"], default="p95",
+                       help="Percentile the latency SLO applies to")
+    parser.add_argument("--slo-max-error-rate", type=float, default=0.01,
+                       help="Maximum error rate (0-1) allowed by the SLO")
+    parser.add_argument("--max-retries", type=int, default=0,
+                       help="Retries per request on 429/5xx and connection errors (honors Retry-After)")
+    parser.add_argument("--backoff-base", type=float, default=1.0,
+                       help="Base delay in seconds for exponential backoff with full jitter")
+    parser.add_argument("--backoff-max", type=float, default=30.0,
+                       help="Maximum delay in seconds between retries")
+    parser.add_argument("--limit-rps", type=float, default=None,
+                       help="Client-side token bucket: maximum requests per second")
+    parser.add_argument("--limit-tpm", type=float, default=None,
+                       help="Client-side token bucket: maximum estimated tokens per minute (prompt + max_tokens)")
+    parser.add_argument("--stream", action="store_true",
+                       help="Use SSE streaming and record TTFT / inter-token latency")
+    parser.add_argument("--records-file", type=str, default=None,
+                       help="Append one JSON record per completed request here "
+                            "(default benchmark_records_<timestamp>.jsonl, 'none' disables)")
+    parser.add_argument("--record-body", choices=["truncate", "hash", "full", "none"], default="truncate",
+                       help="How much of each response body to keep in the per-request records")
+    parser.add_argument("--record-body-chars", type=int, default=200,
+                       help="Characters kept per response body with --record-body truncate")
+    parser.add_argument("--replay", type=str, default=None, metavar="TRACE",
+                       help="Replay a JSONL trace (messages, max_tokens, temperature, offset or timestamp, tag) "
+                            "instead of the test questions")
+    parser.add_argument("--replay-speed", type=float, default=1.0,
+                       help="Replay speed factor (2 sends the trace twice as fast)")
+    parser.add_argument("--timeseries-file", type=str, default=None,
+                       help="Per-second metrics series (default benchmark_timeseries_<run id>.jsonl, 'none' disables)")
+    parser.add_argument("--metrics-port", type=int, default=None,
+                       help="Expose live metrics in Prometheus text format on http://HOST:PORT/metrics "
+                            "(HOST from --metrics-host)")
+    parser.add_argument("--metrics-host", type=str, default="127.0.0.1",
+                       help="Address for the --metrics-port endpoint; the default serves this machine only, "
+                            "use 0.0.0.0 to allow remote scraping")
+    parser.add_argument("--dashboard", action="store_true",
+                       help="Show a refreshing terminal dashboard instead of per-request progress lines")
+    parser.add_argument("--resume", type=str, default=None, metavar="RUN_ID",
+                       help="Resume an interrupted run, skipping questions already in its records file")
+    parser.add_argument("--processes", type=int, default=None,
+                       help="Coordinator mode: split the load across this many local worker processes")
+    parser.add_argument("--workers", type=lambda value: [w.strip() for w in value.split(",") if w.strip()],
+                       default=None, help="Coordinator mode: comma-separated host:port list of remote workers "
+                                          f"(requires the workers' shared token in {WORKER_TOKEN_ENV})")
+    parser.add_argument("--endpoints", type=str, default=None, metavar="FILE",
+                       help="JSON list of endpoints/deployments (name, endpoint, model, api_version, api_key or "
+                            "api_key_env, weight) to route requests across; defaults to the .env endpoint")
+    parser.add_argument("--route", choices=ROUTING_POLICIES, default="round-robin",
+                       help="Routing policy across --endpoints; spillover sends to the next endpoint on HTTP 429")
+    parser.add_argument("--prefix-cache", type=str, default=None, metavar="SIZES",
+                       help="Prompt-cache experiment: comma-separated shared prefix sizes in tokens (e.g. 0,1k,4k,16k); "
+                            "each question is sent with a cached and an uncached prefix of every size")
+    parser.add_argument("--duration", type=str, default=None,
+                       help="Soak mode: cycle through the questions for this long (e.g. 30m, 4h) at --parallel or --rps")
+    parser.add_argument("--soak-window", type=str, default="5m",
+                       help="Window length for soak-mode statistics and drift detection")
+    parser.add_argument("--drift-threshold", type=float, default=10.0,
+                       help="Flag drift when late soak windows are this many percent worse than early ones")
+    parser.add_argument("--soak-max-lag", type=float, default=30.0,
+                       help="Soak mode with --rps: skip (and count as missed) requests that are more than this many "
+                            "seconds behind schedule, so the client's backlog stays bounded when the service falls behind")
+    parser.add_argument("--session-turns", type=int, default=None, metavar="N",
+                       help="Multi-turn mode: split the questions into conversations of N turns; each of --parallel "
+                            "virtual users sends one turn at a time with the full history of earlier turns")
+    parser.add_argument("--keep-reasoning", action="store_true",
+                       help="In multi-turn mode keep the <think> section of earlier replies in the history")
+    parser.add_argument("--warmup", type=str, default=None,
+                       help="Discarded warm-up before measuring: a request count (e.g. 50) or a duration (e.g. 30s), "
+                            "sent at --parallel to open connections and warm the service; uses the test questions, "
+                            "so it is not available with --prefix-cache, --replay or --session-turns")
+    parser.add_argument("--ramp-up", type=str, default=None,
+                       help="Raise concurrency (or the --rps rate) from low to the target over this long (e.g. 30s); "
+                            "requests started during ramp-up are excluded from the statistics")
+    parser.add_argument("--ramp-steps", type=int, default=0,
+                       help="Ramp up in this many equal steps instead of linearly")
+    parser.add_argument("--connect-timeout", type=float, default=10.0,
+                       help="Seconds to wait for a connection to be established")
+    parser.add_argument("--read-timeout", type=float, default=300.0,
+                       help="Seconds to wait for the next bytes of a response (headers, body or stream chunk)")
+    parser.add_argument("--request-timeout", type=float, default=None,
+                       help="Total seconds allowed per request attempt, including reading the whole response")
+    parser.add_argument("--run-deadline", type=str, default=None,
+                       help="Stop the run after this long (e.g. 10m), cancel in-flight requests and report what finished")
+    parser.add_argument("--drain-timeout", type=float, default=30.0,
+                       help="After Ctrl-C/SIGTERM, seconds to let in-flight requests finish before cancelling them")
+    parser.add_argument("--capture-headers", type=str, default=None, metavar="NAMES",
+                       help="Comma-separated response headers to record per request (default: rate-limit remaining, "
+                            "region, request IDs and server processing time); region, rate-limit remaining and "
+                            "server/network time are derived only from listed headers, and 'none' records none")
+    parser.add_argument("--worker-listen", type=str, default=None,
+                       help="Worker mode: listen for jobs from a coordinator on [host:]port; host defaults to "
+                            "127.0.0.1 (use 0.0.0.0 for remote coordinators), and coordinators must present the "
+                            f"shared token from {WORKER_TOKEN_ENV}")
     
     args = parser.parse_args()
     
+    if args.worker_listen:
+        # worker使用本机的.env配置连接Azure，测试参数全部来自通过令牌校验的coordinator
+        if not os.getenv(WORKER_TOKEN_ENV):
+            parser.error(f"--worker-listen requires a shared token in {WORKER_TOKEN_ENV} (environment or .env)")
+        serve_worker(args.worker_listen, run_worker_job, os.getenv(WORKER_TOKEN_ENV))
+        raise SystemExit(0)
+    
+    if args.resume:
+        # 续跑使用原运行的全部参数
+        try:
+            checkpoint = load_checkpoint(args.resume)
+        except FileNotFoundError:
+            parser.error(f"No checkpoint found for run {args.resume}")
+        # 之后新增的参数在旧的检查点中没有记录，使用默认值
+        args = argparse.Namespace(**dict(vars(parser.parse_args([])), **checkpoint["args"], resume=args.resume))
+    else:
+        args.run_id = time.strftime('%Y%m%d_%H%M%S')
+    
     # 验证参数
     if args.num_questions > len(test_questions):
         args.num_questions = len(test_questions)
         print(f"Warning: num_questions limited to available questions ({len(test_questions)})")
     
+    if args.sweep:
+        try:
+            parse_sweep(args.sweep, args.sweep_by)
+        except ValueError as e:
+            parser.error(str(e))
+    
+    if args.records_file is None:
+        args.records_file = f"benchmark_records_{args.run_id}.jsonl"
+    elif args.records_file.lower() == "none":
+        args.records_file = None
+    if args.timeseries_file is None:
+        args.timeseries_file = f"benchmark_timeseries_{args.run_id}.jsonl"
+    elif args.timeseries_file.lower() == "none":
+        args.timeseries_file = None
+    
+    if args.processes and args.workers:
+        parser.error("--processes and --workers cannot be used together")
+    num_workers = args.processes or len(args.workers or [])
+    if num_workers and args.parallel < num_workers:
+        # 每个worker至少需要1个并发，否则总并发数会超过--parallel
+        parser.error(f"--parallel ({args.parallel}) must be at least the number of workers ({num_workers})")
+    if args.workers and not os.getenv(WORKER_TOKEN_ENV):
+        parser.error(f"--workers requires the workers' shared token in {WORKER_TOKEN_ENV} (environment or .env)")
+    if args.sweep and (args.processes or args.workers):
+        parser.error("--sweep is not supported in distributed mode")
+    if args.replay:
+        if not os.path.exists(args.replay):
+            parser.error(f"Trace file not found: {args.replay}")
+        if args.replay_speed <= 0:
+            parser.error("--replay-speed must be positive")
+        if args.rps or args.sweep or args.processes or args.workers:
+            parser.error("--replay cannot be combined with --rps, --sweep or distributed mode")
+    if (args.metrics_port or args.dashboard) and (args.processes or args.workers):
+        parser.error("--metrics-port and --dashboard are not supported in distributed mode")
+    if args.prefix_cache:
+        try:
+            parse_prefix_sizes(args.prefix_cache)
+        except ValueError as e:
+            parser.error(str(e))
+        if args.replay or args.sweep:
+            parser.error("--prefix-cache cannot be combined with --replay or --sweep")
+    if args.duration:
+        try:
+            parse_duration(args.duration)
+            parse_duration(args.soak_window)
+        except ValueError as e:
+            parser.error(f"Invalid duration: {e}")
+        if args.replay or args.sweep or args.processes or args.workers:
+            parser.error("--duration cannot be combined with --replay, --sweep or distributed mode")
+        if args.soak_max_lag <= 0:
+            parser.error("--soak-max-lag must be positive")
+    if args.connect_timeout <= 0 or args.read_timeout <= 0 or (args.request_timeout is not None
+                                                               and args.request_timeout <= 0):
+        parser.error("--connect-timeout, --read-timeout and --request-timeout must be positive")
+    if args.run_deadline:
+        try:
+            parse_duration(args.run_deadline)
+        except ValueError as e:
+            parser.error(f"Invalid --run-deadline: {e}")
+    if args.warmup:
+        try:
+            parse_warmup(args.warmup)
+        except ValueError as e:
+            parser.error(f"Invalid --warmup: {e}")
+        # 预热发送的是普通测试问题；这几种模式的请求形状不同，用普通问题预热的连接和服务端缓存与正式测试不一致
+        if args.prefix_cache or args.replay or args.session_turns is not None:
+            parser.error("--warmup cannot be combined with --prefix-cache, --replay or --session-turns")
+    if args.ramp_up:
+        try:
+            parse_duration(args.ramp_up)
+        except ValueError as e:
+            parser.error(f"Invalid --ramp-up: {e}")
+        if args.ramp_steps < 0:
+            parser.error("--ramp-steps cannot be negative")
+        if args.replay or args.sweep:
+            parser.error("--ramp-up cannot be combined with --replay or --sweep")
+    if (args.warmup or args.ramp_up) and (args.processes or args.workers):
+        parser.error("--warmup and --ramp-up are not supported in distributed mode")
+    if args.session_turns is not None:
+        if args.session_turns < 1:
+            parser.error("--session-turns must be at least 1")
+        if args.replay or args.sweep or args.duration or args.rps or args.prefix_cache or args.processes or args.workers:
+            parser.error("--session-turns cannot be combined with --replay, --sweep, --duration, --rps, "
+                         "--prefix-cache or distributed mode")
+    if args.endpoints:
+        try:
+            configured_endpoints(args.endpoints)
+        except (OSError, ValueError) as e:
+            parser.error(f"Invalid --endpoints file: {e}")
+    
     main(args)
\ No newline at end of file
@@ -0,0 +1,339 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import re
+import time
+import uuid
+from typing import Dict, Any, Optional
+
+# 与Azure OpenAI相同的部署路径：/openai/deployments/{model}/chat/completions
+DEPLOYMENT_PATH = re.compile(r"^/openai/deployments/([^/?]+)/chat/completions(\?.*)?$")
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 429: "Too Many Requests",
+               500: "Internal Server Error", 503: "Service Unavailable"}
+
+# 模拟Azure OpenAI的提示词缓存：提示词不少于1024个token时才缓存，按128个token的块匹配前缀
+CACHE_MIN_TOKENS = 1024
+CACHE_BLOCK_TOKENS = 128
+CACHE_MAX_ENTRIES = 1_000_000
+
+WORDS = ("the", "model", "token", "answer", "data", "cloud", "latency", "request", "system", "result",
+         "because", "first", "then", "which", "value", "user", "step", "check", "so", "and")
+
+
+class MockDeployment:
+    """模拟PTU部署的行为：首token时间、解码速度、输出长度分布、并发上限和故障注入"""
+
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.in_flight = 0
+        self.served = 0
+        self.prefix_blocks = set()
+
+    def output_tokens(self, max_tokens: int) -> int:
+        """按配置的分布抽取输出token数，不超过请求的max_tokens"""
+        mean = self.args.output_tokens
+        distribution = self.args.output_distribution
+        if distribution == "uniform":
+            value = self.rng.uniform(0, 2 * mean)
+        elif distribution == "exponential":
+            value = self.rng.expovariate(1 / mean)
+        elif distribution == "lognormal":
+            # sigma固定为0.5，mu使均值等于mean
+            value = self.rng.lognormvariate(0, 0.5) * mean / 1.133
+        else:
+            value = mean
+        return max(1, min(int(value), max_tokens))
+
+    def ttft(self) -> float:
+        return max(0.0, self.rng.gauss(self.args.ttft, self.args.ttft_jitter))
+
+    def tokens(self, count: int):
+        """生成DeepSeek-R1风格的输出：前一部分token包在<think>标签中"""
+        think = int(count * self.args.think_ratio)
+        for i in range(count):
+            word = self.rng.choice(WORDS)
+            if think and i == 0:
+                yield "<think>" + word
+            elif think and i == think:
+                yield "</think>" + word
+            else:
+                yield " " + word
+
+    def cached_tokens(self, prompt: str) -> int:
+        """返回提示词中命中前缀缓存的token数（按约4个字符一个token估算），并把本次提示词的各个前缀块加入缓存"""
+        if not self.args.prefix_cache or len(prompt) // 4 < CACHE_MIN_TOKENS:
+            return 0
+        if len(self.prefix_blocks) > CACHE_MAX_ENTRIES:
+            self.prefix_blocks.clear()
+        block_chars = CACHE_BLOCK_TOKENS * 4
+        digest = hashlib.blake2b(digest_size=16)
+        cached = 0
+        matching = True
+        for end in range(block_chars, len(prompt) + 1, block_chars):
+            digest.update(prompt[end - block_chars:end].encode())
+            key = digest.digest()
+            if matching and key in self.prefix_blocks:
+                cached = end // 4
+            else:
+                matching = False
+                self.prefix_blocks.add(key)
+        return cached if cached >= CACHE_MIN_TOKENS else 0
+
+    def response_headers(self, received: float, request_id: Optional[str] = None) -> Dict[str, str]:
+        """Azure风格的响应头：服务端处理时间（从网关转发请求起算）、区域和限流余量"""
+        headers = {"x-envoy-upstream-service-time": str(round((time.perf_counter() - received) * 1000))}
+        if request_id:
+            headers["x-request-id"] = request_id
+        if self.args.region:
+            headers["x-ms-region"] = self.args.region
+        if self.args.max_concurrency:
+            headers["x-ratelimit-remaining-requests"] = str(max(0, self.args.max_concurrency - self.in_flight))
+        return headers
+
+    def failure(self) -> Optional[int]:
+        """按注入比例返回要模拟的错误状态码；None表示正常处理"""
+        roll = self.rng.random()
+        if roll < self.args.error_rate:
+            return 500
+        if roll < self.args.error_rate + self.args.unavailable_rate:
+            return 503
+        return None
+
+
+def usage_block(prompt_tokens: int, completion_tokens: int, think_ratio: float, cached_tokens: int = 0) -> Dict[str, Any]:
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens,
+        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+        "completion_tokens_details": {"reasoning_tokens": int(completion_tokens * think_ratio)}
+    }
+
+
+async def write_response(writer: asyncio.StreamWriter, status: int, body: bytes,
+                         headers: Dict[str, str] = None, keep_alive: bool = True):
+    lines = [f"HTTP/1.1 {status} {STATUS_TEXT.get(status, '')}",
+             "Content-Type: application/json",
+             f"Content-Length: {len(body)}",
+             f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+    writer.write(("\r\n".join(lines) + "\r\n\r\n").encode() + body)
+    await writer.drain()
+
+
+async def write_chunk(writer: asyncio.StreamWriter, data: bytes):
+    writer.write(b"%x\r\n%s\r\n" % (len(data), data))
+    await writer.drain()
+
+
+async def handle_completion(deployment: MockDeployment, model: str, request: Dict[str, Any],
+                            writer: asyncio.StreamWriter, keep_alive: bool, received: float) -> bool:
+    """处理一个chat completions请求；返回False表示连接已被故障注入关闭。received为请求转发到模型的时间"""
+    args = deployment.args
+    prompt = "".join(message.get("content") or "" for message in request.get("messages", []))
+    prompt_tokens = max(1, len(prompt) // 4)
+    cached_tokens = deployment.cached_tokens(prompt)
+    completion_tokens = deployment.output_tokens(request.get("max_tokens") or 4096)
+    request_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+    interval = 1 / args.tokens_per_second if args.tokens_per_second > 0 else 0.0
+    disconnect = deployment.rng.random() < args.disconnect_rate
+
+    # 预填充时间与未命中缓存的提示词token数成正比
+    prefill = (prompt_tokens - cached_tokens) / args.prefill_tokens_per_second if args.prefill_tokens_per_second else 0.0
+    first_token_at = time.perf_counter() + deployment.ttft() + prefill
+    await asyncio.sleep(first_token_at - time.perf_counter())
+
+    if not request.get("stream"):
+        # 非流式：等待全部token生成完毕后一次性返回
+        await asyncio.sleep(interval * (completion_tokens - 1))
+        if disconnect:
+            return False
+        body = {
+            "id": request_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(deployment.tokens(completion_tokens))},
+                "finish_reason": "length" if completion_tokens == request.get("max_tokens") else "stop"
+            }],
+            "usage": usage_block(prompt_tokens, completion_tokens, args.think_ratio, cached_tokens)
+        }
+        await write_response(writer, 200, json.dumps(body).encode(), deployment.response_headers(received, request_id),
+                             keep_alive)
+        return True
+
+    head = ["HTTP/1.1 200 OK", "Content-Type: text/event-stream", "Transfer-Encoding: chunked",
+            f"Connection: {'keep-alive' if keep_alive else 'close'}"]
+    head.extend(f"{name}: {value}" for name, value in deployment.response_headers(received, request_id).items())
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+
+    def event(delta: Dict[str, Any], finish_reason: Optional[str] = None, usage: Dict[str, Any] = None) -> bytes:
+        chunk = {
+            "id": request_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}] if delta is not None else [],
+        }
+        if usage:
+            chunk["usage"] = usage
+        return b"data: " + json.dumps(chunk).encode() + b"\n\n"
+
+    await write_chunk(writer, event({"role": "assistant", "content": ""}))
+    for i, text in enumerate(deployment.tokens(completion_tokens)):
+        # 按绝对时间安排每个token，避免sleep误差累积
+        delay = first_token_at + i * interval - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if disconnect and i == completion_tokens // 2:
+            return False
+        await write_chunk(writer, event({"content": text}))
+    await write_chunk(writer, event({}, "stop"))
+    # 与Azure OpenAI一致，请求指定stream_options.include_usage时最后一个数据块才携带usage
+    if (request.get("stream_options") or {}).get("include_usage"):
+        await write_chunk(writer, event(None, usage=usage_block(prompt_tokens, completion_tokens,
+                                                                    args.think_ratio, cached_tokens)))
+    await write_chunk(writer, b"data: [DONE]\n\n")
+    writer.write(b"0\r\n\r\n")
+    await writer.drain()
+    return True
+
+
+async def handle_connection(deployment: MockDeployment, reader: asyncio.StreamReader,
+                            writer: asyncio.StreamWriter):
+    """HTTP/1.1长连接：在同一连接上依次处理多个请求"""
+    args = deployment.args
+    try:
+        while True:
+            try:
+                head = await reader.readuntil(b"\r\n\r\n")
+            except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+                return
+            request_line, *header_lines = head.decode("latin-1").split("\r\n")
+            method, path, _ = request_line.split(" ", 2)
+            headers = {}
+            for line in header_lines:
+                if ":" in line:
+                    name, value = line.split(":", 1)
+                    headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get("content-length", 0)))
+            keep_alive = headers.get("connection", "").lower() != "close"
+            if args.gateway_delay:
+                # 模拟网关和网络上的耗时，不计入服务端报告的处理时间
+                await asyncio.sleep(args.gateway_delay)
+            received = time.perf_counter()
+
+            match = DEPLOYMENT_PATH.match(path)
+            if method != "POST" or not match:
+                await write_response(writer, 404, b'{"error":{"code":"404","message":"Resource not found"}}',
+                                     keep_alive=keep_alive)
+            elif args.max_concurrency and deployment.in_flight >= args.max_concurrency:
+                # 超过并发上限时与PTU一样返回429，并给出重试等待时间
+                message = {"error": {"code": "429", "message": "Requests to the deployment have exceeded the "
+                                                               "rate limit of your current pricing tier."}}
+                extra = deployment.response_headers(received)
+                extra["Retry-After"] = str(max(1, round(args.retry_after)))
+                extra["retry-after-ms"] = str(int(args.retry_after * 1000))
+                await write_response(writer, 429, json.dumps(message).encode(), extra, keep_alive)
+            elif (status := deployment.failure()) is not None:
+                message = {"error": {"code": str(status), "message": "Injected failure"}}
+                await write_response(writer, status, json.dumps(message).encode(), keep_alive=keep_alive)
+            else:
+                try:
+                    request = json.loads(body)
+                except ValueError:
+                    await write_response(writer, 400, b'{"error":{"code":"400","message":"Invalid JSON"}}',
+                                         keep_alive=keep_alive)
+                    continue
+                deployment.in_flight += 1
+                try:
+                    if not await handle_completion(deployment, match.group(1), request, writer, keep_alive, received):
+                        return
+                finally:
+                    deployment.in_flight -= 1
+                deployment.served += 1
+
+            if not keep_alive:
+                return
+    except ConnectionError:
+        return
+    finally:
+        writer.close()
+
+
+async def report(deployment: MockDeployment, interval: float):
+    """定期输出服务端视角的请求速率和在途请求数"""
+    served = 0
+    while True:
+        await asyncio.sleep(interval)
+        rate = (deployment.served - served) / interval
+        served = deployment.served
+        print(f"served {served} requests | {rate:.1f} req/s | in flight {deployment.in_flight}", flush=True)
+
+
+async def serve(args):
+    deployment = MockDeployment(args)
+    server = await asyncio.start_server(lambda r, w: handle_connection(deployment, r, w),
+                                        args.host, args.port, backlog=4096)
+    host, port = server.sockets[0].getsockname()[:2]
+    print(f"Mock Azure OpenAI endpoint listening on http://{host}:{port}", flush=True)
+    if args.report_interval:
+        asyncio.get_running_loop().create_task(report(deployment, args.report_interval))
+    async with server:
+        await server.serve_forever()
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Local mock of an Azure OpenAI / PTU chat completions deployment")
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--ttft", type=float, default=0.2,
+                        help="Mean time to first token in seconds")
+    parser.add_argument("--ttft-jitter", type=float, default=0.0,
+                        help="Standard deviation of the time to first token in seconds")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0,
+                        help="Decode speed per request (0 returns all tokens at once)")
+    parser.add_argument("--output-tokens", type=int, default=200,
+                        help="Mean number of output tokens (capped by the request's max_tokens)")
+    parser.add_argument("--output-distribution", choices=["fixed", "uniform", "exponential", "lognormal"],
+                        default="fixed", help="Distribution of output lengths around --output-tokens")
+    parser.add_argument("--think-ratio", type=float, default=0.5,
+                        help="Fraction of output tokens wrapped in <think>...</think>")
+    parser.add_argument("--prefill-tokens-per-second", type=float, default=0.0,
+                        help="Add prompt tokens not served from the prefix cache / this rate to the TTFT (0 = ignore prompt length)")
+    parser.add_argument("--prefix-cache", action="store_true",
+                        help="Simulate prompt caching: repeated prompt prefixes of 1024+ tokens are cached in 128-token blocks")
+    parser.add_argument("--max-concurrency", type=int, default=0,
+                        help="Return 429 with Retry-After above this many in-flight requests (0 = unlimited)")
+    parser.add_argument("--retry-after", type=float, default=1.0,
+                        help="Retry-After value in seconds for 429 responses")
+    parser.add_argument("--error-rate", type=float, default=0.0,
+                        help="Fraction of requests that fail with HTTP 500")
+    parser.add_argument("--unavailable-rate", type=float, default=0.0,
+                        help="Fraction of requests that fail with HTTP 503")
+    parser.add_argument("--disconnect-rate", type=float, default=0.0,
+                        help="Fraction of requests whose connection is dropped mid-response")
+    parser.add_argument("--region", type=str, default=None,
+                        help="Value of the x-ms-region response header (omitted by default)")
+    parser.add_argument("--gateway-delay", type=float, default=0.0,
+                        help="Extra delay in seconds before each request is processed, not included in "
+                             "x-envoy-upstream-service-time (simulates gateway/network time)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="Random seed for lengths, jitter and failures")
+    parser.add_argument("--report-interval", type=float, default=5.0,
+                        help="Seconds between throughput reports (0 disables)")
+    return parser
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(serve(build_parser().parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,112 @@
+import concurrent.futures
+import random
+import threading
+import time
+from typing import List, Dict, Any, Iterable, Iterator, Optional
+
+from latency_stats import BenchmarkStats, shift_start
+
+
+def arrival_offsets(rps: float, arrival: str = "constant", seed: Optional[int] = None) -> Iterator[float]:
+    """生成相对于开始时间的计划发送时间（秒）
+
+    constant: 固定间隔1/rps；poisson: 间隔服从均值为1/rps的指数分布。
+    """
+    rng = random.Random(seed)
+    offset = 0.0
+    while True:
+        yield offset
+        if arrival == "poisson":
+            offset += rng.expovariate(rps)
+        else:
+            offset += 1.0 / rps
+
+
+def apply_schedule_lag(result: Dict[str, Any], lag: float) -> Dict[str, Any]:
+    """把延迟的起点从实际发送时间改为计划发送时间，避免coordinated omission
+
+    service_time保留从实际发送开始的耗时，schedule_lag为实际发送落后计划的时间。
+    """
+    result["schedule_lag"] = lag
+    result["service_time"] = result["latency"]
+    return shift_start(result, lag)
+
+
+def run_schedule(benchmark, schedule: Iterable[tuple], total: Optional[int], max_in_flight: int,
+                 writer=None, ramp=None, max_lag: Optional[float] = None) -> tuple:
+    """按计划时间发送请求，不等待之前的请求完成
+
+    schedule依次产生(序号, 问题或请求, 相对开始时间的计划发送时间)，可以是惰性读取的迭代器。
+    工作线程数为max_in_flight；线程都忙时请求在队列中等待，等待时间计入延迟。
+    计划时间为None的请求在有空闲线程时才发送，不统计schedule lag。
+    指定ramp（warmup.RampUp）时闭环并发数逐步增加，加压阶段开始的请求不计入统计，总耗时从稳态开始计算。
+    指定max_lag时，轮到发送时已晚于计划时间超过max_lag秒的请求不再发送，计为missed：服务跟不上到达速率时
+    积压的请求很快被跳过，等待队列的长度不超过约max_lag秒内到达的请求数。
+    """
+    stats = BenchmarkStats()
+    slots = threading.BoundedSemaphore(max_in_flight)
+    lock = threading.Lock()
+    completed = 0
+
+    def process_question(index, question, intended_time):
+        nonlocal completed
+        try:
+            # 运行停止后，还在队列中等待的请求不再发送
+            if benchmark.control.stopping.is_set():
+                return
+            if intended_time is None:
+                started = time.perf_counter()
+                result = benchmark.run_single_request(question)
+            else:
+                started = intended_time
+                lag = time.perf_counter() - intended_time
+                if max_lag is not None and lag > max_lag:
+                    stats.record_missed()
+                    return
+                result = apply_schedule_lag(benchmark.run_single_request(question), lag)
+            if ramp is None or ramp.measured(started):
+                stats.record(result)
+                if writer:
+                    writer.write(index, result)
+        finally:
+            if intended_time is None:
+                slots.release()
+        with lock:
+            completed += 1
+            done = completed
+        benchmark.progress(f"Completed {done}/{total} requests" if total else f"Completed {done} requests")
+
+    start_time = time.perf_counter()
+    if ramp:
+        ramp.begin(start_time)
+        ramp.hold(slots)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=max_in_flight) as executor:
+        for index, question, offset in schedule:
+            if offset is None:
+                slots.acquire()
+                if benchmark.control.stopping.is_set():
+                    slots.release()
+                    break
+                executor.submit(process_question, index, question, None)
+                continue
+            intended_time = start_time + offset
+            delay = intended_time - time.perf_counter()
+            if benchmark.control.stopping.wait(delay) if delay > 0 else benchmark.control.stopping.is_set():
+                break
+            executor.submit(process_question, index, question, intended_time)
+
+    end_time = time.perf_counter()
+    latency = end_time - (ramp.steady_start if ramp else start_time)
+
+    return latency, stats
+
+
+def run_benchmark_open_loop(benchmark, questions: List[str], rps: float, arrival: str,
+                            max_in_flight: int, seed: Optional[int] = None, writer=None, ramp=None) -> tuple:
+    """开环执行benchmark测试：按目标速率（固定间隔或泊松到达）发送请求；指定ramp时速率从低到高逐步增加"""
+    offsets = arrival_offsets(rps, arrival, seed)
+    if ramp:
+        offsets = ramp.warp(offsets)
+    schedule = ((i, question, offset) for i, (question, offset) in enumerate(zip(questions, offsets)))
+    return run_schedule(benchmark, schedule, len(questions), max_in_flight, writer, ramp)
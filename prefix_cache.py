@@ -0,0 +1,123 @@
+import functools
+import random
+from typing import List, Dict, Any
+
+from latency_stats import BenchmarkStats
+from generate_workload import WORDS, CHARS_PER_TOKEN, parse_size
+
+VARIANTS = ("cached", "uncached")
+
+
+def parse_prefix_sizes(spec: str) -> List[tuple]:
+    """解析"0,1k,4k,16k"，返回[(标签, token数)]"""
+    sizes = []
+    for part in spec.split(","):
+        label = part.strip().lower()
+        if label:
+            sizes.append((label, parse_size(label)))
+    if not sizes or any(size < 0 for _, size in sizes):
+        raise ValueError(f"Invalid prefix sizes: {spec}")
+    return sizes
+
+
+@functools.lru_cache(maxsize=None)
+def shared_prefix(tokens: int) -> str:
+    """固定的系统上下文：同一长度在每次运行中都生成相同的文本"""
+    if tokens <= 0:
+        return ""
+    rng = random.Random(tokens)
+    words = []
+    chars = 0
+    while chars < tokens * CHARS_PER_TOKEN:
+        word = rng.choice(WORDS)
+        words.append(word)
+        chars += len(word) + 1
+    return "Reference material:\n" + " ".join(words) + "\n\n"
+
+
+def prefix_item(question: str, label: str, tokens: int, variant: str, nonce: int) -> Dict[str, Any]:
+    """一个请求的描述：问题、前缀长度和开头的编号；消息在发送时由prefix_messages拼接，不在内存中保留前缀文本
+
+    两种变体长度相同：cached的开头对所有请求相同，可以命中服务端的前缀缓存；
+    uncached在开头放一个随机编号，前缀缓存从第一个token起就无法匹配。
+    """
+    return {
+        "question": question,
+        "prefix_tokens": tokens,
+        "nonce": nonce if variant == "uncached" else 0,
+        "tag": f"prefix{label}_{variant}",
+    }
+
+
+def prefix_messages(item: Dict[str, Any], system_prompt: str) -> List[Dict[str, str]]:
+    """系统消息为编号、共享前缀加原系统提示词，用户消息为问题（各请求唯一的后缀）"""
+    header = f"Session {item['nonce']:012d}.\n"
+    return [
+        {"role": "system", "content": header + shared_prefix(item["prefix_tokens"]) + system_prompt},
+        {"role": "user", "content": item["question"]},
+    ]
+
+
+def prefix_cache_items(questions: List[str], sizes: List[tuple], seed: int = None) -> List[Dict[str, Any]]:
+    """为每个问题生成各前缀长度的cached/uncached两种请求，交错排列
+
+    相邻的请求轮流使用不同的前缀长度和变体，负载随时间的变化对各组的影响相同；
+    每个问题内变体的先后顺序交替，避免某一组总是先发送。
+    """
+    rng = random.Random(seed)
+    items = []
+    for i, question in enumerate(questions):
+        for j in range(len(sizes)):
+            label, size = sizes[(i + j) % len(sizes)]
+            variants = VARIANTS if i % 2 == 0 else VARIANTS[::-1]
+            for variant in variants:
+                items.append(prefix_item(question, label, size, variant, rng.randrange(1, 10 ** 12)))
+    return items
+
+
+def priming_items(sizes: List[tuple]) -> List[Dict[str, Any]]:
+    """正式测试前发送的请求，把各长度的共享前缀写入服务端缓存"""
+    return [prefix_item("Hello", label, size, "cached", 0) for label, size in sizes if size > 0]
+
+
+def prefix_cache_rows(stats: BenchmarkStats, sizes: List[tuple], stream: bool) -> List[Dict[str, Any]]:
+    """按前缀长度对比cached和uncached两组的p50延迟（流式时另比较TTFT）和缓存命中的token数"""
+    groups = stats.groups.get("tag", {})
+    rows = []
+    for label, size in sizes:
+        cached = groups.get(f"prefix{label}_cached")
+        uncached = groups.get(f"prefix{label}_uncached")
+        if not cached or not uncached:
+            continue
+        row = {"prefix": label, "prefix_tokens": size}
+        metrics = ("latency", "ttft") if stream else ("latency",)
+        for name in metrics:
+            cached_p50 = cached.summary(name)["p50"]
+            uncached_p50 = uncached.summary(name)["p50"]
+            row[f"{name}_p50_cached"] = round(cached_p50, 4)
+            row[f"{name}_p50_uncached"] = round(uncached_p50, 4)
+            row[f"{name}_delta"] = round(uncached_p50 - cached_p50, 4)
+            row[f"{name}_delta_percent"] = round((uncached_p50 - cached_p50) / uncached_p50 * 100, 1) if uncached_p50 else 0.0
+        for variant, group in (("cached", cached), ("uncached", uncached)):
+            row[f"{variant}_requests"] = group.num_requests
+            row[f"cached_tokens_mean_{variant}"] = round(group.histograms["cached_tokens"].mean(), 1)
+        rows.append(row)
+    return rows
+
+
+def prefix_cache_lines(rows: List[Dict[str, Any]], stream: bool) -> List[str]:
+    if not rows:
+        return []
+    name = "ttft" if stream else "latency"
+    title = "TTFT" if stream else "latency"
+    lines = ["Prefix Cache Results (p50 " + title + ", delta = uncached - cached):",
+             f"{'prefix':>7} | {'cached':>8} | {'uncached':>8} | {'delta':>8} | {'saved':>6} | "
+             f"{'cached tok (hit)':>16} | {'cached tok (miss)':>17}"]
+    for row in rows:
+        lines.append(f"{row['prefix']:>7} | {row[f'{name}_p50_cached']:>7.3f}s | {row[f'{name}_p50_uncached']:>7.3f}s | "
+                     f"{row[f'{name}_delta']:>7.3f}s | {row[f'{name}_delta_percent']:>5.1f}% | "
+                     f"{row['cached_tokens_mean_cached']:>16.0f} | {row['cached_tokens_mean_uncached']:>17.0f}")
+    if stream:
+        lines.append("End-to-end latency p50 delta: " + ", ".join(
+            f"{row['prefix']} {row['latency_delta']:.3f}s ({row['latency_delta_percent']:.1f}%)" for row in rows))
+    return lines
@@ -0,0 +1,65 @@
+from typing import List, Dict, Any, Optional
+
+# 默认记录的响应头：限流余量、区域、请求ID和服务端处理时间
+DEFAULT_CAPTURE_HEADERS = (
+    "x-ratelimit-remaining-requests",
+    "x-ratelimit-remaining-tokens",
+    "x-ms-region",
+    "x-request-id",
+    "apim-request-id",
+    "azureml-model-session",
+    "x-envoy-upstream-service-time",
+    "openai-processing-ms",
+)
+
+# 服务端报告的处理时间（毫秒），按顺序取第一个存在的
+SERVER_TIME_HEADERS = ("x-envoy-upstream-service-time", "openai-processing-ms")
+
+# 限流余量响应头 -> 结果字段
+REMAINING_HEADERS = {
+    "x-ratelimit-remaining-requests": "ratelimit_remaining_requests",
+    "x-ratelimit-remaining-tokens": "ratelimit_remaining_tokens",
+}
+
+
+def parse_capture_headers(spec: Optional[str]) -> List[str]:
+    """解析--capture-headers：逗号分隔的响应头名称，none表示不记录"""
+    if spec is None:
+        return list(DEFAULT_CAPTURE_HEADERS)
+    if spec.strip().lower() == "none":
+        return []
+    return [name.strip().lower() for name in spec.split(",") if name.strip()]
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+
+def header_fields(headers, names: List[str], headers_time: float) -> Dict[str, Any]:
+    """从响应头中提取要记录的字段；headers可以是requests或aiohttp的响应头（名称不区分大小写）
+
+    region、限流余量和server_time也只从names中的响应头派生，--capture-headers none时一项都不记录。
+    server_time为服务端报告的处理时间；network_overhead为客户端收到响应头的耗时减去server_time，
+    即请求和响应在网络、网关和排队中花费的时间。非流式响应在生成完毕后才返回响应头，两者都包含生成时间；
+    流式响应的响应头在首个token时返回。
+    """
+    fields: Dict[str, Any] = {}
+    captured = {name: headers[name] for name in names if name in headers}
+    if captured:
+        fields["response_headers"] = captured
+    if "x-ms-region" in names and headers.get("x-ms-region"):
+        fields["region"] = headers["x-ms-region"]
+    for header, field in REMAINING_HEADERS.items():
+        value = _number(headers.get(header)) if header in names else None
+        if value is not None:
+            fields[field] = value
+    for header in SERVER_TIME_HEADERS:
+        value = _number(headers.get(header)) if header in names else None
+        if value is not None:
+            fields["server_time"] = value / 1000
+            fields["network_overhead"] = max(0.0, headers_time - value / 1000)
+            break
+    return fields
@@ -0,0 +1,74 @@
+import hashlib
+import json
+import queue
+import threading
+import time
+from typing import List, Dict, Any, Iterator, Optional
+
+# 队列满时请求线程等待写入线程，保证内存占用不随运行时长增长
+QUEUE_SIZE = 10000
+
+
+class ResultWriter:
+    """后台线程把每个请求的结果追加为一行JSON记录，请求完成后立即落盘
+
+    记录包含时间、token数、状态等字段；响应内容按body_mode截断、哈希、完整保留或丢弃。
+    """
+
+    def __init__(self, path: str, body_mode: str = "truncate", body_chars: int = 200):
+        self.path = path
+        self.body_mode = body_mode
+        self.body_chars = body_chars
+        # 附加到之后每条记录的字段，例如扫描模式的负载级别
+        self.context: Dict[str, Any] = {}
+        # 本轮问题在完整问题列表中的序号；为None时记录运行器传入的序号
+        self.indices: Optional[List[int]] = None
+        self.queue: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue(QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def write(self, index: int, result: Dict[str, Any]):
+        # 运行停止时被取消的请求不写入记录，断点续跑时会重新发送
+        if result.get("cancelled"):
+            return
+        if self.indices is not None:
+            index = self.indices[index]
+        record = {"index": index, "timestamp": round(time.time(), 3)}
+        record.update(self.context)
+        record.update((name, value) for name, value in result.items() if name != "content" and value is not None)
+        content = result.get("content")
+        if content is not None:
+            record["content_chars"] = len(content)
+            if self.body_mode == "full":
+                record["content"] = content
+            elif self.body_mode == "truncate":
+                record["content"] = content[:self.body_chars]
+            elif self.body_mode == "hash":
+                record["content_sha256"] = hashlib.sha256(content.encode("utf-8")).hexdigest()
+        self.queue.put(record)
+
+    def close(self):
+        """写完队列中剩余的记录后停止写入线程"""
+        self.queue.put(None)
+        self.thread.join()
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self.queue.get()
+                if record is None:
+                    break
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                # 队列暂时为空时刷新到磁盘，进程崩溃时最多丢失正在写的一批记录
+                if self.queue.empty():
+                    f.flush()
+
+
+def read_records(path: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取记录文件，不把整个文件载入内存；忽略崩溃时写了一半的最后一行"""
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
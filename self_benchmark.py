@@ -0,0 +1,119 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+import argparse
+import itertools
+import os
+import subprocess
+import sys
+import threading
+import time
+from typing import List, Dict, Any
+
+from distributed import drain
+from endpoint_router import Endpoint, EndpointRouter
+import json_codec
+
+MOCK_SERVER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mock_server.py")
+LISTENING_PREFIX = "Mock Azure OpenAI endpoint listening on "
+
+# 空操作服务端：立即返回一个token，不模拟首token时间和解码速度
+NOOP_SERVER_ARGS = ["--ttft", "0", "--tokens-per-second", "0", "--output-tokens", "1", "--think-ratio", "0",
+                    "--report-interval", "0"]
+
+
+def start_noop_server() -> tuple:
+    """在子进程中启动空操作的mock_server，返回(进程, 地址)；服务端的CPU开销不计入本进程"""
+    process = subprocess.Popen([sys.executable, MOCK_SERVER, "--port", "0"] + NOOP_SERVER_ARGS,
+                               stdout=subprocess.PIPE, text=True)
+    for line in process.stdout:
+        if line.startswith(LISTENING_PREFIX):
+            threading.Thread(target=drain, args=(process.stdout,), daemon=True).start()
+            return process, line[len(LISTENING_PREFIX):].strip()
+    raise RuntimeError("mock_server.py exited before it started listening")
+
+
+def measure(run, count: int) -> Dict[str, Any]:
+    """执行一轮请求，返回墙钟时间、本进程所有线程的CPU时间和统计"""
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    _, stats = run(count)
+    wall = time.perf_counter() - wall_start
+    cpu = time.process_time() - cpu_start
+    return {
+        "requests": stats.num_requests,
+        "successful": stats.successful_requests,
+        "requests_per_second": stats.num_requests / wall,
+        "cpu_us_per_request": cpu / stats.num_requests * 1_000_000,
+        "cpu_utilization": cpu / wall,
+        "latency_p50": stats.summary("latency")["p50"],
+    }
+
+
+def main(args):
+    # 导入main时会加载测试问题，请求体与正式测试使用的相同
+    import main as harness
+
+    process, address = start_noop_server()
+    router = EndpointRouter([Endpoint("noop", address, "noop", "2024-05-01-preview", "self-benchmark")])
+    levels = [int(level) for level in args.parallel.split(",")]
+    benchmark = harness.AzureAIBenchmark(stream=args.stream, pool_size=max(levels), router=router)
+    # 不输出逐请求的进度，否则终端输出会成为主要开销并淹没结果表格
+    benchmark.quiet = True
+    async_runner = None
+    if args.engine == "async":
+        from async_engine import AsyncBenchmarkRunner
+        async_runner = AsyncBenchmarkRunner(benchmark, max(levels))
+    source = harness.test_questions
+
+    print(f"Self-benchmark against a no-op server at {address}: engine {args.engine}, "
+          f"{'streaming' if args.stream else 'non-streaming'}, JSON codec {json_codec.JSON_BACKEND}, "
+          f"{args.requests} requests per level")
+    print(f"{'parallel':>8} | {'req/s':>8} | {'CPU us/req':>10} | {'CPU util':>8} | {'p50 ms':>7} | failed")
+    rows: List[Dict[str, Any]] = []
+    try:
+        for level in levels:
+            def run(count):
+                questions = list(itertools.islice(itertools.cycle(source), count))
+                benchmark.prepare(questions)
+                if async_runner:
+                    return async_runner.run(questions, level)
+                if level == 1:
+                    return harness.run_benchmark_sequential(benchmark, questions)
+                return harness.run_benchmark_parallel(benchmark, questions, level)
+
+            # 预热：建立连接、填充请求体缓存
+            measure(run, max(level, 20))
+            row = measure(run, args.requests)
+            row["parallel"] = level
+            rows.append(row)
+            print(f"{level:>8} | {row['requests_per_second']:>8.0f} | {row['cpu_us_per_request']:>10.0f} | "
+                  f"{row['cpu_utilization'] * 100:>7.0f}% | {row['latency_p50'] * 1000:>7.2f} | "
+                  f"{row['requests'] - row['successful']}")
+    finally:
+        if async_runner:
+            async_runner.close()
+        process.terminate()
+        process.wait()
+
+    best = max(rows, key=lambda row: row["requests_per_second"])
+    cheapest = min(row["cpu_us_per_request"] for row in rows)
+    print("")
+    print(f"Maximum sustained rate: {best['requests_per_second']:.0f} req/s at parallel {best['parallel']}")
+    print(f"Client CPU per request: {cheapest:.0f} us, so one core saturates at about "
+          f"{1_000_000 / cheapest:.0f} req/s; use --processes or --workers above that rate")
+    if (os.cpu_count() or 1) == 1:
+        print("Note: only one CPU is available, so the no-op server competes with the client for it")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the benchmark client's own overhead against a local no-op server")
+    parser.add_argument("--requests", type=int, default=2000,
+                        help="Requests per concurrency level")
+    parser.add_argument("--parallel", type=str, default="1,8,32",
+                        help="Comma-separated concurrency levels to measure")
+    parser.add_argument("--engine", choices=["thread", "async"], default="thread",
+                        help="Load engine to measure")
+    parser.add_argument("--stream", action="store_true",
+                        help="Measure the SSE streaming path")
+    main(parser.parse_args())
@@ -0,0 +1,149 @@
+import concurrent.futures
+import math
+import threading
+import time
+from typing import List, Dict, Any
+
+from latency_stats import BenchmarkStats
+from token_usage import split_reasoning
+
+# 会话模式中按累计上下文长度分组时的最小区间（token），更长的上下文按2的幂划分区间
+CONTEXT_BUCKET_TOKENS = 1024
+
+
+def context_bucket(tokens: int) -> str:
+    """把提示词token数归入0-1k、1k-2k、2k-4k……这样的区间"""
+    if tokens < CONTEXT_BUCKET_TOKENS:
+        return f"0-{CONTEXT_BUCKET_TOKENS // 1024}k"
+    lower = 2 ** int(math.log2(tokens / CONTEXT_BUCKET_TOKENS))
+    return f"{lower}k-{lower * 2}k"
+
+
+class Conversation:
+    """一个虚拟用户的多轮对话：每一轮在历史消息后追加上一轮的回答和一个新问题
+
+    keep_reasoning为False时历史中的回答去掉<think>部分（DeepSeek-R1建议多轮对话不回传推理过程）；
+    某一轮失败时这一轮的问题不进入历史，后续轮次照常发送。
+    """
+
+    def __init__(self, index: int, questions: List[str], system_prompt: str, keep_reasoning: bool = False):
+        self.index = index
+        self.questions = questions
+        self.keep_reasoning = keep_reasoning
+        self.history: List[Dict[str, str]] = [{"role": "system", "content": system_prompt}]
+
+    def request(self, turn: int) -> Dict[str, Any]:
+        """第turn轮（从0开始）的请求：完整的历史消息加本轮问题"""
+        return {"messages": self.history + [{"role": "user", "content": self.questions[turn]}]}
+
+    def finish_turn(self, turn: int, request: Dict[str, Any], result: Dict[str, Any]) -> Dict[str, Any]:
+        """记录本轮的轮次和上下文长度；成功时把问题和回答追加到历史"""
+        # 服务端未返回提示词token数时按约4字符/token估算
+        context_tokens = result.get("prompt_tokens")
+        if context_tokens is None:
+            context_tokens = sum(len(message["content"]) for message in request["messages"]) // 4
+        result["turn"] = turn + 1
+        result["context_tokens"] = context_tokens
+        result["context_bucket"] = context_bucket(context_tokens)
+        if result["success"]:
+            content = result.get("content") or ""
+            answer = content if self.keep_reasoning else split_reasoning(content)[1].strip()
+            self.history.append(request["messages"][-1])
+            self.history.append({"role": "assistant", "content": answer})
+        return result
+
+
+def build_conversations(questions: List[str], turns: int, system_prompt: str,
+                        keep_reasoning: bool = False) -> List[Conversation]:
+    """把问题列表按顺序每turns个分为一个对话；最后一个对话的轮数可能不足turns"""
+    return [Conversation(i // turns, questions[i:i + turns], system_prompt, keep_reasoning)
+            for i in range(0, len(questions), turns)]
+
+
+def run_conversations(benchmark, conversations: List[Conversation], num_users: int, turns: int,
+                      writer=None, ramp=None) -> tuple:
+    """num_users个虚拟用户并发进行对话，每个对话内的各轮依次发送（收到回答后才发送下一轮）
+
+    结果的序号为问题在问题列表中的位置；返回(总耗时, 统计)。指定ramp时同时对话的用户数逐步增加。
+    """
+    stats = BenchmarkStats()
+    lock = threading.Lock()
+    users = threading.Semaphore(num_users)
+    total = sum(len(conversation.questions) for conversation in conversations)
+    completed = 0
+
+    def process_conversation(conversation: Conversation):
+        nonlocal completed
+        with users:
+            for turn in range(len(conversation.questions)):
+                if benchmark.control.stopping.is_set():
+                    return
+                request = conversation.request(turn)
+                started = time.perf_counter()
+                result = conversation.finish_turn(turn, request, benchmark.run_single_request(request))
+                if ramp is None or ramp.measured(started):
+                    stats.record(result)
+                    if writer:
+                        writer.write(conversation.index * turns + turn, result)
+                with lock:
+                    completed += 1
+                    done = completed
+                benchmark.progress(f"Completed {done}/{total} requests (conversation {conversation.index + 1}, "
+                                   f"turn {turn + 1})")
+
+    start_time = time.perf_counter()
+    if ramp:
+        ramp.begin(start_time)
+        ramp.hold(users)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=num_users) as executor:
+        for future in [executor.submit(process_conversation, conversation) for conversation in conversations]:
+            future.result()
+
+    end_time = time.perf_counter()
+    latency = end_time - (ramp.steady_start if ramp else start_time)
+
+    return latency, stats
+
+
+def session_rows(stats: BenchmarkStats, field: str, stream: bool) -> List[Dict[str, Any]]:
+    """按轮次或上下文区间汇总：请求数、成功率、平均提示词token数、延迟和TTFT分位数"""
+    rows = []
+    for value, group in sorted(stats.groups.get(field, {}).items(), key=lambda item: _natural_key(item[0])):
+        latency = group.summary("latency")
+        row = {
+            field: value,
+            "num_requests": group.num_requests,
+            "success_rate": round(group.successful_requests / group.num_requests * 100, 2) if group.num_requests else 0.0,
+            "mean_prompt_tokens": round(group.prompt_tokens / group.successful_requests) if group.successful_requests else None,
+            "latency_p50": round(latency["p50"], 4),
+            "latency_p95": round(latency["p95"], 4),
+        }
+        if stream:
+            ttft = group.summary("ttft")
+            row["ttft_p50"] = round(ttft["p50"], 4)
+            row["ttft_p95"] = round(ttft["p95"], 4)
+        rows.append(row)
+    return rows
+
+
+def session_lines(rows: List[Dict[str, Any]], field: str, label: str, stream: bool) -> List[str]:
+    if not rows:
+        return []
+    lines = [f"Per-{label} Results:",
+             f"{label.lower():>10} | {'requests':>8} | {'success':>7} | {'prompt tok':>10} | {'p50':>7} | {'p95':>7}"
+             + (f" | {'ttft p50':>8} | {'ttft p95':>8}" if stream else "")]
+    for row in rows:
+        prompt = f"{row['mean_prompt_tokens']:>10}" if row["mean_prompt_tokens"] is not None else f"{'-':>10}"
+        line = (f"{row[field]:>10} | {row['num_requests']:>8} | {row['success_rate']:>6.1f}% | {prompt} | "
+                f"{row['latency_p50']:>6.3f}s | {row['latency_p95']:>6.3f}s")
+        if stream:
+            line += f" | {row['ttft_p50']:>7.3f}s | {row['ttft_p95']:>7.3f}s"
+        lines.append(line)
+    return lines
+
+
+def _natural_key(value: str) -> tuple:
+    # 轮次和上下文区间按数值排序（2在10之前，2k-4k在16k-32k之前）
+    digits = "".join(char if char.isdigit() else " " for char in value).split()
+    return tuple(int(number) for number in digits), value
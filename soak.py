@@ -0,0 +1,265 @@
+import itertools
+import os
+import resource
+import sys
+import threading
+import time
+from typing import List, Dict, Any, Iterator, Optional
+
+from latency_stats import LatencyHistogram
+from live_metrics import error_class
+from open_loop import arrival_offsets
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+# 比较漂移时取最前和最后各多大比例的窗口
+DRIFT_FRACTION = 0.25
+
+# 第一个窗口之后常驻内存增长超过此值（MB，且超过10%）时提示可能存在内存泄漏
+MEMORY_GROWTH_WARNING_MB = 20
+
+# (窗口字段, 显示名, 变大是否为变差)
+DRIFT_METRICS = (
+    ("latency_p50", "Latency p50", True),
+    ("latency_p95", "Latency p95", True),
+    ("requests_per_second", "Requests/s", False),
+    ("output_tokens_per_second", "Output tokens/s", False),
+)
+
+
+def parse_duration(text: str) -> float:
+    """解析90、30s、15m、4h、1d这样的时长，返回秒数"""
+    text = text.strip().lower()
+    unit = DURATION_UNITS.get(text[-1:])
+    seconds = float(text[:-1]) * unit if unit else float(text)
+    if seconds <= 0:
+        raise ValueError(f"duration must be positive: {text}")
+    return seconds
+
+
+def format_duration(seconds: float) -> str:
+    if seconds >= 3600:
+        return f"{seconds / 3600:g}h"
+    if seconds >= 60:
+        return f"{seconds / 60:g}m"
+    return f"{seconds:g}s"
+
+
+def current_rss_mb() -> float:
+    """当前进程的常驻内存（MB）；非Linux系统上退化为峰值常驻内存"""
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError, IndexError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # macOS上ru_maxrss的单位是字节，Linux上是KB
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+
+
+def soak_schedule(questions: List[Any], duration: float, rps: Optional[float] = None, arrival: str = "constant",
+                  seed: Optional[int] = None) -> Iterator[tuple]:
+    """按时长循环使用问题列表，产生(序号, 问题, 计划发送时间)
+
+    闭环模式（不指定rps）下计划时间为None，运行器在有空闲并发名额时才取下一个请求，
+    到达时长后停止产生新请求；开环模式按目标速率安排到时长为止。生成器是惰性的，内存占用与时长无关。
+    """
+    cycle = itertools.cycle(questions)
+    if rps:
+        for index, offset in enumerate(arrival_offsets(rps, arrival, seed)):
+            if offset >= duration:
+                return
+            yield index, next(cycle), offset
+        return
+    deadline = time.perf_counter() + duration
+    for index in itertools.count():
+        if time.perf_counter() >= deadline:
+            return
+        yield index, next(cycle), None
+
+
+class SoakWindow:
+    """一个统计窗口内的完成数、错误、token和延迟分布"""
+
+    def __init__(self, index: int):
+        self.index = index
+        self.completed = 0
+        self.errors: Dict[str, int] = {}
+        self.completion_tokens = 0
+        self.latency = LatencyHistogram()
+
+    def summary(self, seconds: float, rss_mb: float) -> Dict[str, Any]:
+        successful = self.latency.count
+        return {
+            "window": self.index,
+            "completed": self.completed,
+            "success_rate": round(successful / self.completed * 100, 2) if self.completed else 0.0,
+            "errors": dict(self.errors),
+            "requests_per_second": round(self.completed / seconds, 3),
+            "output_tokens_per_second": round(self.completion_tokens / seconds, 1),
+            "latency_p50": round(self.latency.percentile(50), 4) if successful else None,
+            "latency_p95": round(self.latency.percentile(95), 4) if successful else None,
+            "latency_p99": round(self.latency.percentile(99), 4) if successful else None,
+            "rss_mb": round(rss_mb, 1),
+        }
+
+
+class SoakMonitor:
+    """长时间运行时按固定时长的窗口汇总结果，运行结束后比较前期和后期窗口的漂移以及客户端内存增长
+
+    以写入器的形式接入运行器（运行器对每个结果调用write），结果再转交给逐请求记录的写入器；
+    只保留当前窗口的直方图和各窗口的摘要，内存占用不随请求数增长。
+    delay为加压阶段的时长，第一个窗口从稳态开始时算起（加压阶段的结果不会写入）。
+    """
+
+    def __init__(self, window_seconds: float, writer=None, echo: bool = True, delay: float = 0.0):
+        self.window_seconds = window_seconds
+        self.writer = writer
+        self.echo = echo
+        self.lock = threading.Lock()
+        self.start = time.perf_counter() + delay
+        self.current = SoakWindow(0)
+        self.windows: List[Dict[str, Any]] = []
+        self.initial_rss_mb = current_rss_mb()
+
+    def write(self, index: int, result: Dict[str, Any]):
+        if result.get("cancelled"):
+            return
+        error = error_class(result)
+        with self.lock:
+            self._rotate(time.perf_counter())
+            window = self.current
+            window.completed += 1
+            if error:
+                window.errors[error] = window.errors.get(error, 0) + 1
+            else:
+                window.latency.record(result["latency"])
+                window.completion_tokens += result.get("completion_tokens") or 0
+        if self.writer:
+            self.writer.write(index, result)
+
+    def close(self):
+        """结束最后一个（可能不完整的）窗口，关闭下层写入器"""
+        now = time.perf_counter()
+        with self.lock:
+            self._rotate(now)
+            elapsed = now - self.start - self.current.index * self.window_seconds
+            if self.current.completed and elapsed > 0:
+                self._finish(self.current, elapsed)
+        if self.writer:
+            self.writer.close()
+
+    def _rotate(self, now: float):
+        # 期间没有任何请求完成的窗口（例如服务中断）同样输出一行
+        while now >= self.start + (self.current.index + 1) * self.window_seconds:
+            self._finish(self.current, self.window_seconds)
+            self.current = SoakWindow(self.current.index + 1)
+
+    def _finish(self, window: SoakWindow, seconds: float):
+        summary = window.summary(seconds, current_rss_mb())
+        summary["start_offset"] = round(window.index * self.window_seconds, 1)
+        self.windows.append(summary)
+        if self.echo:
+            if len(self.windows) == 1:
+                print(window_header())
+            print(window_line(summary), flush=True)
+
+    def report(self, drift_threshold: float, missed: Optional[int] = None,
+               max_lag: Optional[float] = None) -> Dict[str, Any]:
+        """汇总各窗口，比较前后各DRIFT_FRACTION的窗口的中位数，并报告内存增长
+
+        missed为开环运行时因晚于计划时间超过max_lag秒而放弃发送的请求数，闭环运行时为None。
+        """
+        report = {
+            "window_seconds": self.window_seconds,
+            "windows": self.windows,
+            "drift": drift(self.windows, drift_threshold),
+            "memory": memory_growth(self.windows, self.initial_rss_mb),
+        }
+        if missed is not None:
+            report["missed_arrivals"] = {"count": missed, "max_lag_seconds": max_lag}
+        return report
+
+
+def median(values: List[float]) -> Optional[float]:
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    middle = len(ordered) // 2
+    return ordered[middle] if len(ordered) % 2 else (ordered[middle - 1] + ordered[middle]) / 2
+
+
+def drift(windows: List[Dict[str, Any]], threshold: float) -> List[Dict[str, Any]]:
+    """比较前期和后期窗口各指标的中位数；变差超过threshold（百分比）时标记为漂移
+
+    至少需要4个窗口；最后一个窗口可能不完整，不参与比较。
+    """
+    complete = windows[:-1] if len(windows) > 4 else windows
+    if len(complete) < 4:
+        return []
+    size = max(1, int(len(complete) * DRIFT_FRACTION))
+    early, late = complete[:size], complete[-size:]
+    rows = []
+    for name, label, higher_is_worse in DRIFT_METRICS:
+        before = median([window[name] for window in early if window[name] is not None])
+        after = median([window[name] for window in late if window[name] is not None])
+        if not before or after is None:
+            continue
+        change = (after - before) / before * 100
+        worse = change if higher_is_worse else -change
+        rows.append({"metric": name, "label": label, "early": before, "late": after,
+                     "change_percent": round(change, 1), "drift": worse > threshold})
+    return rows
+
+
+def memory_growth(windows: List[Dict[str, Any]], initial_rss_mb: float) -> Dict[str, Any]:
+    """客户端常驻内存从开始到结束的变化，以及按小时计的增长速度"""
+    samples = [window["rss_mb"] for window in windows] or [round(initial_rss_mb, 1)]
+    final = samples[-1]
+    # 第一个窗口内连接池、缓存等逐步建立，增长从第一个窗口结束时算起
+    baseline = samples[0]
+    hours = (windows[-1]["start_offset"] - windows[0]["start_offset"]) / 3600 if windows else 0.0
+    return {
+        "initial_mb": round(initial_rss_mb, 1),
+        "final_mb": final,
+        "peak_mb": max(samples),
+        "growth_mb": round(final - initial_rss_mb, 1),
+        "growth_mb_per_hour": round((final - baseline) / hours, 1) if hours > 0 else 0.0,
+        "growing": final - baseline > max(MEMORY_GROWTH_WARNING_MB, baseline * 0.1),
+    }
+
+
+def window_header() -> str:
+    return (f"{'window':>8} | {'done':>6} | {'success':>7} | {'req/s':>7} | {'out tok/s':>9} | "
+            f"{'p50':>7} | {'p95':>7} | {'p99':>7} | {'RSS MB':>7}")
+
+
+def window_line(window: Dict[str, Any]) -> str:
+    def seconds(value):
+        return f"{value:>6.3f}s" if value is not None else f"{'-':>7}"
+
+    return (f"{format_duration(window['start_offset']):>8} | {window['completed']:>6} | "
+            f"{window['success_rate']:>6.1f}% | {window['requests_per_second']:>7.2f} | "
+            f"{window['output_tokens_per_second']:>9.1f} | {seconds(window['latency_p50'])} | "
+            f"{seconds(window['latency_p95'])} | {seconds(window['latency_p99'])} | {window['rss_mb']:>7.1f}")
+
+
+def soak_lines(report: Dict[str, Any], threshold: float) -> List[str]:
+    lines = [f"Soak Windows ({format_duration(report['window_seconds'])} each):", window_header()]
+    lines.extend(window_line(window) for window in report["windows"])
+    if report["drift"]:
+        lines.append(f"Drift (median of first vs last {DRIFT_FRACTION:.0%} of windows, threshold {threshold:g}%):")
+        for row in report["drift"]:
+            flag = "DRIFT" if row["drift"] else "ok"
+            lines.append(f"  {row['label']}: {row['early']:.3f} -> {row['late']:.3f} ({row['change_percent']:+.1f}%) {flag}")
+    else:
+        lines.append("Drift: not enough windows to compare (need at least 4)")
+    memory = report["memory"]
+    lines.append(f"Client Memory (RSS): {memory['initial_mb']:.1f} MB at start, {memory['final_mb']:.1f} MB at end, "
+                 f"peak {memory['peak_mb']:.1f} MB ({memory['growth_mb_per_hour']:+.1f} MB/hour after the first window)")
+    if memory["growing"]:
+        lines.append("WARNING: client memory kept growing after the first window; the client may be leaking memory")
+    missed = report.get("missed_arrivals")
+    if missed:
+        lines.append(f"Missed Arrivals: {missed['count']} requests not sent because they were more than "
+                     f"{missed['max_lag_seconds']:g}s behind schedule (the service fell behind --rps)")
+    return lines
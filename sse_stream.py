@@ -0,0 +1,114 @@
+import time
+from typing import Dict, Any, List, Optional
+
+import json_codec
+from token_usage import THINK_START, THINK_END, token_breakdown
+
+
+class SSEStreamParser:
+    """逐行解析chat completions的SSE流，记录每个token到达的时间
+
+    同步引擎（requests）和异步引擎（aiohttp）都按行调用feed()，保证两者的统计口径一致。
+    """
+
+    def __init__(self):
+        self.content_parts: List[str] = []
+        self.token_times: List[float] = []
+        self.usage: Optional[Dict[str, Any]] = None
+        self.done = False
+        # 推理阶段跟踪：start（尚未收到内容）、think（<think>标签内）、reasoning（reasoning_content）、
+        # thought（</think>之后、回答内容之前）、answer
+        self.phase = "start"
+        self.reasoning_chars = 0
+        self.answer_chars = 0
+        self.answer_started_at: Optional[float] = None
+
+    def feed(self, line: bytes) -> bool:
+        """处理一行SSE数据，收到[DONE]时返回True
+
+        调用方应继续读完剩余数据再结束，否则连接无法归还连接池复用。
+        """
+        if self.done:
+            return True
+        line = line.strip()
+        if not line or not line.startswith(b"data:"):
+            return False
+        data = line[5:].strip()
+        if data == b"[DONE]":
+            self.done = True
+            return True
+
+        chunk = json_codec.loads(data)
+        if chunk.get("usage"):
+            self.usage = chunk["usage"]
+        for choice in chunk.get("choices") or []:
+            delta = choice.get("delta") or {}
+            # DeepSeek-R1可能把推理过程放在reasoning_content中，同样计入输出token
+            reasoning_text = delta.get("reasoning_content")
+            text = delta.get("content") or reasoning_text
+            if text:
+                now = time.perf_counter()
+                self.token_times.append(now)
+                self.content_parts.append(text)
+                if reasoning_text and not delta.get("content"):
+                    self.phase = "reasoning"
+                    self.reasoning_chars += len(text)
+                else:
+                    self._track_phase(text, now)
+        return False
+
+    def _track_phase(self, text: str, now: float):
+        """根据<think>标签区分推理过程和正式回答，记录回答开始的时间"""
+        if self.phase == "start" and text.lstrip().startswith(THINK_START):
+            self.phase = "think"
+            text = text.split(THINK_START, 1)[1]
+        if self.phase == "think":
+            if THINK_END not in text:
+                self.reasoning_chars += len(text)
+                return
+            reasoning, text = text.split(THINK_END, 1)
+            self.reasoning_chars += len(reasoning)
+            self.phase = "thought"
+        if text.strip() and self.phase != "answer":
+            if self.phase in ("thought", "reasoning"):
+                self.answer_started_at = now
+            self.phase = "answer"
+        self.answer_chars += len(text)
+
+    def result(self, start_time: float, end_time: float) -> Dict[str, Any]:
+        """根据token到达时间计算TTFT、token间延迟、末token时间和输出速度"""
+        token_times = self.token_times
+
+        # 服务端未返回usage时，按收到的内容块数估算输出token数
+        tokens = token_breakdown(self.usage, self.reasoning_chars, self.answer_chars, len(token_times))
+        completion_tokens = tokens["completion_tokens"]
+        total_tokens = self.usage.get("total_tokens") if self.usage else len(token_times)
+
+        ttft = token_times[0] - start_time if token_times else None
+        ttlt = token_times[-1] - start_time if token_times else None
+        itl = None
+        output_tokens_per_second = None
+        if len(token_times) > 1:
+            decode_time = token_times[-1] - token_times[0]
+            itl = decode_time / (len(token_times) - 1)
+            if decode_time > 0:
+                output_tokens_per_second = completion_tokens / decode_time
+
+        # 推理阶段结束、正式回答开始的时间；reasoning_time为从首token到回答开始的推理耗时
+        time_to_answer = self.answer_started_at - start_time if self.answer_started_at is not None else None
+        reasoning_time = time_to_answer - ttft if time_to_answer is not None else None
+
+        result = {
+            "success": True,
+            "content": "".join(self.content_parts),
+            "usage": total_tokens,
+            "latency": end_time - start_time,
+            "ttft": ttft,
+            "itl": itl,
+            "ttlt": ttlt,
+            "output_tokens_per_second": output_tokens_per_second,
+            "time_to_answer": time_to_answer,
+            "reasoning_time": reasoning_time
+        }
+        result.update(tokens)
+        return result
@@ -0,0 +1,108 @@
+from typing import List, Dict, Any, Callable, Optional
+
+from latency_stats import BenchmarkStats
+
+
+def parse_sweep(spec: str, sweep_by: str) -> Dict[str, Any]:
+    """解析--sweep参数
+
+    "10,50,100" 表示依次测试列表中的负载；"10:500" 表示在区间内二分查找满足SLO的最大负载。
+    """
+    cast = int if sweep_by == "parallel" else float
+    if ":" in spec:
+        low, high = (cast(part) for part in spec.split(":", 1))
+        if low <= 0 or high <= low:
+            raise ValueError(f"Invalid sweep range: {spec}")
+        return {"mode": "search", "low": low, "high": high}
+    levels = [cast(part) for part in spec.split(",") if part.strip()]
+    if not levels or min(levels) <= 0:
+        raise ValueError(f"Invalid sweep levels: {spec}")
+    return {"mode": "list", "levels": sorted(set(levels))}
+
+
+def max_level(spec: Dict[str, Any]):
+    """返回扫描中的最大负载级别"""
+    return spec["high"] if spec["mode"] == "search" else max(spec["levels"])
+
+
+def step_metrics(level, latency: float, stats: BenchmarkStats, slo: Dict[str, Any]) -> Dict[str, Any]:
+    """计算一个负载级别的吞吐量、有效吞吐量（满足延迟SLO的成功请求/秒）、错误率和延迟分布"""
+    histogram = stats.histograms["latency"]
+    error_rate = 1 - stats.successful_requests / stats.num_requests if stats.num_requests else 1.0
+    if slo["latency"] is not None:
+        good_requests = histogram.count_at_or_below(slo["latency"])
+    else:
+        good_requests = stats.successful_requests
+    percentiles = histogram.summary()
+
+    passed = error_rate <= slo["max_error_rate"]
+    if slo["latency"] is not None:
+        passed = passed and percentiles[slo["percentile"]] <= slo["latency"]
+
+    return {
+        "level": level,
+        "num_requests": stats.num_requests,
+        "throughput": stats.num_requests / latency if latency > 0 else 0.0,
+        "goodput": good_requests / latency if latency > 0 else 0.0,
+        "error_rate": error_rate,
+        "latency_percentiles": percentiles,
+        "meets_slo": passed,
+        # 响应头报告的最小限流余量（没有该响应头时为None），反映该负载级别下PTU还剩多少余量
+        "remaining_requests_min": stats.histograms["ratelimit_remaining_requests"].min,
+        "remaining_tokens_min": stats.histograms["ratelimit_remaining_tokens"].min,
+    }
+
+
+def run_sweep(spec: Dict[str, Any], run_level: Callable[[Any], Dict[str, Any]],
+              resolution: float, stopped: Callable[[], bool] = lambda: False) -> tuple:
+    """依次或二分执行各负载级别，返回(各步结果, 满足SLO的最大负载)
+
+    二分查找假设负载越高越难满足SLO；当区间宽度不超过resolution时停止。stopped()返回True时（运行被中断或到达时限）
+    不再执行后续级别，返回已测得的结果。
+    """
+    steps: List[Dict[str, Any]] = []
+
+    def measure(level):
+        metrics = run_level(level)
+        steps.append(metrics)
+        return metrics["meets_slo"]
+
+    knee: Optional[Any] = None
+    if spec["mode"] == "list":
+        for level in spec["levels"]:
+            if stopped():
+                break
+            if measure(level):
+                knee = level
+        return steps, knee
+
+    low, high = spec["low"], spec["high"]
+    if not measure(low):
+        return steps, None
+    if stopped():
+        return steps, low
+    if measure(high):
+        return steps, high
+    while high - low > resolution and not stopped():
+        middle = (low + high) // 2 if isinstance(low, int) else round((low + high) / 2, 3)
+        if middle in (low, high):
+            break
+        if measure(middle):
+            low = middle
+        else:
+            high = middle
+    return steps, low
+
+
+def format_step(metrics: Dict[str, Any], slo_percentile: str) -> str:
+    """格式化一行扫描结果"""
+    percentiles = metrics["latency_percentiles"]
+    return (f"{metrics['level']:>8} | {metrics['throughput']:>9.3f} | {metrics['goodput']:>9.3f} | "
+            f"{metrics['error_rate'] * 100:>6.2f}% | {percentiles['p50']:>7.3f}s | "
+            f"{percentiles[slo_percentile]:>7.3f}s | {percentiles['p99']:>7.3f}s | "
+            f"{'PASS' if metrics['meets_slo'] else 'FAIL'}")
+
+
+def format_header(sweep_by: str, slo_percentile: str) -> str:
+    return (f"{sweep_by:>8} | {'req/s':>9} | {'goodput':>9} | {'errors':>7} | {'p50':>8} | "
+            f"{slo_percentile:>8} | {'p99':>8} | SLO")
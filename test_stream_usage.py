@@ -0,0 +1,50 @@
+import unittest
+
+import requests
+
+from endpoint_router import Endpoint, EndpointRouter
+from self_benchmark import start_noop_server
+from sse_stream import SSEStreamParser
+
+
+class StreamUsageTest(unittest.TestCase):
+    """流式请求只有指定stream_options.include_usage时才返回usage（mock_server与Azure OpenAI行为一致）"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.process, cls.address = start_noop_server()
+        cls.endpoint = Endpoint("noop", cls.address, "noop", "2024-05-01-preview", "test")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.process.terminate()
+        cls.process.wait()
+
+    def stream(self, payload):
+        parser = SSEStreamParser()
+        with requests.post(self.endpoint.url, headers=self.endpoint.headers, json=payload, stream=True,
+                           timeout=10) as response:
+            self.assertEqual(response.status_code, 200)
+            for line in response.iter_lines():
+                parser.feed(line)
+        return parser
+
+    def test_usage_missing_without_include_usage(self):
+        parser = self.stream({"messages": [{"role": "user", "content": "hi"}], "stream": True})
+        self.assertIsNone(parser.usage)
+
+    def test_benchmark_requests_usage(self):
+        import main
+        benchmark = main.AzureAIBenchmark(stream=True, router=EndpointRouter([self.endpoint]))
+        benchmark.quiet = True
+        for question in ("hi", {"messages": [{"role": "user", "content": "hi"}]}):
+            payload = benchmark.build_payload(question)
+            self.assertEqual(payload["stream_options"], {"include_usage": True})
+            self.assertIsNotNone(self.stream(payload).usage)
+        result = benchmark.run_single_request("hi")
+        self.assertTrue(result["success"])
+        self.assertIsNotNone(result["prompt_tokens"])
+
+
+if __name__ == "__main__":
+    unittest.main()
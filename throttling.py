@@ -0,0 +1,90 @@
+import email.utils
+import random
+import threading
+import time
+from typing import Dict, Optional, Mapping
+
+# 服务端限流或暂时不可用时返回的状态码
+RETRYABLE_STATUS_CODES = (429, 500, 502, 503, 504)
+
+
+def parse_retry_after(headers: Mapping[str, str]) -> Optional[float]:
+    """解析retry-after-ms / Retry-After响应头，返回需要等待的秒数"""
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # Retry-After也可能是HTTP日期
+        parsed = email.utils.parsedate_to_datetime(value)
+        if parsed is None:
+            return None
+        return max(0.0, parsed.timestamp() - time.time())
+
+
+class RetryPolicy:
+    """指数退避+全抖动的重试策略；429/503带Retry-After时按服务端要求等待"""
+
+    def __init__(self, max_retries: int = 0, backoff_base: float = 1.0, backoff_max: float = 30.0):
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+
+    def should_retry(self, status_code: Optional[int], attempt: int) -> bool:
+        """attempt为已完成的尝试次数；status_code为None表示连接层错误"""
+        if attempt > self.max_retries:
+            return False
+        return status_code is None or status_code in RETRYABLE_STATUS_CODES
+
+    def delay(self, attempt: int, status_code: Optional[int], retry_after: Optional[float]) -> float:
+        if retry_after is not None and status_code in (429, 503):
+            return min(retry_after, self.backoff_max)
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1)))
+
+
+class TokenBucket:
+    """线程安全的令牌桶；reserve()先扣减令牌，余额不足时返回需要等待的秒数"""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.perf_counter()
+        self.lock = threading.Lock()
+
+    def reserve(self, amount: float) -> float:
+        with self.lock:
+            now = time.perf_counter()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            # 允许余额为负：后续请求需要等待这部分欠额按速率补回
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+
+class ClientRateLimiter:
+    """客户端限速：同时限制请求数/秒和token数/分钟，使压测流量保持在PTU限额之下"""
+
+    def __init__(self, requests_per_second: Optional[float] = None, tokens_per_minute: Optional[float] = None):
+        self.buckets: Dict[str, TokenBucket] = {}
+        if requests_per_second:
+            self.buckets["requests"] = TokenBucket(requests_per_second, max(1.0, requests_per_second))
+        if tokens_per_minute:
+            # 容量为一秒的token额度，避免开始时的突发流量
+            self.buckets["tokens"] = TokenBucket(tokens_per_minute / 60, tokens_per_minute / 60)
+
+    def reserve(self, tokens: int) -> float:
+        """为一个预计消耗tokens的请求预留额度，返回发送前需要等待的秒数"""
+        wait = 0.0
+        if "requests" in self.buckets:
+            wait = max(wait, self.buckets["requests"].reserve(1))
+        if "tokens" in self.buckets:
+            wait = max(wait, self.buckets["tokens"].reserve(tokens))
+        return wait
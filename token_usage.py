@@ -0,0 +1,41 @@
+from typing import Dict, Any, Optional
+
+THINK_START = "<think>"
+THINK_END = "</think>"
+
+
+def split_reasoning(content: str) -> tuple:
+    """把DeepSeek-R1的输出拆分为(推理过程, 正式回答)
+
+    推理过程包在<think>...</think>中；没有结束标签时（例如被max_tokens截断）全部视为推理过程。
+    """
+    stripped = content.lstrip()
+    if not stripped.startswith(THINK_START):
+        return "", content
+    body = stripped[len(THINK_START):]
+    if THINK_END not in body:
+        return body, ""
+    reasoning, answer = body.split(THINK_END, 1)
+    return reasoning, answer
+
+
+def token_breakdown(usage: Optional[Dict[str, Any]], reasoning_chars: int, answer_chars: int,
+                    fallback_completion_tokens: Optional[int] = None) -> Dict[str, Any]:
+    """整理提示词、输出、推理token数和命中前缀缓存的提示词token数
+
+    推理token优先使用usage.completion_tokens_details.reasoning_tokens；服务端未提供（或为0但输出中有推理过程）时，
+    按推理过程占输出字符数的比例从completion_tokens中估算。
+    """
+    usage = usage or {}
+    completion_tokens = usage.get("completion_tokens") or fallback_completion_tokens
+    details = usage.get("completion_tokens_details") or {}
+    prompt_details = usage.get("prompt_tokens_details") or {}
+    reasoning_tokens = details.get("reasoning_tokens")
+    if not reasoning_tokens and completion_tokens and reasoning_chars:
+        reasoning_tokens = round(completion_tokens * reasoning_chars / (reasoning_chars + answer_chars))
+    return {
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": completion_tokens,
+        "reasoning_tokens": reasoning_tokens or (0 if completion_tokens else None),
+        "cached_tokens": prompt_details.get("cached_tokens"),
+    }
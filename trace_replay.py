@@ -0,0 +1,37 @@
+import json
+from typing import Dict, Any, Iterator
+
+
+def read_trace(path: str) -> Iterator[Dict[str, Any]]:
+    """逐行读取trace文件，不把整个文件载入内存
+
+    每行一个请求：messages（必需）、max_tokens、temperature、offset（相对trace开始的秒数）或timestamp（Unix时间）、tag。
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            if not isinstance(record, dict) or not record.get("messages"):
+                raise ValueError(f"{path}:{line_number}: trace records need a non-empty 'messages' list")
+            yield record
+
+
+def count_trace(path: str) -> int:
+    with open(path, "r", encoding="utf-8") as f:
+        return sum(1 for line in f if line.strip())
+
+
+def trace_schedule(path: str, speed: float = 1.0) -> Iterator[tuple]:
+    """把trace转换为(序号, 请求, 计划发送时间)；speed为2时按两倍速度回放
+
+    只有timestamp时以第一条记录的时间为起点；没有时间信息的记录在有空闲并发名额时立即发送。
+    """
+    first_timestamp = None
+    for index, record in enumerate(read_trace(path)):
+        offset = record.get("offset")
+        if offset is None and record.get("timestamp") is not None:
+            if first_timestamp is None:
+                first_timestamp = record["timestamp"]
+            offset = record["timestamp"] - first_timestamp
+        yield index, record, offset / speed if offset is not None else None
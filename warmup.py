@@ -0,0 +1,160 @@
+import asyncio
+import itertools
+import math
+import threading
+import time
+from typing import List, Dict, Any, Iterator, Optional
+
+from open_loop import arrival_offsets
+from soak import parse_duration, soak_schedule
+
+
+def parse_warmup(spec: str) -> tuple:
+    """解析--warmup：纯数字为请求数，带单位（30s、2m）为时长；返回(请求数, 秒数)，未使用的一项为0"""
+    spec = spec.strip().lower()
+    if spec.isdigit():
+        if int(spec) <= 0:
+            raise ValueError(f"warm-up request count must be positive: {spec}")
+        return int(spec), 0.0
+    return 0, parse_duration(spec)
+
+
+def warmup_schedule(questions: List[Any], requests: int, seconds: float, rps: Optional[float] = None,
+                    arrival: str = "constant", seed: Optional[int] = None) -> Iterator[tuple]:
+    """预热请求的计划：循环使用问题列表，发送requests个请求或持续seconds秒；指定rps时按目标速率开环发送"""
+    if seconds:
+        return soak_schedule(questions, seconds, rps, arrival, seed)
+    cycle = itertools.islice(itertools.cycle(questions), requests)
+    offsets = arrival_offsets(rps, arrival, seed) if rps else itertools.repeat(None)
+    return ((index, question, offset) for index, (question, offset) in enumerate(zip(cycle, offsets)))
+
+
+class RampUp:
+    """正式测试开始时的加压阶段：并发数（开环时为发送速率）在seconds秒内从低到高增加到目标值
+
+    steps为0时线性增加，否则分steps级阶梯增加。加压阶段开始发送的请求不计入统计也不写入记录，
+    统计只覆盖之后的稳态阶段。
+    """
+
+    def __init__(self, seconds: float, steps: int = 0, target: int = 1, open_loop: bool = False):
+        self.seconds = seconds
+        self.steps = steps
+        self.target = max(1, target)
+        # 开环时由warp()降低加压阶段的发送速率，不限制并发数
+        self.open_loop = open_loop
+        self.start: Optional[float] = None
+        self.steady_start: Optional[float] = None
+        self.steady_started_at: Optional[float] = None
+        self.excluded = 0
+        self.lock = threading.Lock()
+
+    def begin(self, start_time: float):
+        self.start = start_time
+        self.steady_start = start_time + self.seconds
+        # 稳态开始的墙钟时间，用于与逐秒时间序列对齐
+        self.steady_started_at = time.time() + self.seconds
+
+    def measured(self, started_at: float) -> bool:
+        """started_at（请求开始或计划发送的时间）在稳态阶段时返回True，否则计为被排除的请求"""
+        if started_at >= self.steady_start:
+            return True
+        with self.lock:
+            self.excluded += 1
+        return False
+
+    def levels(self) -> List[tuple]:
+        """闭环加压的并发数变化：[(相对开始时间的秒数, 并发数)]，第一项为开始时的并发数"""
+        if self.steps:
+            return [(self.seconds * step / self.steps, max(1, math.ceil(self.target * (step + 1) / self.steps)))
+                    for step in range(self.steps)]
+        return [(self.seconds * (level - 1) / self.target, level) for level in range(1, self.target + 1)]
+
+    def hold(self, slots: threading.Semaphore):
+        """先占住超出初始并发数的名额，由后台线程按levels()逐步释放"""
+        if self.open_loop:
+            return
+        levels = self.levels()
+        for _ in range(self.target - levels[0][1]):
+            slots.acquire()
+
+        def release():
+            current = levels[0][1]
+            for offset, level in levels[1:]:
+                delay = self.start + offset - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                for _ in range(level - current):
+                    slots.release()
+                current = level
+
+        threading.Thread(target=release, daemon=True).start()
+
+    async def hold_async(self, semaphore: asyncio.Semaphore) -> Optional[asyncio.Task]:
+        """异步版本的hold，返回释放名额的任务；运行结束时由调用方取消"""
+        if self.open_loop:
+            return None
+        levels = self.levels()
+        for _ in range(self.target - levels[0][1]):
+            await semaphore.acquire()
+
+        async def release():
+            current = levels[0][1]
+            for offset, level in levels[1:]:
+                delay = self.start + offset - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                for _ in range(level - current):
+                    semaphore.release()
+                current = level
+
+        return asyncio.create_task(release())
+
+    def warp(self, offsets: Iterator[float]) -> Iterator[float]:
+        """开环加压：把按目标速率生成的计划时间映射为速率逐步增加时的计划时间
+
+        offset表示按目标速率发送时的时间，即累计的请求量；返回速率线性（或按阶梯）从低到高增加时累计到同样请求量的时间。
+        """
+        for offset in offsets:
+            yield self.ramped_offset(offset)
+
+    def ramped_offset(self, work: float) -> float:
+        if self.steps:
+            length = self.seconds / self.steps
+            for step in range(self.steps):
+                rate = (step + 1) / self.steps
+                if work <= length * rate:
+                    return step * length + work / rate
+                work -= length * rate
+            return self.seconds + work
+        # 线性加压阶段累计的请求量为seconds/2
+        if work < self.seconds / 2:
+            return math.sqrt(2 * self.seconds * work)
+        return work + self.seconds / 2
+
+    def shape(self) -> str:
+        return f"{self.steps} steps" if self.steps else "linear"
+
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "seconds": self.seconds,
+            "shape": self.shape(),
+            "steady_started_at": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.steady_started_at))
+            if self.steady_started_at else None,
+            "excluded_requests": self.excluded,
+        }
+
+
+def phase_lines(phases: Dict[str, Any]) -> List[str]:
+    """预热、加压和稳态阶段的边界"""
+    lines = []
+    warmup = phases.get("warmup")
+    if warmup:
+        lines.append(f"Warm-up: {warmup['requests']} requests in {warmup['seconds']:.1f}s "
+                     f"({warmup['successful_requests']} successful, discarded)")
+    ramp_up = phases.get("ramp_up")
+    if ramp_up:
+        lines.append(f"Ramp-up: {ramp_up['seconds']:g}s {ramp_up['shape']}, "
+                     f"{ramp_up['excluded_requests']} requests started during ramp-up excluded "
+                     f"(steady state from {ramp_up['steady_started_at']})")
+    lines.append(f"Measured Steady State: {phases['measured_seconds']:.1f}s")
+    return lines